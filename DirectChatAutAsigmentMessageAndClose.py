@@ -9,22 +9,40 @@ from selenium.common.exceptions import (
     ElementNotInteractableException,
 )
 from selenium.webdriver.common.keys import Keys
+import os
 import time
 
+import domwait
+from agentsession import restore_session, save_session, session_path
+from chatindex import ChatIndex
+from thinktime import ThinkTime
+
+# Паузы «агент думает» по шагам — распределения из thinktime.py:
+# "0", "fixed:S", "uniform:A:B", "lognormal:MEDIAN:SIGMA" (секунды).
+# Перед Send по умолчанию прежние 30 с (пока они идут — prefetch следующего чата);
+# без пауз — VIVAI_THINK_SEND=0 или VIVAI_THROUGHPUT=1
+THINK = {
+    "open":  ThinkTime.parse(os.getenv("VIVAI_THINK_OPEN", "0")),    # прочитать чат перед ответом
+    "send":  ThinkTime.parse(os.getenv("VIVAI_THINK_SEND", "fixed:30")),  # между набором текста и Send
+    "close": ThinkTime.parse(os.getenv("VIVAI_THINK_CLOSE", "0")),   # между ответом и Close
+}
+# Режим пропускной способности: паузы не делаем, печатаем закрытые чаты в минуту
+THROUGHPUT = os.getenv("VIVAI_THROUGHPUT", "0") == "1"
+REPORT_EVERY = 10          # в режиме пропускной способности — промежуточный темп каждые N чатов
+PREFETCH_LEAD_S = 0.3      # за сколько до конца паузы перечитать список (prefetch)
+
+# Переиспользовать сохранённую после логина сессию (как в OpenAgentSide); 0 — всегда логиниться заново
+REUSE_SESSION = os.getenv("VIVAI_REUSE_SESSION", "1") != "0"
+
+LOGIN_URL = "https://gpt3.uat.vivai.ai/auth/login?returnUrl=%2Fdashboard"
+AVATAR_LOC = (By.XPATH, "//app-agent-avatar//span[contains(@class,'p-avatar-text')]")
+
 
 # ---------- helpers ----------
 
 def wait_toasts_gone(driver, timeout=6):
     """Ждём исчезновения любых тост-уведомлений."""
-    try:
-        WebDriverWait(driver, timeout).until(
-            EC.invisibility_of_element_located(
-
-                (By.CSS_SELECTOR, "p-toast, .p-toast, .toast-title, .p-toast-message")
-            )
-        )
-    except TimeoutException:
-        pass
+    domwait.toasts_gone(driver, "p-toast, .p-toast, .toast-title, .p-toast-message", timeout=timeout)
 
 
 def quick_present(driver, locator, timeout=1.5):
@@ -101,58 +119,66 @@ def select_yes_in_modal(driver):
     ))
 
 
-# ---------- NEW: работа с «закрытыми» чатами ----------
+# ---------- think time ----------
 
-def is_closed_chat(chat_el) -> bool:
+def think(driver, index: ChatIndex, step: str, current: str, stats: dict) -> None:
     """
-    Чат считается закрытым, если на контейнере есть класс closed-item или closed-item-light.
+    Пауза шага step. В конце паузы перечитываем список (prefetch) — следующий
+    чат уже найден, включая пришедшие за время паузы, и после закрытия
+    текущего его можно открыть сразу.
     """
-    cl = (chat_el.get_attribute("class") or "")
-    return ("closed-item" in cl) or ("closed-item-light" in cl)
+    pause = 0.0 if THROUGHPUT else THINK[step].sample()
+    if pause <= 0:
+        return
+    deadline = time.monotonic() + pause
+    time.sleep(max(0.0, deadline - PREFETCH_LEAD_S - time.monotonic()))
+    index.prefetch(driver, current)
+    time.sleep(max(0.0, deadline - time.monotonic()))
+    stats["think_s"] = stats.get("think_s", 0.0) + pause
 
 
-def remove_closed_chip(chat_el, driver):
+# ---------- выбор чата (индекс по id, см. chatindex.py) ----------
+
+def open_next_chat(driver, index: ChatIndex):
     """
-    У «закрытых» чатов слева есть крестик. Попробуем кликнуть по нему, чтобы убрать запись из списка.
+    Кликнуть первый открытый необработанный чат. Если открытых нет — убрать
+    крестиком все закрытые (одним вызовом) и перечитать список.
+    Возвращает (id, элемент) или (None, None).
     """
-    try:
-        btn = chat_el.find_element(By.CSS_SELECTOR, ".close-icon i.pi-times")
-        driver.execute_script("arguments[0].scrollIntoView({block:'center'});", btn)
-        btn.click()
-        return True
-    except Exception:
-        return False
+    # заранее перечитанная очередь годится, только если в ней что-то есть
+    if not index.prefetched or index.next_open()[0] is None:
+        index.refresh(driver)
+    index.prefetched = False
+    for _ in range(3):
+        chat_id, el = index.next_open()
+        if chat_id is None:
+            if not index.remove_closed(driver):
+                return None, None
+            domwait.dom_quiet(driver, index.xpath, quiet_ms=150, timeout=2)
+            index.refresh(driver)
+            chat_id, el = index.next_open()
+            if chat_id is None:
+                return None, None  # нечего обрабатывать
+        try:
+            driver.execute_script("arguments[0].scrollIntoView({block:'center'});", el)
+            try:
+                el.click()
+            except ElementClickInterceptedException:
+                driver.execute_script("arguments[0].click();", el)
+            return chat_id, el
+        except StaleElementReferenceException:
+            index.refresh(driver)   # список перестроился — берём свежие элементы
+    return None, None
 
 
 # ---------- core ----------
 
-def process_one_chat(driver, wait, chats_xpath) -> bool:
+def process_one_chat(driver, wait, index: ChatIndex, stats: dict) -> bool:
     """Обрабатывает один чат из списка Ongoing — самый первый НЕ закрытый."""
-    all_items = driver.find_elements(By.XPATH, chats_xpath)
-    if not all_items:
+    chat_id, first = open_next_chat(driver, index)
+    if chat_id is None:
         return False
 
-    # оставляем только незакрытые
-    open_items = [el for el in all_items if not is_closed_chat(el)]
-
-    # если все видимые — закрытые: попробуем их убрать крестиком и обновить список
-    if not open_items:
-        removed = False
-        for el in all_items:
-            removed = remove_closed_chip(el, driver) or removed
-        # после очистки перечитаем список
-        all_items = driver.find_elements(By.XPATH, chats_xpath)
-        open_items = [el for el in all_items if not is_closed_chat(el)]
-        if not open_items:
-            return False  # нечего обрабатывать
-
-    first = open_items[0]
-    driver.execute_script("arguments[0].scrollIntoView({block:'center'});", first)
-    try:
-        first.click()
-    except ElementClickInterceptedException:
-        driver.execute_script("arguments[0].click();", first)
-
     # Assign to me (если есть)
     try:
         assign_btn = WebDriverWait(driver, 2).until(
@@ -168,19 +194,22 @@ def process_one_chat(driver, wait, chats_xpath) -> bool:
     # Отправка сообщения
     textarea = wait.until(EC.presence_of_element_located((By.CSS_SELECTOR, "textarea.form-control")))
     wait.until(lambda d: textarea.is_enabled() and (textarea.get_attribute("readonly") in (None, "", "false")))
+    think(driver, index, "open", chat_id, stats)
     driver.execute_script("arguments[0].scrollIntoView({block:'center'});", textarea)
     textarea.click()
     textarea.send_keys(Keys.CONTROL, "a")
     textarea.send_keys(Keys.BACKSPACE)
     textarea.send_keys("Тестовое сообщение")
-    time.sleep(30)
+    think(driver, index, "send", chat_id, stats)
     send_btn = wait.until(EC.element_to_be_clickable((By.XPATH, "//span[normalize-space()='Send']")))
     try:
         send_btn.click()
     except ElementClickInterceptedException:
         driver.execute_script("arguments[0].click();", send_btn)
 
-    time.sleep(0.3)
+    # поле очистилось — приложение приняло сообщение
+    domwait.value_cleared(driver, textarea, timeout=5)
+    think(driver, index, "close", chat_id, stats)
 
     # Закрыть чат
     close_btn = wait.until(EC.element_to_be_clickable((By.XPATH, "//span[normalize-space()='Close']")))
@@ -212,14 +241,12 @@ def process_one_chat(driver, wait, chats_xpath) -> bool:
     except TimeoutException:
         pass
 
-    # Ждём, что в верху списка появился другой элемент (тот закрыли/исчез)
-    try:
-        WebDriverWait(driver, 6).until(
-            lambda d: not d.find_elements(By.XPATH, chats_xpath) or d.find_elements(By.XPATH, chats_xpath)[0] is not first
-        )
-    except TimeoutException:
-        pass
+    # Ждём, что в верху списка появился другой элемент (тот закрыли/исчез).
+    # Сравниваем DOM-узлы в браузере: WebElement-ы из разных find_elements в Python
+    # никогда не «is», так что прежняя проверка проходила сразу.
+    domwait.list_changed(driver, index.xpath, first, timeout=6)
 
+    index.mark_processed(chat_id)
     return True
 
 
@@ -237,27 +264,33 @@ def test_login():
     )
 
     try:
-        print("1) Логин…")
-        driver.get("https://gpt3.uat.vivai.ai/auth/login?returnUrl=%2Fdashboard")
-
         username = os.getenv("VIVAI_USER", "")
         password = os.getenv("VIVAI_PASS", "")
-        if not username or not password:
-            raise RuntimeError("Нет логина/пароля в переменных окружения VIVAI_USER / VIVAI_PASS")
+        saved = session_path(username or "anonymous")
+
+        if REUSE_SESSION and restore_session(driver, saved, AVATAR_LOC):
+            print("1-2) Сессия восстановлена — сразу в Direct")
+        else:
+            print("1) Логин…")
+            driver.get(LOGIN_URL)
 
-        wait.until(EC.presence_of_element_located((By.NAME, "username"))).send_keys(username)
-        wait.until(EC.presence_of_element_located((By.NAME, "password"))).send_keys(password)
-        wait.until(EC.element_to_be_clickable((By.ID, "kt_sign_in_submit"))).click()
+            if not username or not password:
+                raise RuntimeError("Нет логина/пароля в переменных окружения VIVAI_USER / VIVAI_PASS")
 
-        print("2) Chats → Direct…")
-        wait.until(EC.element_to_be_clickable((By.XPATH, "//span[@title='Chats']"))).click()
-        wait.until(EC.element_to_be_clickable((By.XPATH, "//span[@title='Direct']"))).click()
-        time.sleep(0.3)
+            wait.until(EC.presence_of_element_located((By.NAME, "username"))).send_keys(username)
+            wait.until(EC.presence_of_element_located((By.NAME, "password"))).send_keys(password)
+            wait.until(EC.element_to_be_clickable((By.ID, "kt_sign_in_submit"))).click()
+
+            print("2) Chats → Direct…")
+            wait.until(EC.element_to_be_clickable((By.XPATH, "//span[@title='Chats']"))).click()
+            wait.until(EC.element_to_be_clickable((By.XPATH, "//span[@title='Direct']"))).click()
+            if REUSE_SESSION:
+                wait.until(EC.presence_of_element_located(AVATAR_LOC))   # Direct отрисован — URL уже его
+                save_session(driver, saved)
 
         print("3) Открываю меню аватара…")
         wait_toasts_gone(driver, timeout=6)
-        avatar_loc = (By.XPATH, "//app-agent-avatar//span[contains(@class,'p-avatar-text')]")
-        avatar = wait.until(EC.element_to_be_clickable(avatar_loc))
+        avatar = wait.until(EC.element_to_be_clickable(AVATAR_LOC))
         driver.execute_script("arguments[0].scrollIntoView({block:'center'});", avatar)
         avatar.click()
 
@@ -272,29 +305,24 @@ def test_login():
         driver.execute_script("document.body.click();")
 
         print("5) Обрабатываю чаты…")
+        index = ChatIndex(ONGOING_CHATS_XPATH)
+        stats = {"think_s": 0.0}
         processed = 0
-        while True:
-            # есть ли вообще элементы в колонке
-            any_items = driver.find_elements(By.XPATH, ONGOING_CHATS_XPATH)
-            if not any_items:
-                break
-
-            ok = process_one_chat(driver, wait, ONGOING_CHATS_XPATH)
-            if not ok:
-                # возможно остались только закрытые — попробуем убрать их крестиком и проверим ещё раз
-                removed = False
-                for el in driver.find_elements(By.XPATH, ONGOING_CHATS_XPATH):
-                    if is_closed_chat(el):
-                        removed = remove_closed_chip(el, driver) or removed
-                if not removed:
-                    break  # обрабатывать нечего
-                else:
-                    continue
-
+        started = time.monotonic()
+        # process_one_chat сам убирает закрытые, когда открытых не осталось
+        while process_one_chat(driver, wait, index, stats):
             processed += 1
             print(f"   Готово для {processed} чата(ов).")
-
-        print("Все чаты обработаны. ✅")
+            if THROUGHPUT and processed % REPORT_EVERY == 0:
+                print(f"   Темп: {processed / (time.monotonic() - started) * 60:.1f} chats/min")
+
+        elapsed = time.monotonic() - started
+        print(f"Все чаты обработаны. ✅ ({index.summary()})")
+        if processed:
+            print(f"Закрыто {processed} чатов за {elapsed:.1f} с: {processed / elapsed * 60:.1f} chats/min"
+                  f" (think time: {stats['think_s']:.1f} с"
+                  + (", режим пропускной способности" if THROUGHPUT else
+                     ", " + ", ".join(f"{k}={v.spec}" for k, v in THINK.items())) + ")")
 
     finally:
         driver.quit()
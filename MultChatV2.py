@@ -1,24 +1,74 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+import argparse
+import os
+import threading
 import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit
 
-def start_chat(index):
-    options = webdriver.ChromeOptions()
-    options.add_argument("--incognito")
+from checkpoint import Checkpoint
+from driverfactory import HEADLESS, DriverFactory
+from resultsink import ResultSink, StepLog
 
-    driver = webdriver.Chrome(options=options)
+# ====================== НАСТРОЙКИ ======================
+WIDGET_URL = "https://ww-host.test.vivai.ai/74f5097d-e80c-4493-b989-91b57d592106"
+TOTAL_CHATS = 20000
+WORKERS = 8              # сколько Chrome держим открытыми одновременно (по потоку на каждый)
+RELAUNCH_EVERY = 200     # полный перезапуск драйвера раз в K чатов (и всегда после ошибки)
+RETRIES = 2              # сколько раз перезапускать упавший чат (пачкой в конце прогона)
+STATE_FILE = Path("multchat.state")   # чекпоинт: пройденные/упавшие индексы
+LAUNCH_BACKOFF_S = 2.0   # пауза после неудачного запуска Chrome (растёт с каждым подряд, до 30 с)
+
+# Куда писать по JSON-записи на чат, напр. RESULTS_JSONL=results_multchat.jsonl (пусто — не писать)
+RESULTS_JSONL = os.getenv("RESULTS_JSONL", "")
+
+# Что чистим между чатами через CDP (для страницы и iframe виджета)
+CLEAR_STORAGE_TYPES = "cookies,local_storage,session_storage,indexeddb,websql,service_workers,cache_storage"
+
+FRAME_ORIGINS_JS = """
+return [location.origin].concat(
+    Array.from(document.querySelectorAll('iframe'))
+         .map(f => { try { return new URL(f.src).origin; } catch (e) { return null; } })
+         .filter(Boolean));
+"""
+
+def reset_driver(driver) -> None:
+    """
+    Вернуть браузер в состояние «новый посетитель» без перезапуска:
+    cookies и хранилища всех origin страницы и виджета, затем about:blank.
+    """
+    driver.switch_to.default_content()
+    origins = {urlsplit(WIDGET_URL)._replace(path="", query="", fragment="").geturl()}
+    try:
+        origins.update(o for o in driver.execute_script(FRAME_ORIGINS_JS) if o != "null")
+    except Exception:
+        pass  # страница могла не загрузиться — чистим хотя бы origin виджета
+    for origin in origins:
+        driver.execute_cdp_cmd("Storage.clearDataForOrigin",
+                               {"origin": origin, "storageTypes": CLEAR_STORAGE_TYPES})
+    driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+    driver.get("about:blank")
+
+def start_chat(driver, index, sink=None) -> Optional[str]:
+    """None при успехе, иначе имя класса ошибки."""
+    started = time.time()
+    steps = StepLog()
     wait = WebDriverWait(driver, 10)
+    outcome, error = "error", None
 
     try:
-        driver.get("https://ww-host.test.vivai.ai/74f5097d-e80c-4493-b989-91b57d592106")
-        driver.set_window_size(1550, 838)
+        t = time.perf_counter()
+        driver.get(WIDGET_URL)
 
         # Переключение в iframe
         wait.until(EC.frame_to_be_available_and_switch_to_it((By.CSS_SELECTOR, "iframe")))
+        steps.record("open", time.perf_counter() - t)
 
         # Клик по иконке
+        t = time.perf_counter()
         wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, ".key-1qn0tbk"))).click()
 
         # Ввод userId
@@ -27,24 +77,157 @@ def start_chat(index):
 
         # Клик по Start chat
         wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, ".key-t91e19"))).click()
+        steps.record("start", time.perf_counter() - t)
 
         # Ввод сообщения
+        t = time.perf_counter()
         message_input = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, ".key-jml02v")))
         message_input.send_keys(f"Test {index}")
 
         # Нажатие на кнопку отправки (второй svg)
         wait.until(lambda d: len(d.find_elements(By.CSS_SELECTOR, "svg.key-b44e5x")) > 1)
         driver.find_elements(By.CSS_SELECTOR, "svg.key-b44e5x")[1].click()
+        steps.record("send", time.perf_counter() - t)
+        steps.messages = 1
+        outcome = "ok"
 
         print(f"[{index}] Успешно отправлено")
-
-
+        return None
 
     except Exception as e:
+        error = type(e).__name__
         print(f"[{index}] Ошибка: {e}")
+        return error
+    finally:
+        if sink:
+            sink.session(index, started, time.time(), steps=steps.steps,
+                         messages=steps.messages, outcome=outcome, error=error)
+
+# ==================== ПУЛ ДРАЙВЕРОВ ====================
+
+class Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.success = 0
+        self.errors = 0
+        self.launches = 0
+
+    def bump(self, name: str) -> None:
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+def worker(indices, lock: threading.Lock, opts, counters: Counters, factory: DriverFactory,
+           checkpoint: Checkpoint, sink) -> None:
+    """Один поток — один долгоживущий Chrome; чаты берём из общего итератора."""
+    driver, uses, launch_failures = None, 0, 0
+    try:
+        while True:
+            with lock:
+                index = next(indices, None)
+            if index is None:
+                return
+            if driver is None:
+                try:
+                    driver, uses = factory.new_driver(), 0
+                    counters.bump("launches")
+                    launch_failures = 0
+                except Exception as e:
+                    # индекс уже взят из общего итератора — отметить упавшим (повторится
+                    # через --retries/--resume), а поток не терять
+                    launch_failures += 1
+                    print(f"[{index}] Chrome не запустился: {type(e).__name__}: {e}")
+                    checkpoint.mark(index, False, f"Launch{type(e).__name__}")
+                    counters.bump("errors")
+                    time.sleep(min(30.0, LAUNCH_BACKOFF_S * launch_failures))
+                    continue
+
+            error = start_chat(driver, index, sink)
+            ok = error is None
+            checkpoint.mark(index, ok, error)
+            counters.bump("success" if ok else "errors")
+            uses += 1
+
+            if ok and uses < opts.relaunch_every:
+                try:
+                    reset_driver(driver)
+                    continue
+                except Exception as e:
+                    print(f"[{index}] Не удалось сбросить драйвер, перезапускаю: {e}")
+            _quit_quietly(driver)
+            driver = None
     finally:
+        if driver is not None:
+            _quit_quietly(driver)
+
+def _quit_quietly(driver) -> None:
+    try:
         driver.quit()
+    except Exception as e:
+        print(f"Chrome не закрылся: {type(e).__name__}: {e}")
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Много чатов виджета через пул переиспользуемых Chrome")
+    ap.add_argument("--total", type=int, default=TOTAL_CHATS)
+    ap.add_argument("--start", type=int, default=0, help="номер первого чата (Test N)")
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    ap.add_argument("--relaunch-every", type=int, default=RELAUNCH_EVERY,
+                    help="перезапускать Chrome после стольких чатов")
+    ap.add_argument("--state", type=Path, default=STATE_FILE, help="файл чекпоинта")
+    ap.add_argument("--resume", action="store_true",
+                    help="продолжить по файлу чекпоинта: пропустить пройденные, повторить упавшие")
+    ap.add_argument("--retries", type=int, default=RETRIES,
+                    help="сколько раз повторять упавший чат (повторы идут пачкой после основного прохода)")
+    ap.add_argument("--headed", action="store_true", help="показывать окна Chrome")
+    ap.add_argument("--no-images", action="store_true", help="не грузить картинки")
+    return ap.parse_args(argv)
+
+def run_pool(indices: list, opts, counters: Counters, factory: DriverFactory,
+             checkpoint: Checkpoint, sink) -> None:
+    it, lock = iter(indices), threading.Lock()
+    threads = [threading.Thread(target=worker, args=(it, lock, opts, counters, factory, checkpoint, sink),
+                                name=f"chrome-{n + 1}", daemon=True)
+               for n in range(max(1, min(opts.workers, len(indices))))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+def main():
+    opts = parse_args()
+    all_indices = range(opts.start, opts.start + opts.total)
+    checkpoint = Checkpoint(opts.state, resume=opts.resume)
+    counters = Counters()
+    sink = ResultSink(Path(RESULTS_JSONL), engine="selenium-widget") if RESULTS_JSONL else None
+    factory = DriverFactory(headless=HEADLESS and not opts.headed, images=not opts.no_images)
+    started = time.perf_counter()
+    try:
+        todo = checkpoint.fresh(all_indices)
+        if opts.resume:
+            print(f"Resume: пройдено {len(checkpoint.done)}, падали {len(checkpoint.failures)}, "
+                  f"новых {len(todo)}")
+        if todo:
+            run_pool(todo, opts, counters, factory, checkpoint, sink)
+        # упавшие — пачкой в конце, пока не кончится бюджет повторов
+        while True:
+            retry = checkpoint.retryable(all_indices, opts.retries)
+            if not retry:
+                break
+            print(f"Повтор упавших: {len(retry)}")
+            run_pool(retry, opts, counters, factory, checkpoint, sink)
+    finally:
+        factory.close()
+        checkpoint.close()
+        if sink:
+            sink.close()
+    elapsed = time.perf_counter() - started
+    done = counters.success + counters.errors
+    given_up = sum(1 for i in all_indices if i in checkpoint.failures and i not in checkpoint.done)
+    print(f"\nDone. Success: {counters.success}/{done}, errors: {counters.errors}")
+    print(f"Пройдено всего: {sum(1 for i in all_indices if i in checkpoint.done)}/{opts.total}, "
+          f"не прошли после {opts.retries} повторов: {given_up} (чекпоинт: {opts.state})")
+    print(f"Chrome launches: {counters.launches}")
+    print(factory.report())
+    print(f"Rate: {done / elapsed * 60:.1f} chats/min за {elapsed:.1f} с")
 
-# Запуск чатов с Test 1 по Test 10
-for i in range(0, 20000):
-    start_chat(i)
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,80 @@
 # ===== Импорты =====
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.keys import Keys
 from selenium.common.exceptions import TimeoutException, InvalidElementStateException
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
 import os, time, random, json
 import time
+from pathlib import Path
+
+from agentsession import restore_session, save_session, session_path
+from cdpstream import CdpTokenStream
+from chatindex import CARD_KEY_FN, FALLBACK_KEY_PREFIX, note_card_key
+import domwait
+from driverfactory import DriverFactory
+from latency import StageStats
+from locators import LocatorSet
+from resultsink import ResultSink, StepLog
+
+# Переиспользовать сохранённую после логина сессию (cookies + localStorage, см. agentsession.py)
+REUSE_SESSION = os.getenv("VIVAI_REUSE_SESSION", "1") != "0"
+
+# Куда писать по JSON-записи на обработанный чат, напр. RESULTS_JSONL=results_agent.jsonl (пусто — не писать)
+RESULTS_JSONL = os.getenv("RESULTS_JSONL", "")
+
+# Перцентили фаз обработки чата (см. PHASES) — в JSON/CSV в конце прогона (пусто — не писать)
+# (напр. AGENT_PHASES_JSON=agent_phases.json)
+PHASES_JSON = os.getenv("AGENT_PHASES_JSON", "")
+PHASES_CSV = os.getenv("AGENT_PHASES_CSV", "")
 
 # ===== Параметры «серых» карточек (настройка) =====
 GREY_WAIT_TIMEOUT   = 4.0   # сколько ждать, что текущая карточка посереет после закрытия
-GREY_EXTRA_PAUSE    = 0.7   # дополнительная пауза стабилизации, если карточка таки посерела
-TOP_CARD_RECHECK_PAUSE = 0.6  # пауза перед проверкой первой карточки в списке
+GREY_EXTRA_PAUSE    = 0.7   # максимум ждать, пока список «успокоится» после поседения карточки
+TOP_CARD_RECHECK_PAUSE = 0.6  # максимум ждать изменения списка перед повторной проверкой первой карточки
+LIST_QUIET_MS       = 150   # «успокоился» = столько мс без мутаций DOM (domwait.dom_quiet)
+
+# ===== Конвейерная отправка сообщений =====
+PIPELINE = True              # слать подряд, не дожидаясь подтверждения каждого (нужен USE_CDP_STREAM)
+PIPELINE_WINDOW = 4          # сколько неподтверждённых сообщений может быть «в полёте»
+CONFIRM_TIMEOUT = 60         # сколько ждать подтверждения отправленного сообщения
+RETRY_CONFIRM_TIMEOUT = 10   # ... и повторно отправленного
+PIPELINE_RETRIES = 1         # сколько раз переотправлять сообщение, не дождавшееся подтверждения
 
 # ===== Константы (локаторы) =====
 # карточки чатов в колонке
 ONGOING_CHATS_XPATH = "//app-chat-item/div[contains(@class,'chat-item')]"
 
+# Альтернативные локаторы — LocatorSet (locators.py): первым пробуется тот,
+# что сработал последним; *_LOC — все кандидаты одним XPath (для fastagent и «исчезло»)
+
 # поле ввода: textarea или contenteditable с плейсхолдером
-INPUT_LOC = (By.XPATH,
-    "//textarea[@placeholder='Type a message']"
-    " | //div[@contenteditable='true' and (@placeholder='Type a message' or @data-placeholder='Type a message')]"
-)
+INPUT = LocatorSet("input", [
+    (By.XPATH, "//textarea[@placeholder='Type a message']"),
+    (By.XPATH, "//div[@contenteditable='true' and (@placeholder='Type a message' or @data-placeholder='Type a message')]"),
+])
+INPUT_LOC = INPUT.union()
 
 # твои кнопки
 SEND_SPAN_LOC  = (By.XPATH, "//span[normalize-space()='Send']")
 CLOSE_SPAN_LOC = (By.XPATH, "//span[normalize-space()='Close']")
 
+# модалка закрытия: Yes/No, Submit и OK (SweetAlert)
+YES_BOX = LocatorSet("yes", [
+    (By.XPATH, "//p-checkbox[./label[normalize-space()='Yes']]//div[contains(@class,'p-checkbox-box')]"),
+    (By.XPATH, "//label[normalize-space()='Yes']/preceding::p-checkbox[1]//div[contains(@class,'p-checkbox-box')]"),
+])
+NO_BOX = LocatorSet("no", [
+    (By.XPATH, "//p-checkbox[./label[normalize-space()='No']]//div[contains(@class,'p-checkbox-box')]"),
+    (By.XPATH, "//label[normalize-space()='No']/preceding::p-checkbox[1]//div[contains(@class,'p-checkbox-box')]"),
+])
+SUBMIT_BTN = LocatorSet("submit", [(By.XPATH, "//span[normalize-space()='Submit']")])
+OK_BTN     = LocatorSet("ok", [(By.XPATH, "//button[normalize-space()='OK']")])
+YES_BOX_LOC    = YES_BOX.union()
+NO_BOX_LOC     = NO_BOX.union()
+SUBMIT_BTN_LOC = SUBMIT_BTN.union()
+OK_BTN_LOC     = OK_BTN.union()
+
 # ===== Утилиты =====
 def _visible(driver, locator):
     try:
@@ -47,13 +93,12 @@ def quick_present(driver, locator, timeout=2):
     except TimeoutException:
         return False
 
+TOAST_CSS = "[class*='toast']"
+TOAST_APPEAR_S = 0.5    # тост после закрытия появляется с задержкой — сперва коротко ждём его
+
 def wait_toasts_gone(driver, timeout=6):
-    toast = (By.XPATH, "//*[contains(@class,'toast') or contains(@class,'p-toast')]")
-    try:
-        WebDriverWait(driver, 0.5).until(EC.presence_of_element_located(toast))
-        WebDriverWait(driver, timeout).until(EC.invisibility_of_element_located(toast))
-    except TimeoutException:
-        pass
+    domwait.wait_until(driver, "return !!document.querySelector(args[0]);", TOAST_CSS, timeout=TOAST_APPEAR_S)
+    domwait.toasts_gone(driver, TOAST_CSS, timeout=timeout)
 
 def _button_from_span(driver, span_loc):
     """Вернуть <button>, ближайший к указанному span (Send/Close)."""
@@ -62,7 +107,7 @@ def _button_from_span(driver, span_loc):
         return span.find_element(By.XPATH, "ancestor::button[1]")
     except Exception:
         return span.find_element(By.XPATH, "ancestor::*[contains(@class,'p-button')][1]")
-# --- альтернативные локаторы для кнопки отправки ---
+# --- альтернативные локаторы для кнопки отправки (от точных к общим) ---
 SEND_BUTTON_CANDIDATES = [
     (By.XPATH, "//span[normalize-space()='Send']/ancestor::button[1]"),
     (By.XPATH, "//button[@type='submit' and .//span[normalize-space()='Send']]"),
@@ -70,37 +115,22 @@ SEND_BUTTON_CANDIDATES = [
     (By.XPATH, "//button[.//*[contains(@class,'pi-send') or contains(@class,'icon-send')]]"),
 ]
 
+# уровни: по тексту Send — точнее иконки, «любой submit» — всегда последним;
+# как последний шанс — старый путь через span
+SEND_BUTTON_TIERS = [0, 0, 2, 1]
+SEND_BTN = LocatorSet("send", SEND_BUTTON_CANDIDATES, tiers=SEND_BUTTON_TIERS,
+                      fallback=lambda driver: _button_from_span(driver, SEND_SPAN_LOC))
+
+# все наборы — для отчёта попаданий/промахов в конце прогона
+LOCATOR_SETS = (SEND_BTN, INPUT, YES_BOX, NO_BOX, SUBMIT_BTN, OK_BTN)
+
 def _find_send_button(driver):
-    """Вернуть первый подходящий видимый/включённый <button> Send по кандидатам."""
-    for loc in SEND_BUTTON_CANDIDATES:
-        try:
-            btn = driver.find_element(*loc)
-            if btn.is_displayed():
-                return btn
-        except Exception:
-            continue
-    # как последний шанс — старый путь через span
-    try:
-        return _button_from_span(driver, SEND_SPAN_LOC)
-    except Exception:
-        return None
+    """Вернуть видимый <button> Send: сначала кандидат, сработавший в прошлый раз."""
+    return SEND_BTN.find(driver)
 
-def _wait_send_enabled(driver, timeout=4.0, period=0.2) -> bool:
-    """Пуллинг: находим кнопку каждый раз заново и проверяем enabled."""
-    end = time.time() + timeout
-    while time.time() < end:
-        btn = _find_send_button(driver)
-        if btn:
-            try:
-                cls  = (btn.get_attribute("class") or "").lower()
-                aria = (btn.get_attribute("aria-disabled") or "").lower()
-                hard = btn.get_attribute("disabled") is not None
-                if not (hard or "p-disabled" in cls or "p-button-loading" in cls or aria == "true"):
-                    return True
-            except Exception:
-                pass
-        time.sleep(period)
-    return False
+def _wait_send_enabled(driver, timeout=4.0) -> bool:
+    """Первая видимая кнопка Send из кандидатов включена — ждём на MutationObserver."""
+    return domwait.send_enabled(driver, SEND_BTN.xpaths(), timeout=timeout)
 
 def _try_press_enter_to_send(field) -> None:
     """Отправка по Enter — если UI это поддерживает."""
@@ -133,39 +163,59 @@ def _set_text_and_fire_input(driver, field, text: str):
         el.dispatchEvent(new KeyboardEvent('keyup', {bubbles:true, key:'a'}));
     """, field, text)
 
-# ===== Драйвер с включёнными performance-логами/CDP =====
+# ===== Драйвер с потоком CDP-событий (или performance-логами) =====
+# True — подтверждения из потока CDP-событий (cdpstream.py);
+# False — старый опрос get_log("performance") (тогда логи включаются в драйвере)
+USE_CDP_STREAM = True
+
+# одна фабрика (и один chromedriver) на процесс
+DRIVERS = DriverFactory(perf_logs=not USE_CDP_STREAM)
+
 def make_driver():
-    options = Options()
-    options.add_argument("--incognito")
+    driver = DRIVERS.new_driver()
+    driver.set_window_size(1550, 838)
 
-    # включаем performance-логи и browser-логи
-    options.set_capability("goog:loggingPrefs", {
-        "performance": "ALL",
-        "browser": "ALL"
-    })
+    _count_round_trips(driver)
+    driver.token_stream = None
+    if USE_CDP_STREAM:
+        driver.token_stream = CdpTokenStream.attach(driver)
+        if driver.token_stream is None:
+            driver.quit()
+            raise RuntimeError("DevTools вкладки недоступен — поставьте USE_CDP_STREAM = False")
+    else:
+        # включаем CDP-сеть (для чтения тел XHR)
+        try:
+            driver.execute_cdp_cmd("Network.enable", {})
+        except Exception:
+            pass
+    return driver
 
-    driver = webdriver.Chrome(service=Service(), options=options)
+def _count_round_trips(driver):
+    """Каждый driver.execute — один HTTP-запрос к chromedriver; считаем их в driver.round_trips."""
+    driver.round_trips = 0
+    execute = driver.execute
 
-    # включаем CDP-сеть (для чтения тел XHR)
-    try:
-        driver.execute_cdp_cmd("Network.enable", {})
-    except Exception:
-        pass
+    def counted(driver_command, params=None):
+        driver.round_trips += 1
+        return execute(driver_command, params)
 
-    driver.set_window_size(1550, 838)
-    return driver
+    driver.execute = counted
 
-def _clear_perf_logs(driver):
-    try:
-        _ = driver.get_log("performance")
-    except Exception:
-        pass
+def quit_driver(driver):
+    if getattr(driver, "token_stream", None) is not None:
+        driver.token_stream.close()
+    driver.quit()
 
 def _find_ws_or_xhr_with_token(driver, token: str, timeout: int = 60) -> bool:
     """
     Ждём появления токена в WebSocket кадрах или теле XHR-ответа.
     Возвращает True/False.
     """
+    stream = getattr(driver, "token_stream", None)
+    if stream is not None:
+        # токены копятся с момента подключения — ничего не теряется между отправкой и ожиданием
+        return stream.wait_for(token, timeout)
+
     end = time.time() + timeout
     while time.time() < end:
         try:
@@ -233,103 +283,170 @@ def _is_selected(card) -> bool:
     except Exception:
         return False
 
-def _wait_card_turns_grey(card, timeout=GREY_WAIT_TIMEOUT) -> bool:
-    """Ждём, что переданная карточка станет серой (после закрытия)."""
-    end = time.time() + timeout
-    while time.time() < end:
-        try:
-            if _card_is_grey(card):
-                return True
-        except Exception:
-            # карточку могли пересоздать — считаем, что обновилась/исчезла
-            return True
-        time.sleep(0.2)
-    return False
+def _wait_card_turns_grey(driver, card, timeout=GREY_WAIT_TIMEOUT) -> bool:
+    """Ждём, что переданная карточка станет серой (или её пересоздадут) после закрытия."""
+    return domwait.card_turns_grey(driver, card, timeout=timeout)
 # ===== <<< добавлено для серых карточек =====
 
 # ===== Отправка сообщений (подтверждение по сетевому событию) =====
-def send_messages(driver, wait, count: int) -> int:
+def _type_and_send(driver, wait, msg: str):
+    """Ввести текст в поле и нажать Send (или Enter). Возвращает поле ввода."""
+    # поле ввода
+    INPUT.until(wait, EC.presence_of_element_located)
+    field = INPUT.until(wait, EC.element_to_be_clickable)
+    driver.execute_script("arguments[0].scrollIntoView({block:'nearest'});", field)
+    driver.execute_script("arguments[0].click();", field)
+
+    # очистка + ввод
+    try:
+        field.send_keys(Keys.CONTROL, "a"); field.send_keys(Keys.DELETE)
+    except InvalidElementStateException:
+        driver.execute_script(
+            "if(arguments[0].isContentEditable){arguments[0].innerText=''}else{arguments[0].value=''};",
+            field
+        )
+    _set_text_and_fire_input(driver, field, msg)
+
+    # --- 1) ждём коротко кнопку Send; если не активна — пробуем отправку по Enter
+    if not _wait_send_enabled(driver, timeout=3.0):
+        # иногда нужно «шевельнуть» инпут, чтобы включить валидацию
+        try:
+            _set_text_and_fire_input(driver, field, msg + " ")
+            _set_text_and_fire_input(driver, field, msg)
+        except Exception:
+            pass
+
+        # ещё раз подождать кнопку
+        if not _wait_send_enabled(driver, timeout=2.0):
+            # план Б: отправка по Enter
+            _try_press_enter_to_send(field)
+            # если отправилось — в логах появится наш токен; перейдём к подтверждению
+            # иначе ниже ещё попробуем кликом (на случай, если кнопка всё-таки ожила)
+
+    # --- 2) попытка нажать кнопку (если она есть и включена)
+    btn = _find_send_button(driver)
+    if btn:
+        try:
+            driver.execute_script("arguments[0].click();", btn)
+        except Exception:
+            # как запасной вариант — обычный click()
+            try:
+                btn.click()
+            except Exception:
+                pass
+    else:
+        # кнопки не нашли — надеемся, что Enter уже сработал
+        pass
+
+    return field
+
+def _mark_confirmed(marks, sent_at: float) -> None:
+    """Метки подтверждения сообщения: (отправлено, подтверждено) + первое/последнее."""
+    if marks is None:
+        return
+    now = time.time()
+    marks.setdefault("messages", []).append((sent_at, now))
+    marks.setdefault("first_confirmed", now)
+    marks["confirmed"] = now
+
+def _forget_token(driver, token: str) -> None:
+    stream = getattr(driver, "token_stream", None)
+    if stream is not None:
+        stream.forget(token)
+
+def send_messages(driver, wait, count: int, marks=None) -> int:
     sent = 0
     for i in range(count):
         token = _rand_token()
         msg = f"Automated message #{i+1} [{token}]"
 
-        # поле ввода
-        field = wait.until(EC.presence_of_element_located(INPUT_LOC))
-        wait.until(EC.element_to_be_clickable(INPUT_LOC))
-        driver.execute_script("arguments[0].scrollIntoView({block:'nearest'});", field)
-        driver.execute_script("arguments[0].click();", field)
-
-        # очистка + ввод
         try:
-            field.send_keys(Keys.CONTROL, "a"); field.send_keys(Keys.DELETE)
-        except InvalidElementStateException:
-            driver.execute_script(
-                "if(arguments[0].isContentEditable){arguments[0].innerText=''}else{arguments[0].value=''};",
-                field
-            )
-        _set_text_and_fire_input(driver, field, msg)
-
-        # --- 1) ждём коротко кнопку Send; если не активна — пробуем отправку по Enter
-        if not _wait_send_enabled(driver, timeout=3.0):
-            # иногда нужно «шевельнуть» инпут, чтобы включить валидацию
+            sent_at = time.time()
+            field = _type_and_send(driver, wait, msg)
+
+            # --- 3) подтверждаем по WebSocket/XHR
+            if _find_ws_or_xhr_with_token(driver, token, timeout=60):
+                sent += 1
+                _mark_confirmed(marks, sent_at)
+                print(f"   ✓ отправлено: {sent}/{count}")
+                time.sleep(0.3)
+                continue
+
+            # --- 4) ре-трай: снова «пнуть» инпут и ещё раз нажать
             try:
                 _set_text_and_fire_input(driver, field, msg + " ")
                 _set_text_and_fire_input(driver, field, msg)
+                # попробовать ещё раз кнопку
+                btn = _find_send_button(driver)
+                if btn:
+                    driver.execute_script("arguments[0].click();", btn)
+                else:
+                    _try_press_enter_to_send(field)
+
+                if _find_ws_or_xhr_with_token(driver, token, timeout=10):
+                    sent += 1
+                    _mark_confirmed(marks, sent_at)
+                    print(f"   ✓ отправлено (retry): {sent}/{count}")
+                    time.sleep(0.3)
+                    continue
             except Exception:
                 pass
 
-            # ещё раз подождать кнопку
-            if not _wait_send_enabled(driver, timeout=2.0):
-                # план Б: отправка по Enter
-                _try_press_enter_to_send(field)
-                # если отправилось — в логах появится наш токен; перейдём к подтверждению
-                # иначе ниже ещё попробуем кликом (на случай, если кнопка всё-таки ожила)
+            print(f"   ⚠️ не получили сетевое подтверждение для [{token}] — прерываю цикл")
+            break
+        finally:
+            _forget_token(driver, token)   # иначе stream.seen растёт весь прогон
 
-        # --- 2) попытка нажать кнопку (если она есть и включена)
-        btn = _find_send_button(driver)
-        if btn:
-            try:
-                driver.execute_script("arguments[0].click();", btn)
-            except Exception:
-                # как запасной вариант — обычный click()
-                try:
-                    btn.click()
-                except Exception:
-                    pass
-        else:
-            # кнопки не нашли — надеемся, что Enter уже сработал
-            pass
+    return sent
 
-        # --- 3) подтверждаем по WebSocket/XHR
-        _clear_perf_logs(driver)
-        if _find_ws_or_xhr_with_token(driver, token, timeout=60):
+def send_messages_pipelined(driver, wait, count: int, window: int = PIPELINE_WINDOW, marks=None) -> int:
+    """
+    Отправка подряд: до window сообщений без подтверждения, подтверждения
+    собираем по мере прихода кадров. Переотправляем только те токены, что не
+    дождались подтверждения за CONFIRM_TIMEOUT. Возвращает число подтверждённых.
+    """
+    stream = getattr(driver, "token_stream", None)
+    if stream is None:
+        return send_messages(driver, wait, count, marks)
+
+    pending = {}        # токен -> [текст, дедлайн подтверждения, попыток, момент первой отправки]
+    sent = failed = queued = 0
+    while queued < count or pending:
+        for token in stream.wait_any(pending, 0) if pending else ():
+            _mark_confirmed(marks, pending.pop(token)[3])
+            stream.forget(token)
             sent += 1
             print(f"   ✓ отправлено: {sent}/{count}")
-            time.sleep(0.3)
-            continue
-
-        # --- 4) ре-трай: снова «пнуть» инпут и ещё раз нажать
-        try:
-            _set_text_and_fire_input(driver, field, msg + " ")
-            _set_text_and_fire_input(driver, field, msg)
-            # попробовать ещё раз кнопку
-            btn = _find_send_button(driver)
-            if btn:
-                driver.execute_script("arguments[0].click();", btn)
-            else:
-                _try_press_enter_to_send(field)
 
-            if _find_ws_or_xhr_with_token(driver, token, timeout=10):
-                sent += 1
-                print(f"   ✓ отправлено (retry): {sent}/{count}")
-                time.sleep(0.3)
+        now = time.time()
+        for token, item in list(pending.items()):
+            if item[1] > now:
                 continue
-        except Exception:
-            pass
+            if item[2] > PIPELINE_RETRIES:
+                del pending[token]
+                stream.forget(token)
+                failed += 1
+                print(f"   ⚠️ не получили сетевое подтверждение для [{token}]")
+                continue
+            _type_and_send(driver, wait, item[0])
+            item[1] = time.time() + RETRY_CONFIRM_TIMEOUT
+            item[2] += 1
+
+        if queued < count and len(pending) < window:
+            token = _rand_token()
+            msg = f"Automated message #{queued + 1} [{token}]"
+            sent_at = time.time()
+            _type_and_send(driver, wait, msg)
+            pending[token] = [msg, time.time() + CONFIRM_TIMEOUT, 1, sent_at]
+            queued += 1
+            continue
 
-        print(f"   ⚠️ не получили сетевое подтверждение для [{token}] — прерываю цикл")
-        break
+        if pending:
+            nearest = min(item[1] for item in pending.values())
+            stream.wait_any(pending, max(0.0, nearest - time.time()))
+            if stream.closed and not any(t in stream.seen for t in pending):
+                print("   ⚠️ поток CDP-событий закрылся — прерываю отправку")
+                break
 
     return sent
 
@@ -344,8 +461,8 @@ def _is_checked(box_div):
     except Exception:
         return False
 
-def _ensure_checkbox(driver, wait, box_loc, should_be_checked: bool):
-    box = wait.until(EC.presence_of_element_located(box_loc))
+def _ensure_checkbox(driver, wait, boxes: LocatorSet, should_be_checked: bool):
+    box = boxes.until(wait, EC.presence_of_element_located)
     if _is_checked(box) != should_be_checked:
         driver.execute_script("arguments[0].click();", box)
         WebDriverWait(driver, 5).until(lambda d: _is_checked(box) == should_be_checked)
@@ -365,15 +482,15 @@ def _pick_first_reason_if_needed(driver, wait):
         driver.execute_script("arguments[0].click();", first_opt)
         WebDriverWait(driver, 5).until(lambda d: "select" not in driver.find_element(*label_loc).text.lower())
 
-def close_chat(driver, wait):
-    """Close → Yes → Submit → OK → ждём серую карточку → пауза стабилизации."""
+def close_chat(driver, wait, marks=None):
+    """
+    Close → Yes → Submit → OK → ждём серую карточку → пауза стабилизации.
+    В marks (если передан) — моменты close_clicked, submitted и grey.
+    """
+    marks = {} if marks is None else marks
     close_btn = _button_from_span(driver, CLOSE_SPAN_LOC)
     driver.execute_script("arguments[0].click();", close_btn)
-
-    yes_box_loc    = (By.XPATH, "//p-checkbox[./label[normalize-space()='Yes']]//div[contains(@class,'p-checkbox-box')] | //label[normalize-space()='Yes']/preceding::p-checkbox[1]//div[contains(@class,'p-checkbox-box')]")
-    no_box_loc     = (By.XPATH, "//p-checkbox[./label[normalize-space()='No']]//div[contains(@class,'p-checkbox-box')]  | //label[normalize-space()='No']/preceding::p-checkbox[1]//div[contains(@class,'p-checkbox-box')]")
-    submit_btn_loc = (By.XPATH, "//span[normalize-space()='Submit']")
-    ok_btn_loc     = (By.XPATH, "//button[normalize-space()='OK']")
+    marks["close_clicked"] = time.time()
 
     # сохраним ссылку на текущую выбранную карточку (для ожидания «поседения»)
     selected_card = None
@@ -387,19 +504,20 @@ def close_chat(driver, wait):
         pass
 
     # Yes/No
-    _ensure_checkbox(driver, wait, yes_box_loc, True)
-    _ensure_checkbox(driver, wait, no_box_loc,  False)
+    _ensure_checkbox(driver, wait, YES_BOX, True)
+    _ensure_checkbox(driver, wait, NO_BOX,  False)
 
     # Сабмит
-    driver.execute_script("arguments[0].click();", wait.until(EC.element_to_be_clickable(submit_btn_loc)))
+    driver.execute_script("arguments[0].click();", SUBMIT_BTN.until(wait, EC.element_to_be_clickable))
 
     # OK после сабмита
     try:
-        ok_btn = WebDriverWait(driver, 5).until(EC.element_to_be_clickable(ok_btn_loc))
+        ok_btn = OK_BTN.until(WebDriverWait(driver, 5), EC.element_to_be_clickable)
         driver.execute_script("arguments[0].click();", ok_btn)
-        WebDriverWait(driver, 5).until(EC.invisibility_of_element_located(ok_btn_loc))
+        WebDriverWait(driver, 5).until(EC.invisibility_of_element_located(OK_BTN_LOC))
     except TimeoutException:
         pass
+    marks["submitted"] = time.time()
 
     # ждём пока инпут исчезнет
     try:
@@ -407,124 +525,354 @@ def close_chat(driver, wait):
     except TimeoutException:
         pass
 
-    # >>> добавлено: ждём, что карточка посереет, и даём небольшую паузу стабилизации
+    # >>> добавлено: ждём, что карточка посереет, и что список после этого успокоится
     if selected_card is not None:
-        if _wait_card_turns_grey(selected_card, timeout=GREY_WAIT_TIMEOUT):
-            time.sleep(GREY_EXTRA_PAUSE)
+        if _wait_card_turns_grey(driver, selected_card, timeout=GREY_WAIT_TIMEOUT):
+            marks["grey"] = time.time()
+            domwait.dom_quiet(driver, quiet_ms=LIST_QUIET_MS, timeout=GREY_EXTRA_PAUSE)
     # <<< добавлено
 
-    time.sleep(0.2)  # общая микро-пауза
-
 # ===== Основная функция =====
-def start_chat(index: int = 0):
-    driver = make_driver()
-    wait = WebDriverWait(driver, 10)
-    start_time = time.time()  # отметка старта
+# id карточки — та же функция cardKey, что у индекса DirectChat (chatindex.py)
+CARD_KEY_JS = CARD_KEY_FN + "return cardKey(arguments[0]);"
+
+# Весь список карточек за один вызов: те же признаки, что _is_selected/_card_is_grey,
+# плюс сам элемент (для клика) — вместо нескольких запросов к chromedriver на карточку.
+# seen — когда карточка впервые появилась в списке (мс эпохи): при первом вызове
+# ставим MutationObserver, который отмечает новые карточки сразу, а не при следующем снимке.
+CARD_SNAPSHOT_JS = CARD_KEY_FN + """
+const xpath = arguments[0];
+const all = () => document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+if (!window.__cardSeen) {
+    const seen = window.__cardSeen = {};
+    let queued = false;
+    const mark = () => {
+        queued = false;
+        const now = Date.now(), r = all();
+        for (let i = 0; i < r.snapshotLength; i++) {
+            const id = cardKey(r.snapshotItem(i));
+            if (!(id in seen)) seen[id] = now;
+        }
+    };
+    new MutationObserver(() => { if (!queued) { queued = true; setTimeout(mark, 0); } })
+        .observe(document.body, {childList: true, subtree: true});
+    mark();
+}
+const found = all();
+const out = [];
+for (let i = 0; i < found.snapshotLength; i++) {
+    const el = found.snapshotItem(i);
+    const cls = (el.getAttribute('class') || '').toLowerCase();
+    const badge = Array.from(el.querySelectorAll("span[class*='badge']"))
+                       .map(b => (b.textContent || '').trim()).join(' ');
+    const text = (el.innerText || '').toLowerCase();
+    out.push({
+        index: i,
+        id: cardKey(el),
+        cls: cls,
+        selected: cls.includes('selected'),
+        grey: cls.includes('closed') || badge.toLowerCase().includes('closed') || text.includes('closed'),
+        badge: badge,
+        seen: window.__cardSeen[cardKey(el)] || Date.now(),
+        el: el,
+    });
+}
+return out;
+"""
+
+# "snapshot" — один вызов на весь список; "legacy" — проверки по карточке (для сравнения)
+CARD_SCAN = "snapshot"
+
+def card_snapshot(driver) -> list:
+    cards = driver.execute_script(CARD_SNAPSHOT_JS, ONGOING_CHATS_XPATH) or []
+    if cards:
+        note_card_key(cards[0]["id"])
+    return cards
+
+def _pick_from_snapshot(snapshot, claim=None):
+    """(элемент, id) первой доступной карточки из снимка или (None, "")."""
+    for card in snapshot:
+        if card["selected"] or card["grey"]:
+            continue
+        if claim is not None and not claim(card["id"]):
+            continue    # её уже взял другой агент
+        return card["el"], card["id"]
+    return None, ""
+
+def card_key(driver, card) -> str:
     try:
-        print("1) Логин…")
-        url = os.getenv("VIVAI_URL", "")
-        driver.get(url)
-
-        username = os.getenv("VIVAI_USER", "")
-        password = os.getenv("VIVAI_PASS", "")
-        if not username or not password:
-            raise RuntimeError("Нет логина/пароля в переменных окружения VIVAI_USER / VIVAI_PASS")
-
-        wait.until(EC.presence_of_element_located((By.NAME, "username"))).send_keys(username)
-        wait.until(EC.presence_of_element_located((By.NAME, "password"))).send_keys(password)
-        wait.until(EC.element_to_be_clickable((By.ID, "kt_sign_in_submit"))).click()
-
-        print("2) Chats → Direct…")
-        wait.until(EC.element_to_be_clickable((By.XPATH, "//span[@title='Chats']"))).click()
-        wait.until(EC.element_to_be_clickable((By.XPATH, "//span[@title='Direct']"))).click()
-        time.sleep(0.3)
+        return note_card_key(driver.execute_script(CARD_KEY_JS, card) or "")
+    except Exception:
+        return ""
 
-        print("3) Открываю меню аватара…")
-        wait_toasts_gone(driver, timeout=6)
-        avatar_loc = (By.XPATH, "//app-agent-avatar//span[contains(@class,'p-avatar-text')]")
-        avatar = wait.until(EC.element_to_be_clickable(avatar_loc))
-        driver.execute_script("arguments[0].click();", avatar)
+def _is_available(card) -> bool:
+    if _is_selected(card) or _card_is_grey(card):
+        return False
+    # дополнительная текстовая эвристика (если вдруг класс не прогрузился)
+    try:
+        return "closed" not in ((card.text or "").lower())
+    except Exception:
+        return False
 
-        print("4) Do not accept chats → Accepting chats…")
-        time.sleep(5.3)
-        if quick_present(driver, (By.XPATH, "//div[contains(text(),'Do not accept chats')]")):
-            driver.find_element(By.XPATH, "//div[contains(text(),'Do not accept chats')]").click()
-        if quick_present(driver, (By.XPATH, "//div[contains(text(),'Accepting chats')]")):
-            driver.find_element(By.XPATH, "//div[contains(text(),'Accepting chats')]").click()
-        driver.find_element(By.TAG_NAME, "body").send_keys(Keys.ESCAPE)
+def _pick_candidate(driver, cards, claim=None):
+    """Первая доступная карточка; с claim — первая, которую удалось застолбить."""
+    for c in cards:
+        if not _is_available(c):
+            continue
+        if claim is not None and not claim(card_key(driver, c)):
+            continue    # её уже взял другой агент
+        return c
+    return None
+
+AVATAR_LOC = (By.XPATH, "//app-agent-avatar//span[contains(@class,'p-avatar-text')]")
+STATUS_ITEM_LOC = (By.XPATH, "//div[contains(text(),'Do not accept chats') or contains(text(),'Accepting chats')]")
+
+def login(driver, wait, url: str, username: str, password: str) -> None:
+    """Логин через форму → Chats → Direct."""
+    print("1) Логин…")
+    driver.get(url)
+    if not username or not password:
+        raise RuntimeError("Нет логина/пароля в переменных окружения VIVAI_USER / VIVAI_PASS")
+
+    wait.until(EC.presence_of_element_located((By.NAME, "username"))).send_keys(username)
+    wait.until(EC.presence_of_element_located((By.NAME, "password"))).send_keys(password)
+    wait.until(EC.element_to_be_clickable((By.ID, "kt_sign_in_submit"))).click()
+
+    print("2) Chats → Direct…")
+    wait.until(EC.element_to_be_clickable((By.XPATH, "//span[@title='Chats']"))).click()
+    wait.until(EC.element_to_be_clickable((By.XPATH, "//span[@title='Direct']"))).click()
+    domwait.dom_quiet(driver, quiet_ms=LIST_QUIET_MS, timeout=1)
+
+def set_accepting(driver, wait) -> None:
+    """Меню аватара: Do not accept chats → Accepting chats."""
+    print("3) Открываю меню аватара…")
+    wait_toasts_gone(driver, timeout=6)
+    avatar = wait.until(EC.element_to_be_clickable(AVATAR_LOC))
+    driver.execute_script("arguments[0].click();", avatar)
+
+    print("4) Do not accept chats → Accepting chats…")
+    # вместо фиксированных 5.3 с — ждём, пока меню статусов отрисуется
+    domwait.present(driver, STATUS_ITEM_LOC[1], timeout=6)
+    if quick_present(driver, (By.XPATH, "//div[contains(text(),'Do not accept chats')]")):
+        driver.find_element(By.XPATH, "//div[contains(text(),'Do not accept chats')]").click()
+    if quick_present(driver, (By.XPATH, "//div[contains(text(),'Accepting chats')]")):
+        driver.find_element(By.XPATH, "//div[contains(text(),'Accepting chats')]").click()
+    driver.find_element(By.TAG_NAME, "body").send_keys(Keys.ESCAPE)
+
+def open_workspace(driver, wait, url: str, username: str, password: str) -> None:
+    """
+    Попасть в Direct со статусом «Accepting chats»: сначала по сохранённой
+    сессии (agentsession.py), при её отсутствии/протухании — через логин.
+    """
+    path = session_path(username or "anonymous")
+    if REUSE_SESSION and restore_session(driver, path, AVATAR_LOC):
+        print("1-2) Сессия восстановлена — сразу в Direct")
+    else:
+        login(driver, wait, url, username, password)
+        if REUSE_SESSION:
+            wait.until(EC.presence_of_element_located(AVATAR_LOC))   # Direct отрисован — URL уже его
+            save_session(driver, path)
+    set_accepting(driver, wait)
+
+# ===== Фазы обработки чата =====
+# (фаза, метка начала, метка конца); метки — time.time(), которые ставят drain,
+# send_messages*/close_chat; фаза пишется, только если есть обе метки
+PHASES = (
+    ("queue_wait",    "hub_event",     "clicked"),       # событие agent-events-hub по чату → клик
+    ("list_wait",     "appeared",      "clicked"),       # карточка появилась в списке → клик
+    ("open",          "clicked",       "input_ready"),
+    ("first_confirm", "input_ready",   "first_confirmed"),
+    ("send",          "input_ready",   "confirmed"),     # до подтверждения последнего сообщения
+    ("close_click",   "confirmed",     "close_clicked"),
+    ("submit",        "close_clicked", "submitted"),     # Close → Yes → Submit → OK
+    ("grey",          "submitted",     "grey"),
+    ("chat",          "clicked",       "done"),
+)
 
-        print("5) Обхожу чаты по очереди…")
-        processed = 0
+def record_phases(marks: dict, steps) -> None:
+    for phase, start, end in PHASES:
+        if marks.get(start) is not None and marks.get(end) is not None:
+            steps.record(phase, max(0.0, marks[end] - marks[start]))
+    for sent_at, confirmed_at in marks.get("messages", ()):
+        steps.record("message", confirmed_at - sent_at)     # каждое сообщение: отправка → подтверждение
 
-        while True:
+def drain(driver, wait, sink=None, claim=None, finish=None, phases=None) -> tuple:
+    """
+    Обойти список чатов: открыть → отправить сообщения → закрыть.
+    claim(key) -> bool  — застолбить карточку (для нескольких агентов сразу),
+    finish(key, status) — отметить результат,
+    phases (latency.StageStats) — куда складывать длительности фаз (см. PHASES).
+    Возвращает (обработано, неудач).
+    """
+    print(f"5) Обхожу чаты по очереди… (выбор карточки: {CARD_SCAN})")
+    processed = failed = 0
+    picks = pick_trips = 0
+    no_hub = no_id = 0       # карточки без queue_wait: нет события хаба / у карточки нет id-атрибута
+    stream = getattr(driver, "token_stream", None)
+
+    while True:
+        trips_before = getattr(driver, "round_trips", 0)
+        key = ""
+        marks = {}
+        if CARD_SCAN == "snapshot":
             try:
-                cards = WebDriverWait(driver, 10).until(
-                    EC.presence_of_all_elements_located((By.XPATH, ONGOING_CHATS_XPATH))
-                )
+                snapshot = WebDriverWait(driver, 10).until(lambda d: card_snapshot(d) or False)
             except TimeoutException:
                 print("Список чатов не загрузился ❌")
                 break
-
-            # >>> добавлено: отбрасываем серые/закрытые/выбранные карточки
-            candidate = None
-            for c in cards:
-                if _is_selected(c) or _card_is_grey(c):
-                    continue
-                # дополнительная текстовая эвристика (если вдруг класс не прогрузился)
+            candidate, key = _pick_from_snapshot(snapshot, claim)
+            if not candidate:
+                # дайте списку обновиться и перепроверьте «первую» карточку
+                domwait.list_mutated(driver, ONGOING_CHATS_XPATH, timeout=TOP_CARD_RECHECK_PAUSE)
                 try:
-                    if "closed" in ((c.text or "").lower()):
-                        continue
+                    snapshot = card_snapshot(driver)[:1]
+                    candidate, key = _pick_from_snapshot(snapshot, claim)
                 except Exception:
                     pass
-                candidate = c
+            marks["appeared"] = next((c["seen"] / 1000 for c in snapshot
+                                      if c["id"] == key and c.get("seen")), None)
+        else:
+            try:
+                cards = WebDriverWait(driver, 10).until(
+                    EC.presence_of_all_elements_located((By.XPATH, ONGOING_CHATS_XPATH))
+                )
+            except TimeoutException:
+                print("Список чатов не загрузился ❌")
                 break
-            # <<< добавлено
+
+            # отбрасываем серые/закрытые/выбранные (и чужие) карточки
+            candidate = _pick_candidate(driver, cards, claim)
 
             if not candidate:
                 # >>> добавлено: дайте списку обновиться и перепроверьте «первую» карточку
-                time.sleep(TOP_CARD_RECHECK_PAUSE)
+                domwait.list_mutated(driver, ONGOING_CHATS_XPATH, timeout=TOP_CARD_RECHECK_PAUSE)
                 try:
                     cards = driver.find_elements(By.XPATH, ONGOING_CHATS_XPATH)
                     if cards:
-                        first = cards[0]
-                        if not _is_selected(first) and not _card_is_grey(first) and "closed" not in ((first.text or "").lower()):
-                            candidate = first
+                        candidate = _pick_candidate(driver, cards[:1], claim)
                 except Exception:
                     pass
                 # <<< добавлено
+            if candidate and finish:
+                key = card_key(driver, candidate)
 
-            if not candidate:
-                print("Нет доступных чатов. Готово ✅")
-                break
+        trips = getattr(driver, "round_trips", 0) - trips_before
+        picks += 1
+        pick_trips += trips
 
-            driver.execute_script("arguments[0].scrollIntoView({block:'center'});", candidate)
-            driver.execute_script("arguments[0].click();", candidate)
+        if not candidate:
+            print("Нет доступных чатов. Готово ✅")
+            break
 
-            try:
-                WebDriverWait(driver, 8).until(EC.presence_of_element_located(INPUT_LOC))
-            except TimeoutException:
-                print("Не удалось открыть чат — пропускаю…")
-                continue
+        if stream is not None:
+            # chatId хаба совпадает только с настоящим id карточки, не с ключом по тексту
+            if not key or key.startswith(FALLBACK_KEY_PREFIX):
+                no_id += 1
+            else:
+                marks["hub_event"] = stream.chat_events.get(key)
+                no_hub += marks["hub_event"] is None
 
-            n = random.randint(3, 7)
-            print(f"Отправляю {n} сообщений…")
-            sent = send_messages(driver, wait, n)
+        chat_started = time.time()
+        attempt = processed + failed + 1     # номер сессии в JSONL — один на каждую попытку
+        steps = StepLog(phases)
+        driver.execute_script("arguments[0].scrollIntoView({block:'center'});", candidate)
+        driver.execute_script("arguments[0].click();", candidate)
+        marks["clicked"] = time.time()
 
-            if sent == n:
-                print("Закрываю чат…")
-                close_chat(driver, wait)
-                wait_toasts_gone(driver, timeout=6)
-                processed += 1
-                print(f"✔️ Обработано: {processed}")
-            else:
-                print(f"❌ Отправлено только {sent}/{n}. Чат НЕ закрываю — следующий.")
-                continue
+        try:
+            INPUT.until(WebDriverWait(driver, 8), EC.presence_of_element_located)
+        except TimeoutException as e:
+            print("Не удалось открыть чат — пропускаю…")
+            failed += 1
+            record_phases(marks, steps)
+            if finish:
+                finish(key, "timeout")
+            if sink:
+                sink.session(attempt, chat_started, time.time(), steps=steps.steps,
+                             outcome="timeout", error=type(e).__name__)
+            continue
+        marks["input_ready"] = time.time()
+
+        n = random.randint(3, 7)
+        print(f"Отправляю {n} сообщений…")
+        if PIPELINE:
+            sent = send_messages_pipelined(driver, wait, n, marks=marks)
+        else:
+            sent = send_messages(driver, wait, n, marks)
+
+        if sent == n:
+            print("Закрываю чат…")
+            close_chat(driver, wait, marks)
+            wait_toasts_gone(driver, timeout=6)
+            marks["done"] = time.time()
+            record_phases(marks, steps)
+            processed += 1
+            if finish:
+                finish(key, "ok")
+            if sink:
+                sink.session(attempt, chat_started, time.time(), steps=steps.steps,
+                             messages=sent, outcome="ok",
+                             pick_round_trips=trips)
+            print(f"✔️ Обработано: {processed}")
+        else:
+            print(f"❌ Отправлено только {sent}/{n}. Чат НЕ закрываю — следующий.")
+            failed += 1
+            record_phases(marks, steps)
+            if finish:
+                finish(key, "error")
+            if sink:
+                sink.session(attempt, chat_started, time.time(), steps=steps.steps,
+                             messages=sent, outcome="error", error="NotConfirmed")
+            continue
 
+    if picks:
+        print(f"Выбор карточки ({CARD_SCAN}): {picks} раз, "
+              f"в среднем {pick_trips / picks:.1f} запросов к chromedriver")
+    if no_id or no_hub:
+        print(f"queue_wait не измерен для {no_id + no_hub} из {picks} карточек: "
+              f"без id-атрибута {no_id}, без события хаба {no_hub}")
+    return processed, failed
+
+def report_phases(phases: StageStats, json_path=PHASES_JSON, csv_path=PHASES_CSV) -> None:
+    if not phases.stages:
+        return
+    print("Фазы обработки чата:")
+    print(phases.format_table())
+    if json_path:
+        phases.to_json(Path(json_path))
+    if csv_path:
+        phases.to_csv(Path(csv_path))
+
+def report_locators(sets=LOCATOR_SETS) -> None:
+    print("Локаторы (попадания/промахи по кандидатам):")
+    for locs in sets:
+        print(locs.report())
+
+def start_chat(index: int = 0):
+    try:
+        driver = make_driver()
+    except Exception:
+        DRIVERS.close()
+        raise
+    wait = WebDriverWait(driver, 10)
+    start_time = time.time()  # отметка старта
+    sink = ResultSink(Path(RESULTS_JSONL), engine="selenium-agent") if RESULTS_JSONL else None
+    phases = StageStats()
+    try:
+        open_workspace(driver, wait, os.getenv("VIVAI_URL", ""),
+                       os.getenv("VIVAI_USER", ""), os.getenv("VIVAI_PASS", ""))
+        drain(driver, wait, sink, phases=phases)
     finally:
+        if sink:
+            sink.close()
         elapsed = time.time() - start_time
         minutes, seconds = divmod(int(elapsed), 60)
         print(f"⏱ Время выполнения: {minutes} мин {seconds} сек")
-        driver.quit()
+        report_phases(phases)
+        report_locators()
+        quit_driver(driver)
+        print(DRIVERS.report())
+        DRIVERS.close()     # остановить chromedriver, не надеясь на сборщик мусора
 
 # ===== Точка входа =====
 if __name__ == "__main__":
@@ -0,0 +1,564 @@
+#!/usr/bin/env python3
+# agentapi.py
+# Агенты без браузера: взять чат, ответить и закрыть — HTTP + SignalR напрямую из asyncio.
+# Usage:
+#   python agentapi.py agents.csv --url https://api.host --agents 200
+#   python agentapi.py agents.csv --har agent.har                 # эндпоинты из записанного HAR
+#   python agentapi.py --with-stub --agents 50 --chats 2000       # самопроверка на stubserver.py
+#   python agentapi.py agents.csv --har agent.har --verify-ui     # + проверить итог через UI
+"""
+API-движок агента рядом с UI-движком (OpenAgentSide.drain / agentdrain.py).
+
+Те же действия, что агент делает кликами — Assign to me, Send, Close + Yes +
+Submit + OK, — здесь идут прямыми вызовами бэкенда, которые видны в HAR
+(см. HARanalys.py): списки unassigned/ongoing, assign/messages/close по чату
+и SignalR-хаб agent-events-hub. Один процесс держит сотни агентов: на агента
+одно keep-alive HTTP-соединение и один websocket.
+
+- новые чаты агент узнаёт из события хаба (ChatCreated), а не опросом списка;
+- кто первым взял чат, решает сам бэкенд (assign у второго агента вернёт 409),
+  поэтому общий реестр claims.py здесь не нужен;
+- отправка подтверждается событием хаба с токеном сообщения, как в UI-движке;
+- --verify-ui: после прогона открыть Direct через Selenium (OpenAgentSide)
+  и убедиться, что закрытые через API чаты не висят доступными карточками.
+
+Пути эндпоинтов по умолчанию — как у stubserver.py; с --har берутся из записи.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote, urlsplit
+
+from asyncnet import ConnectionClosed, HttpClient, WebSocket
+from chatindex import CARD_KEY_FN
+from latency import StageStats
+from resultsink import ResultSink, StepLog
+
+REC_SEP = "\x1e"  # SignalR record separator
+
+# ====================== НАСТРОЙКИ ======================
+AGENTS = 50                # сколько агентов-заглушек с --with-stub (с CSV по умолчанию — все учётки)
+MESSAGES_MIN, MESSAGES_MAX = 3, 7   # как в OpenAgentSide.drain
+MESSAGE_TEXT = "Agent reply"
+TIMEOUT_S = 15.0           # на один HTTP-запрос / подключение
+ECHO_TIMEOUT_S = 10.0      # ждать события хаба с токеном отправленного сообщения
+IDLE_S = 5.0               # очередь пуста столько секунд (и в хабе тихо) — агент закончил
+KEEPALIVE_S = 15.0         # SignalR ping {"type":6}
+CLOSE_REASON = "Resolved"
+
+# пути по умолчанию (как у stubserver.py); {chat} — id чата
+LOGIN_PATH = "/api/auth/login"
+UNASSIGNED_PATH = "/api/agent/chats/unassigned"
+ONGOING_PATH = "/api/agent/chats/ongoing"
+ASSIGN_PATH = "/api/agent/chats/{chat}/assign"
+MESSAGES_PATH = "/api/agent/chats/{chat}/messages"
+CLOSE_PATH = "/api/agent/chats/{chat}/close"
+HUB_PATH = "/hubs/agent-events-hub"
+
+# ==================== ЭНДПОИНТЫ ====================
+
+def _rand_token(k: int = 5) -> str:
+    alphabet = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+    return "".join(random.choice(alphabet) for _ in range(k))
+
+def _items(data) -> list:
+    """Список чатов из ответа unassigned/ongoing (те же варианты, что в HARanalys.extract_api_chats)."""
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        for key in ("items", "data"):
+            if isinstance(data.get(key), list):
+                return data[key]
+        for v in data.values():
+            if isinstance(v, list) and v and isinstance(v[0], dict):
+                return v
+    return []
+
+def _chat_id(item) -> str:
+    return str(item.get("id") or item.get("chatId") or item.get("chat_id") or "") if isinstance(item, dict) else ""
+
+class Endpoints:
+    """Базовый URL API и пути действий агента."""
+
+    def __init__(self, base: str):
+        self.base = base.rstrip("/")
+        self.login = LOGIN_PATH
+        self.unassigned = UNASSIGNED_PATH
+        self.ongoing = ONGOING_PATH
+        self.assign = ASSIGN_PATH
+        self.messages = MESSAGES_PATH
+        self.close = CLOSE_PATH
+        self.hub = HUB_PATH
+
+    def url(self, path: str, chat: str = "") -> str:
+        return self.base + path.replace("{chat}", quote(chat, safe=""))
+
+    def hub_ws(self, token: str) -> str:
+        scheme = "wss" if self.base.startswith("https") else "ws"
+        return f"{scheme}{self.base[self.base.index(':'):]}{self.hub}?id={quote(token, safe='')}"
+
+    @classmethod
+    def from_har(cls, har: dict, base: str = "") -> "Endpoints":
+        """
+        Пути из записи UI-сессии агента: списки и хаб — по именам (как в HARanalys.py),
+        assign/messages/close — POST-запросы с id чата из ответов списков.
+        """
+        entries = (har.get("log") or {}).get("entries") or []
+        found, chat_ids = {}, set()
+        for e in entries:
+            req = e.get("request", {}) or {}
+            url = req.get("url") or ""
+            parts = urlsplit(url)
+            if "agent-events-hub" in parts.path:
+                found.setdefault("hub", re.sub(r"/negotiate$", "", parts.path))
+                found.setdefault("base", f"{parts.scheme.replace('ws', 'http', 1)}://{parts.netloc}")
+            for name in ("unassigned", "ongoing"):
+                if name in parts.path and req.get("method") == "GET":
+                    found.setdefault(name, parts.path + (f"?{parts.query}" if parts.query else ""))
+                    found.setdefault("base", f"{parts.scheme}://{parts.netloc}")
+                    try:
+                        text = ((e.get("response") or {}).get("content") or {}).get("text") or ""
+                        chat_ids.update(filter(None, map(_chat_id, _items(json.loads(text)))))
+                    except ValueError:
+                        pass
+            if req.get("method") == "POST" and re.search(r"/(auth|account)/.*(login|token)|/login$", parts.path):
+                found.setdefault("login", parts.path)
+        for e in entries:
+            req = e.get("request", {}) or {}
+            path = urlsplit(req.get("url") or "").path
+            if req.get("method") != "POST":
+                continue
+            for chat in chat_ids:
+                if f"/{chat}/" not in path and not path.endswith(f"/{chat}"):
+                    continue
+                templ = path.replace(chat, "{chat}")
+                tail = templ.rsplit("/", 1)[-1].lower()
+                for name, word in (("assign", "assign"), ("messages", "message"), ("close", "close")):
+                    if word in tail:
+                        found.setdefault(name, templ)
+        ep = cls(base or found.get("base") or "")
+        for name in ("login", "unassigned", "ongoing", "assign", "messages", "close", "hub"):
+            if name in found:
+                setattr(ep, name, found[name])
+        return ep
+
+    def describe(self) -> str:
+        return "\n".join(f"{name:<11}{getattr(self, name)}" for name in
+                         ("base", "login", "unassigned", "ongoing", "assign", "messages", "close", "hub"))
+
+# ==================== ХАБ СОБЫТИЙ ====================
+
+def _events(text: str):
+    """События из кадра хаба: SendEvent разворачивается до самого события (как в HARanalys.py)."""
+    for part in text.split(REC_SEP):
+        if not part.strip():
+            continue
+        try:
+            msg = json.loads(part)
+        except ValueError:
+            continue
+        if not isinstance(msg, dict) or msg.get("type") != 1:
+            continue
+        args = msg.get("arguments") or []
+        if msg.get("target") == "SendEvent" and args and isinstance(args[0], dict):
+            yield args[0], part
+        else:
+            yield {"type": msg.get("target"), "chatId": _chat_id(args[0]) if args else ""}, part
+
+class AgentHub:
+    """agent-events-hub одного агента: будит его на новых чатах и подтверждает сообщения."""
+
+    def __init__(self, ws: WebSocket):
+        self.ws = ws
+        self.arrived = asyncio.Event()   # был ChatCreated с последней проверки очереди
+        self.first_seen = {}             # chatId -> perf_counter события ChatCreated
+        self.taken = set()               # ChatAssigned/ChatClosed: этот чат уже не брать
+        self._pending = {}               # токен сообщения -> Future
+        self._tasks = [asyncio.create_task(self._reader()), asyncio.create_task(self._keepalive())]
+
+    @classmethod
+    async def connect(cls, http: HttpClient, ep: Endpoints, headers: dict, verify: bool) -> "AgentHub":
+        resp = await asyncio.wait_for(
+            http.request("POST", ep.url(ep.hub + "/negotiate?negotiateVersion=1"), headers), TIMEOUT_S)
+        if resp.status >= 400:
+            raise HttpStatusError(f"negotiate: HTTP {resp.status}")
+        data = json.loads(resp.body)
+        ws = await asyncio.wait_for(WebSocket.connect(
+            ep.hub_ws(data.get("connectionToken") or data.get("connectionId")), headers, verify=verify), TIMEOUT_S)
+        await ws.send_text(json.dumps({"protocol": "json", "version": 1}) + REC_SEP)
+        await asyncio.wait_for(ws.recv_text(), TIMEOUT_S)      # {} — handshake принят
+        return cls(ws)
+
+    async def _reader(self) -> None:
+        try:
+            while True:
+                text = await self.ws.recv_text()
+                now = time.perf_counter()
+                for event, raw in _events(text):
+                    kind = event.get("type")
+                    if kind == "ChatCreated":
+                        self.first_seen.setdefault(_chat_id(event), now)
+                        self.arrived.set()
+                    elif kind in ("ChatAssigned", "ChatClosed"):
+                        self.taken.add(_chat_id(event))
+                        self.first_seen.pop(_chat_id(event), None)
+                    for token in [t for t in self._pending if t in raw]:
+                        fut = self._pending.pop(token)
+                        if not fut.done():
+                            fut.set_result(now)
+        except (ConnectionClosed, ConnectionError):
+            pass
+
+    async def _keepalive(self) -> None:
+        while True:
+            await asyncio.sleep(KEEPALIVE_S)
+            await self.ws.send_text('{"type":6}' + REC_SEP)
+
+    def expect(self, token: str) -> asyncio.Future:
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[token] = fut
+        return fut
+
+    def forget(self, tokens) -> None:
+        """Снять ожидание токенов (неподтверждённые, или отправка сорвалась на полпути)."""
+        for token in tokens:
+            fut = self._pending.pop(token, None)
+            if fut is not None and not fut.done():
+                fut.cancel()
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await self.ws.close()
+
+# ==================== АГЕНТ ====================
+
+OK, CONFLICT, ERROR = "ok", "conflict", "error"
+
+class HttpStatusError(Exception):
+    pass
+
+class AgentStats:
+    """Итоги процесса по всем агентам: чаты, гонки за assign, доставка и гистограммы шагов."""
+
+    def __init__(self):
+        self.processed = 0
+        self.failed = 0
+        self.conflicts = 0       # assign вернул 409 — чат взял другой агент
+        self.delivered = 0
+        self.lost = 0
+        self.error_kinds = {}
+        self.closed_ids = []
+        self.per_agent = {}      # username -> обработано
+        self.stages = StageStats()
+
+    def error(self, e: Exception) -> None:
+        name = type(e).__name__
+        self.error_kinds[name] = self.error_kinds.get(name, 0) + 1
+
+class Agent:
+    def __init__(self, cred: dict, ep: Endpoints, opts, stats: AgentStats, sink: Optional[ResultSink]):
+        self.name = cred["username"]
+        self.password = cred["password"]
+        self.ep = ep
+        self.opts = opts
+        self.stats = stats
+        self.sink = sink
+        self.http = HttpClient(verify=not opts.insecure,
+                               default_headers={"Content-Type": "application/json", "Accept": "application/json"})
+        self.headers = {}
+        self.hub = None
+
+    async def call(self, method: str, path: str, chat: str = "", payload=None, stages=None, label=""):
+        t = time.perf_counter()
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        resp = await asyncio.wait_for(
+            self.http.request(method, self.ep.url(path, chat), self.headers, body), TIMEOUT_S)
+        (stages or self.stats.stages).record(label or path.rsplit("/", 1)[-1], time.perf_counter() - t)
+        return resp
+
+    async def login(self) -> None:
+        if self.opts.token:
+            self.headers["Authorization"] = f"Bearer {self.opts.token}"
+        else:
+            resp = await self.call("POST", self.ep.login, payload={"username": self.name, "password": self.password},
+                                   label="login")
+            if resp.status >= 400:
+                raise HttpStatusError(f"login {self.name}: HTTP {resp.status}")
+            data = json.loads(resp.body)
+            token = data.get("accessToken") or data.get("access_token") or data.get("token")
+            if token:
+                self.headers["Authorization"] = f"Bearer {token}"
+        self.hub = await AgentHub.connect(self.http, self.ep, self.headers, not self.opts.insecure)
+
+    async def chats(self, path: str) -> list:
+        resp = await self.call("GET", path, label="list")
+        if resp.status >= 400:
+            raise HttpStatusError(f"{path}: HTTP {resp.status}")
+        return [cid for cid in map(_chat_id, _items(json.loads(resp.body))) if cid]
+
+    async def handle(self, chat: str, assigned: bool = False) -> str:
+        """Assign → N сообщений с подтверждением из хаба → Close. Возвращает исход."""
+        log = StepLog(self.stats.stages)
+        started_wall, started = time.time(), time.perf_counter()
+        outcome, error, sent = ERROR, None, 0
+        tokens = []
+        try:
+            seen = self.hub.first_seen.pop(chat, None)   # до assign: своё ChatAssigned его сотрёт
+            if not assigned:
+                resp = await self.call("POST", self.ep.assign, chat, {}, log, "assign")
+                if resp.status == 409:
+                    outcome = CONFLICT
+                    return CONFLICT
+                if resp.status >= 400:
+                    raise HttpStatusError(f"assign: HTTP {resp.status}")
+            if seen is not None:
+                log.record("queue_wait", started - seen)
+
+            t = time.perf_counter()
+            n = random.randint(self.opts.messages_min, self.opts.messages_max)
+            confirms = []
+            for i in range(n):
+                token = _rand_token()
+                tokens.append(token)
+                confirms.append(self.hub.expect(token))
+                resp = await self.call("POST", self.ep.messages, chat,
+                                       {"text": f"{MESSAGE_TEXT} #{i + 1} [{token}]"}, log, "send")
+                if resp.status >= 400:
+                    raise HttpStatusError(f"send: HTTP {resp.status}")
+                sent += 1
+            log.messages = sent
+            # как конвейер в OpenAgentSide: шлём подряд, подтверждения собираем в конце
+            done, pending = await asyncio.wait(confirms, timeout=self.opts.echo_timeout)
+            self.stats.delivered += len(done)
+            self.stats.lost += len(pending)
+            log.record("confirm", time.perf_counter() - t)
+            if pending:
+                raise HttpStatusError(f"не подтверждено {len(pending)}/{n} сообщений")
+
+            resp = await self.call("POST", self.ep.close, chat, {"resolved": True, "reason": CLOSE_REASON},
+                                   log, "close")
+            if resp.status >= 400:
+                raise HttpStatusError(f"close: HTTP {resp.status}")
+            log.record("chat", time.perf_counter() - started)
+            outcome = OK
+            self.stats.processed += 1
+            self.stats.per_agent[self.name] = self.stats.per_agent.get(self.name, 0) + 1
+            self.stats.closed_ids.append(chat)
+            return OK
+        except Exception as e:
+            if not self.opts.quiet:
+                print(f"[ERR] {self.name} chat {chat}: {type(e).__name__}: {e}")
+            self.stats.failed += 1
+            self.stats.error(e)
+            error = type(e).__name__
+            return ERROR
+        finally:
+            self.hub.forget(tokens)
+            if self.sink and outcome != CONFLICT:
+                self.sink.session(len(self.stats.closed_ids) + self.stats.failed, started_wall,
+                                  started_wall + time.perf_counter() - started, steps=log.steps,
+                                  messages=sent, outcome=outcome, error=error, agent=self.name, chat_id=chat)
+
+    async def run(self) -> None:
+        try:
+            await self.login()
+            # сначала дочистить свои открытые чаты (например, после падения прошлого прогона)
+            for chat in await self.chats(self.ep.ongoing):
+                await self.handle(chat, assigned=True)
+            while True:
+                self.hub.arrived.clear()
+                queue = await self.chats(self.ep.unassigned)
+                if not queue:
+                    try:
+                        await asyncio.wait_for(self.hub.arrived.wait(), self.opts.idle)
+                    except asyncio.TimeoutError:
+                        return      # очередь пуста и новых чатов нет
+                    continue
+                # агенты начинают с разных мест очереди — меньше 409 на одной карточке
+                random.shuffle(queue)
+                for chat in queue:
+                    if chat in self.hub.taken:
+                        continue    # хаб уже сообщил, что его взял другой агент
+                    if await self.handle(chat) == CONFLICT:
+                        self.stats.conflicts += 1
+        except Exception as e:
+            if not self.opts.quiet:
+                print(f"[ERR] {self.name}: {type(e).__name__}: {e}")
+            self.stats.error(e)
+        finally:
+            if self.hub is not None:
+                await self.hub.close()
+            await self.http.close()
+
+# ==================== ЗАПУСК ====================
+
+def stub_credentials(n: int) -> list:
+    return [{"username": f"agent{i}@stub", "password": "stub"} for i in range(1, n + 1)]
+
+async def run(creds: list, ep: Endpoints, opts) -> AgentStats:
+    stats = AgentStats()
+    sink = ResultSink(opts.results, engine="agentapi") if opts.results else None
+    try:
+        agents = [Agent(cred, ep, opts, stats, sink) for cred in creds]
+        await asyncio.gather(*(a.run() for a in agents))
+    finally:
+        if sink:
+            sink.close()
+    return stats
+
+# карточка -> id чата из API: cardKey (если у карточек есть id-атрибут) или id,
+# встречающийся в разметке карточки (атрибуты, ссылки). {id: серая ли}
+MATCH_CARDS_JS = CARD_KEY_FN + """
+const ids = arguments[1];
+const r = document.evaluate(arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+const out = {};
+for (let i = 0; i < r.snapshotLength; i++) {
+    const el = r.snapshotItem(i);
+    const holder = el.closest('app-chat-item') || el;
+    const key = cardKey(el), html = holder.outerHTML;
+    const id = ids.find(c => c === key || html.includes(c));
+    if (id === undefined) continue;
+    const cls = (el.getAttribute('class') || '').toLowerCase();
+    out[id] = cls.includes('closed') || (el.innerText || '').toLowerCase().includes('closed');
+}
+return out;
+"""
+
+def verify_ui(cred: dict, url: str, closed_ids: list) -> tuple:
+    """
+    Открыть Direct в браузере (UI-движок) и проверить закрытые через API чаты.
+    Возвращает (сопоставлено карточек, из них не закрыты в UI). Карточки без
+    явного соответствия id из API не считаются — 0 сопоставленных значит,
+    что проверить ничего не удалось.
+    """
+    import OpenAgentSide as agent
+    import domwait
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    driver = agent.make_driver()
+    try:
+        wait = WebDriverWait(driver, 10)
+        agent.open_workspace(driver, wait, url, cred["username"], cred["password"])
+        domwait.present(driver, agent.ONGOING_CHATS_XPATH, timeout=10)
+        domwait.dom_quiet(driver, quiet_ms=500, timeout=5)     # список дорисован
+        matched = driver.execute_script(MATCH_CARDS_JS, agent.ONGOING_CHATS_XPATH, list(closed_ids)) or {}
+        stuck = [chat for chat, grey in matched.items() if not grey]
+        for chat in stuck:
+            print(f"    в UI не закрыт: {chat}")
+        return len(matched), len(stuck)
+    finally:
+        agent.quit_driver(driver)
+
+def print_report(stats: AgentStats, agents: int, elapsed: float) -> None:
+    print(f"\nDone. Обработано чатов: {stats.processed} агентами: {agents} за {elapsed:.1f} с"
+          f" ({stats.processed / elapsed * 60:.1f} chats/min)")
+    print(f"Failed: {stats.failed}, assign conflicts (409): {stats.conflicts}"
+          + (f" {stats.error_kinds}" if stats.error_kinds else ""))
+    print(f"Messages: delivered {stats.delivered}, lost {stats.lost}")
+    if stats.per_agent:
+        counts = sorted(stats.per_agent.values())
+        print(f"Per agent: min {counts[0]}, max {counts[-1]}, idle {agents - len(counts)}")
+    if stats.stages.stages:
+        print(stats.stages.format_table())
+    print(f"CPU: python {time.process_time():.1f} с")
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Агенты без браузера: assign → ответ → close через HTTP + SignalR")
+    ap.add_argument("credentials", type=Path, nargs="?", help="CSV: username,password (как у agentdrain.py)")
+    ap.add_argument("--url", default="", help="базовый URL API, напр. https://api.host")
+    ap.add_argument("--har", type=Path, default=None, help="взять пути эндпоинтов из HAR UI-сессии агента")
+    ap.add_argument("--token", default="", help="готовый Bearer-токен вместо логина (один на всех)")
+    ap.add_argument("--agents", type=int, default=0,
+                    help=f"сколько агентов (0 — все из CSV; с --with-stub без CSV — {AGENTS})")
+    ap.add_argument("--messages-min", type=int, default=MESSAGES_MIN)
+    ap.add_argument("--messages-max", type=int, default=MESSAGES_MAX)
+    ap.add_argument("--echo-timeout", type=float, default=ECHO_TIMEOUT_S)
+    ap.add_argument("--idle", type=float, default=IDLE_S,
+                    help="агент заканчивает, если очередь пуста и столько секунд нет новых чатов")
+    ap.add_argument("--insecure", action="store_true", help="не проверять TLS-сертификаты")
+    ap.add_argument("--quiet", action="store_true", help="не печатать ошибки по каждому чату")
+    ap.add_argument("--dump-endpoints", action="store_true", help="показать эндпоинты и выйти")
+    ap.add_argument("--with-stub", action="store_true",
+                    help="поднять stubserver.py в этом процессе, насоздавать --chats чатов и разобрать их")
+    ap.add_argument("--chats", type=int, default=1000, help="сколько чатов создать на заглушке (--with-stub)")
+    ap.add_argument("--verify-ui", action="store_true",
+                    help="после прогона проверить закрытые чаты через UI (Selenium, OpenAgentSide)")
+    ap.add_argument("--ui-url", default="", help="URL логина UI для --verify-ui (иначе VIVAI_URL)")
+    ap.add_argument("--results", type=Path, default=None,
+                    help="писать по JSON-записи на чат в этот JSONL (см. resultsink.py)")
+    ap.add_argument("--hist-json", type=Path, default=None)
+    ap.add_argument("--hist-csv", type=Path, default=None)
+    args = ap.parse_args(argv)
+    if not args.credentials and not args.with_stub:
+        ap.error("нужен CSV с учётками или --with-stub")
+    if not args.with_stub and not (args.url or args.har):
+        ap.error("нужен --url или --har")
+    return args
+
+async def amain(opts, creds: list):
+    server = state = None
+    if opts.with_stub:
+        import stubserver
+        server, state = await stubserver.start_server("127.0.0.1", 0)
+        ep = Endpoints(f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}")
+        for i in range(opts.chats):
+            state.new_chat(f"Test {i + 1}-stub")
+    elif opts.har:
+        from HARanalys import load_har
+        ep = Endpoints.from_har(load_har(opts.har), opts.url)
+    else:
+        ep = Endpoints(opts.url)
+    if opts.dump_endpoints:
+        print(ep.describe())
+        return None, state
+    try:
+        return await run(creds, ep, opts), state
+    finally:
+        if server is not None:
+            server.close()
+
+def main():
+    opts = parse_args()
+    if opts.with_stub and not opts.credentials:
+        creds = stub_credentials(opts.agents or AGENTS)
+    else:
+        from agentdrain import load_credentials
+        creds = load_credentials(opts.credentials)
+        if opts.agents:
+            creds = creds[:opts.agents]
+
+    started = time.perf_counter()
+    stats, state = asyncio.run(amain(opts, creds))
+    if stats is None:
+        return
+    print_report(stats, len(creds), time.perf_counter() - started)
+    ui_failed = False
+    if state is not None:
+        closed = sum(1 for c in state.chats.values() if c["status"] == "closed")
+        print(f"Stub check: закрыто {closed}/{len(state.chats)}")
+    if opts.verify_ui and stats.closed_ids:
+        matched, stuck = verify_ui(creds[0], opts.ui_url or os.getenv("VIVAI_URL", ""), stats.closed_ids)
+        if not matched:
+            ui_check = "FAIL: ни одна карточка не сопоставлена с id чатов из API"
+        elif stuck:
+            ui_check = f"FAIL: {stuck} из {matched} сопоставленных чатов не закрыты в UI"
+        else:
+            ui_check = f"OK ({matched} сопоставленных чатов закрыты)"
+        ui_failed = not matched or bool(stuck)
+        print(f"UI check: {ui_check}")
+    if opts.hist_json:
+        stats.stages.to_json(opts.hist_json)
+    if opts.hist_csv:
+        stats.stages.to_csv(opts.hist_csv)
+    if ui_failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
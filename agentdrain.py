@@ -0,0 +1,162 @@
+"""
+Параллельная разборка очереди чатов несколькими агентами.
+
+Каждый агент — отдельный процесс со своим Chrome и своей учёткой из CSV;
+сценарий агента — open_workspace()/drain() из OpenAgentSide.py
+(с сохранённой сессией повторный логин не нужен, см. agentsession.py). Чтобы два агента не
+открыли одну карточку, перед кликом чат столбится в общем SQLite-реестре
+(claims.py) по id карточки.
+
+CSV с учётками (первая строка — заголовок; url можно не указывать):
+    username,password,url
+    agent1@test,secret1,
+    agent2@test,secret2,
+
+    python agentdrain.py agents.csv --agents 4
+"""
+import argparse
+import csv
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from latency import StageStats
+
+# ====================== НАСТРОЙКИ ======================
+CLAIMS_DB = Path("claims.sqlite")
+STAGGER_S = 2.0         # пауза между стартами агентов, чтобы не логиниться всем разом
+
+def load_credentials(path: Path) -> list:
+    with path.open(newline="", encoding="utf-8") as f:
+        rows = [{k.strip().lower(): (v or "").strip() for k, v in row.items() if k}
+                for row in csv.DictReader(f)]
+    rows = [r for r in rows if r.get("username") and r.get("password")]
+    if not rows:
+        raise SystemExit(f"{path}: нет строк с username,password")
+    return rows
+
+def run_agent(cred: dict, opts, delay: float) -> dict:
+    """Один агент в своём процессе: логин, разборка очереди, итог."""
+    # импорт здесь: у каждого процесса своя фабрика драйверов и свой chromedriver
+    import OpenAgentSide as agent
+    from claims import ClaimRegistry
+    from resultsink import ResultSink
+    from selenium.webdriver.support.ui import WebDriverWait
+
+    time.sleep(delay)
+    name = cred["username"]
+    stats = {"agent": name, "processed": 0, "failed": 0, "login_s": 0.0, "drain_s": 0.0, "error": None,
+             "phases": StageStats()}
+    claims = ClaimRegistry(opts.claims, agent=name)
+    sink = None
+    if opts.results_dir:
+        safe = "".join(ch if ch.isalnum() else "_" for ch in name)
+        sink = ResultSink(opts.results_dir / f"agent_{safe}.jsonl", engine="selenium-agent")
+    driver = None
+    try:
+        driver = agent.make_driver()
+        wait = WebDriverWait(driver, 10)
+        t = time.perf_counter()
+        agent.open_workspace(driver, wait, cred.get("url") or opts.url, name, cred["password"])
+        stats["login_s"] = time.perf_counter() - t
+        t = time.perf_counter()
+        stats["processed"], stats["failed"] = agent.drain(driver, wait, sink, claims.claim, claims.finish,
+                                                           stats["phases"])
+        stats["drain_s"] = time.perf_counter() - t
+    except Exception as e:
+        stats["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if driver is not None:
+            agent.quit_driver(driver)
+        agent.DRIVERS.close()   # chromedriver этого процесса
+        claims.close()
+        if sink:
+            sink.close()
+    return stats
+
+def cpu_seconds() -> float:
+    """CPU этого процесса + завершённых дочерних (воркеры, chromedriver, Chrome)."""
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+def capacity_line(agents: int, processed: int, elapsed: float, cpu: float) -> str:
+    """Одна строка для сравнения движков (Selenium здесь, Playwright — fastagent.py)."""
+    busy = cpu / elapsed if elapsed else 0.0        # сколько ядер в среднем было занято
+    per_chat = cpu / processed if processed else 0.0
+    per_core = agents / busy if busy else 0.0
+    return (f"CPU: {cpu:.1f} с (~{busy:.2f} ядра), {per_chat:.2f} с CPU на чат, "
+            f"~{per_core:.1f} агентов на ядро")
+
+def merge_phases(results: list) -> StageStats:
+    phases = StageStats()
+    for r in results:
+        phases.merge(r["phases"])
+    return phases
+
+def print_report(results: list, elapsed: float, phases: StageStats) -> None:
+    total = sum(r["processed"] for r in results)
+    print(f"\nDone. Обработано чатов: {total} агентами: {len(results)} за {elapsed:.1f} с"
+          f" ({total / elapsed * 60:.1f} chats/min)")
+    print(f"{'agent':<28}{'done':>6}{'failed':>8}{'login, s':>10}{'drain, s':>10}{'chats/min':>11}")
+    for r in sorted(results, key=lambda r: r["agent"]):
+        rate = r["processed"] / r["drain_s"] * 60 if r["drain_s"] else 0.0
+        print(f"{r['agent']:<28}{r['processed']:>6}{r['failed']:>8}"
+              f"{r['login_s']:>10.1f}{r['drain_s']:>10.1f}{rate:>11.1f}")
+        if r["error"]:
+            print(f"    ошибка: {r['error']}")
+    if phases.stages:
+        print("Фазы обработки чата (все агенты):")
+        print(phases.format_table())
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Разобрать очередь чатов несколькими агентами параллельно")
+    ap.add_argument("credentials", type=Path, help="CSV: username,password[,url]")
+    ap.add_argument("--agents", type=int, default=0, help="сколько агентов запустить (по умолчанию все из CSV)")
+    ap.add_argument("--url", default=os.getenv("VIVAI_URL", ""), help="URL логина, если не задан в CSV")
+    ap.add_argument("--claims", type=Path, default=CLAIMS_DB, help="SQLite-реестр взятых чатов")
+    ap.add_argument("--keep-claims", action="store_true",
+                    help="не очищать реестр перед стартом (продолжить прошлую разборку)")
+    ap.add_argument("--stagger", type=float, default=STAGGER_S)
+    ap.add_argument("--results-dir", type=Path, default=None,
+                    help="писать JSONL по каждому агенту в эту папку")
+    ap.add_argument("--phases-json", type=Path, default=None, help="перцентили фаз по всем агентам (JSON)")
+    ap.add_argument("--phases-csv", type=Path, default=None)
+    return ap.parse_args(argv)
+
+def main():
+    opts = parse_args()
+    creds = load_credentials(opts.credentials)
+    if opts.agents:
+        creds = creds[:opts.agents]
+
+    from claims import ClaimRegistry
+    registry = ClaimRegistry(opts.claims, agent="orchestrator")
+    if not opts.keep_claims:
+        registry.reset()
+
+    started = time.perf_counter()
+    cpu_started = cpu_seconds()
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(creds), mp_context=ctx) as ex:
+        futures = [ex.submit(run_agent, cred, opts, n * opts.stagger) for n, cred in enumerate(creds)]
+        for fut in as_completed(futures):
+            r = fut.result()
+            results.append(r)
+            print(f"[{r['agent']}] закончил: {r['processed']} чатов"
+                  + (f", ошибка: {r['error']}" if r["error"] else ""))
+    phases = merge_phases(results)
+    elapsed = time.perf_counter() - started
+    print_report(results, elapsed, phases)
+    print(capacity_line(len(results), sum(r["processed"] for r in results), elapsed,
+                        cpu_seconds() - cpu_started))
+    if opts.phases_json:
+        phases.to_json(opts.phases_json)
+    if opts.phases_csv:
+        phases.to_csv(opts.phases_csv)
+    registry.close()
+
+if __name__ == "__main__":
+    main()
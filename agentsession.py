@@ -0,0 +1,130 @@
+"""
+Сохранение и повторное использование авторизованной сессии агента (Selenium).
+
+После первого логина сохраняем cookies, localStorage и URL раздела Direct
+в JSON; следующие запуски (и параллельные воркеры с той же учёткой) сразу
+открывают Direct, минуя форму логина и навигацию по меню.
+
+    path = session_path("agent1@test")
+    if not restore_session(driver, path, ready_loc):
+        login(...)                       # обычный логин через UI
+        save_session(driver, path)
+
+Cookies ставятся через CDP Network.setCookies ещё до первой навигации,
+localStorage — скриптом, который Chrome выполнит до скриптов приложения.
+Протухшая сессия распознаётся по форме логина (или редиректу на /auth/login):
+restore_session() вернёт False, и вызывающий код просто логинится заново.
+"""
+import json
+import os
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+# ====================== НАСТРОЙКИ ======================
+SESSION_DIR = Path(os.getenv("VIVAI_SESSION_DIR", "sessions"))
+MAX_AGE_S = 12 * 3600            # старше — даже не пробуем, сразу логин
+LOGIN_LOC = (By.NAME, "username")
+RESTORE_TIMEOUT_S = 15
+
+LOCAL_STORAGE_DUMP_JS = """
+const out = {};
+for (let i = 0; i < localStorage.length; i++) {
+    const k = localStorage.key(i);
+    out[k] = localStorage.getItem(k);
+}
+return out;
+"""
+
+# выполняется в каждом новом документе до скриптов страницы
+LOCAL_STORAGE_SEED_JS = """
+(() => {
+    if (location.origin !== %s) return;
+    const items = %s;
+    try { for (const k in items) localStorage.setItem(k, items[k]); } catch (e) {}
+})();
+"""
+
+def session_path(username: str) -> Path:
+    safe = "".join(ch if ch.isalnum() else "_" for ch in username)
+    return SESSION_DIR / f"{safe}.json"
+
+def save_session(driver, path: Path) -> None:
+    """Сохранить cookies/localStorage и текущий URL (должен быть раздел Direct)."""
+    url = driver.current_url
+    data = {
+        "saved_at": time.time(),
+        "url": url,
+        "origin": "{0.scheme}://{0.netloc}".format(urlsplit(url)),
+        # все cookies контекста: авторизация может жить и на домене API
+        "cookies": driver.execute_cdp_cmd("Network.getAllCookies", {}).get("cookies", []),
+        "local_storage": driver.execute_script(LOCAL_STORAGE_DUMP_JS) or {},
+    }
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)      # атомарно: параллельные воркеры не прочитают половину файла
+
+def load_session(path: Path, max_age: float = MAX_AGE_S):
+    try:
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if time.time() - data.get("saved_at", 0) > max_age or not data.get("url"):
+        return None
+    return data
+
+def _cookie_params(cookie: dict) -> dict:
+    keep = ("name", "value", "domain", "path", "secure", "httpOnly", "sameSite", "expires")
+    params = {k: cookie[k] for k in keep if k in cookie}
+    if params.get("expires", 0) <= 0:
+        params.pop("expires", None)     # сессионная cookie
+    return params
+
+def restore_session(driver, path: Path, ready_loc, timeout: float = RESTORE_TIMEOUT_S,
+                    max_age: float = MAX_AGE_S) -> bool:
+    """
+    Открыть сохранённый раздел Direct с сохранёнными cookies/localStorage.
+    True — сессия жива (появился ready_loc); False — файла нет/устарел или
+    сервер отправил на логин (тогда нужно залогиниться и save_session()).
+    """
+    data = load_session(path, max_age)
+    if data is None:
+        return False
+
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setCookies", {"cookies": [_cookie_params(c) for c in data["cookies"]]})
+    seed = driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
+        "source": LOCAL_STORAGE_SEED_JS % (json.dumps(data["origin"]),
+                                           json.dumps(data["local_storage"], ensure_ascii=False)),
+    })
+    alive = False
+    try:
+        driver.get(data["url"])
+        WebDriverWait(driver, timeout).until(EC.any_of(
+            EC.presence_of_element_located(ready_loc),
+            EC.presence_of_element_located(LOGIN_LOC),
+            EC.url_contains("/auth/login"),
+        ))
+        alive = ("/auth/login" not in driver.current_url and not driver.find_elements(*LOGIN_LOC)
+                 and bool(driver.find_elements(*ready_loc)))
+        return alive
+    except TimeoutException:
+        return False
+    finally:
+        if not alive:
+            # протухшие cookies/токены не должны мешать обычному логину
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            try:
+                driver.execute_script("localStorage.clear();")
+            except Exception:
+                pass
+        # дальше (в т.ч. при повторном логине) localStorage не подменяем
+        driver.execute_cdp_cmd("Page.removeScriptToEvaluateOnNewDocument",
+                               {"identifier": seed["identifier"]})
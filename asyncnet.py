@@ -0,0 +1,243 @@
+"""
+Минимальный asyncio-клиент HTTP/1.1 и WebSocket без браузера.
+
+Построен на sans-IO библиотеках из requirements.txt (h11, wsproto), поэтому
+тысячи сессий в одном процессе стоят только сокетов и парсинга — без
+Chromium и без лишних зависимостей.
+
+    client = HttpClient()
+    resp = await client.request("POST", "https://host/negotiate", body=b"{}")
+    ws = await WebSocket.connect("wss://host/hub?id=...")
+    await ws.send_text('{"protocol":"json","version":1}\\x1e')
+    frame = await ws.recv_text()
+"""
+import asyncio
+import ssl
+from collections import deque
+from typing import Optional
+from urllib.parse import urlsplit
+
+import h11
+from wsproto import ConnectionType, WSConnection
+from wsproto.events import (
+    AcceptConnection,
+    BytesMessage,
+    CloseConnection,
+    Ping,
+    RejectConnection,
+    RejectData,
+    Request,
+    TextMessage,
+)
+
+READ_CHUNK = 65536
+
+_ssl_default: Optional[ssl.SSLContext] = None
+_ssl_insecure: Optional[ssl.SSLContext] = None
+
+def ssl_context(verify: bool = True) -> ssl.SSLContext:
+    """Один SSL-контекст на процесс (создание контекста — дорогая операция)."""
+    global _ssl_default, _ssl_insecure
+    if verify:
+        if _ssl_default is None:
+            _ssl_default = ssl.create_default_context()
+        return _ssl_default
+    if _ssl_insecure is None:
+        ctx = ssl.create_default_context()
+        ctx.check_hostname = False
+        ctx.verify_mode = ssl.CERT_NONE
+        _ssl_insecure = ctx
+    return _ssl_insecure
+
+class ConnectionClosed(Exception):
+    pass
+
+class HttpResponse:
+    __slots__ = ("status", "headers", "body")
+
+    def __init__(self, status: int, headers: dict, body: bytes):
+        self.status = status
+        self.headers = headers   # имена в нижнем регистре
+        self.body = body
+
+    def text(self) -> str:
+        return self.body.decode("utf-8", errors="replace")
+
+def _split(url: str):
+    parts = urlsplit(url)
+    secure = parts.scheme in ("https", "wss")
+    port = parts.port or (443 if secure else 80)
+    target = parts.path or "/"
+    if parts.query:
+        target += "?" + parts.query
+    host_header = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+    return parts.hostname, port, secure, target, host_header
+
+async def _open(host: str, port: int, secure: bool, verify: bool):
+    return await asyncio.open_connection(
+        host, port,
+        ssl=ssl_context(verify) if secure else None,
+        server_hostname=host if secure else None,
+    )
+
+class _HttpConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.conn = h11.Connection(our_role=h11.CLIENT)
+
+    async def request(self, method: str, target: str, headers: list, body: bytes) -> HttpResponse:
+        out = self.conn.send(h11.Request(method=method, target=target, headers=headers))
+        if body:
+            out += self.conn.send(h11.Data(data=body))
+        out += self.conn.send(h11.EndOfMessage())
+        self.writer.write(out)
+        await self.writer.drain()
+
+        status, resp_headers, chunks = 0, {}, []
+        while True:
+            event = self.conn.next_event()
+            if event is h11.NEED_DATA:
+                data = await self.reader.read(READ_CHUNK)
+                self.conn.receive_data(data)
+                continue
+            if isinstance(event, h11.Response):
+                status = event.status_code
+                resp_headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in event.headers}
+            elif isinstance(event, h11.Data):
+                chunks.append(bytes(event.data))
+            elif isinstance(event, h11.EndOfMessage):
+                break
+            elif isinstance(event, h11.ConnectionClosed):
+                raise ConnectionClosed("сервер закрыл соединение посреди ответа")
+        return HttpResponse(status, resp_headers, b"".join(chunks))
+
+    def reusable(self) -> bool:
+        if self.conn.our_state is h11.DONE and self.conn.their_state is h11.DONE:
+            self.conn.start_next_cycle()
+            return True
+        return False
+
+    def close(self) -> None:
+        self.writer.close()
+
+class HttpClient:
+    """HTTP-клиент одной сессии: по одному keep-alive соединению на origin."""
+
+    def __init__(self, verify: bool = True, default_headers: Optional[dict] = None):
+        self.verify = verify
+        self.default_headers = dict(default_headers or {})
+        self._conns = {}
+
+    async def request(self, method: str, url: str, headers: Optional[dict] = None,
+                      body: bytes = b"") -> HttpResponse:
+        host, port, secure, target, host_header = _split(url)
+        key = (host, port, secure)
+        merged = {**self.default_headers, **(headers or {})}
+        hdrs = [("Host", host_header), ("Content-Length", str(len(body)))]
+        hdrs += [(k, v) for k, v in merged.items() if k.lower() not in ("host", "content-length")]
+
+        conn = self._conns.pop(key, None)
+        if conn is None:
+            conn = _HttpConnection(*await _open(host, port, secure, self.verify))
+        try:
+            resp = await conn.request(method, target, hdrs, body)
+        except BaseException:
+            conn.close()
+            raise
+        if conn.reusable():
+            self._conns[key] = conn
+        else:
+            conn.close()
+        return resp
+
+    async def close(self) -> None:
+        for conn in self._conns.values():
+            conn.close()
+        self._conns.clear()
+
+class WebSocket:
+    """Клиентский WebSocket поверх wsproto: текстовые кадры, ping/close обрабатываются сами."""
+
+    def __init__(self, reader, writer, ws: WSConnection):
+        self.reader = reader
+        self.writer = writer
+        self.ws = ws
+        self.closed = False
+        self._texts = deque()
+        self._partial = []
+
+    @classmethod
+    async def connect(cls, url: str, headers: Optional[dict] = None, subprotocols=(),
+                      verify: bool = True) -> "WebSocket":
+        host, port, secure, target, host_header = _split(url)
+        reader, writer = await _open(host, port, secure, verify)
+        ws = WSConnection(ConnectionType.CLIENT)
+        writer.write(ws.send(Request(
+            host=host_header,
+            target=target,
+            extra_headers=[(k.encode(), v.encode()) for k, v in (headers or {}).items()],
+            subprotocols=list(subprotocols),
+        )))
+        await writer.drain()
+        sock = cls(reader, writer, ws)
+        while True:
+            data = await reader.read(READ_CHUNK)
+            if not data:
+                writer.close()
+                raise ConnectionClosed("соединение закрыто во время handshake")
+            ws.receive_data(data)
+            for event in ws.events():
+                if isinstance(event, AcceptConnection):
+                    sock._pump()   # кадры, пришедшие вместе с ответом на handshake
+                    return sock
+                if isinstance(event, (RejectConnection, RejectData)):
+                    writer.close()
+                    raise ConnectionClosed(f"handshake отклонён: {getattr(event, 'status_code', '')}")
+
+    async def send_text(self, text: str) -> None:
+        if self.closed:
+            raise ConnectionClosed("websocket закрыт")
+        self.writer.write(self.ws.send(TextMessage(data=text)))
+        await self.writer.drain()
+
+    def _pump(self) -> None:
+        for event in self.ws.events():
+            if isinstance(event, TextMessage):
+                self._partial.append(event.data)
+                if event.message_finished:
+                    self._texts.append("".join(self._partial))
+                    self._partial.clear()
+            elif isinstance(event, BytesMessage):
+                if event.message_finished:
+                    self._texts.append(bytes(event.data).decode("utf-8", errors="replace"))
+            elif isinstance(event, Ping):
+                self.writer.write(self.ws.send(event.response()))
+            elif isinstance(event, CloseConnection):
+                try:
+                    self.writer.write(self.ws.send(event.response()))
+                except Exception:
+                    pass
+                self.closed = True
+
+    async def recv_text(self) -> str:
+        while not self._texts:
+            if self.closed:
+                raise ConnectionClosed("websocket закрыт сервером")
+            data = await self.reader.read(READ_CHUNK)
+            if not data:
+                self.closed = True
+                raise ConnectionClosed("websocket: соединение оборвано")
+            self.ws.receive_data(data)
+            self._pump()
+        return self._texts.popleft()
+
+    async def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            try:
+                self.writer.write(self.ws.send(CloseConnection(code=1000)))
+                await self.writer.drain()
+            except Exception:
+                pass
+        self.writer.close()
@@ -0,0 +1,207 @@
+"""
+Поток CDP-событий сети вкладки Selenium — вместо опроса get_log("performance").
+
+Подключаемся вторым клиентом к DevTools той же вкладки (debuggerAddress из
+capabilities chromedriver), включаем Network и в фоновом потоке читаем события
+по мере прихода:
+    - webSocketFrameReceived / eventSourceMessageReceived — payload;
+    - responseReceived (URL с ключевыми словами) + loadingFinished -> getResponseBody.
+Все токены вида [ABCDE] из них складываются в dict, так что проверка
+«пришёл ли токен» — поиск по ключу, а ожидание будится сразу по приходу кадра.
+Токены, пришедшие раньше, чем их начали ждать, не теряются.
+
+Кадры SignalR-хаба агента (agent-events-hub) дополнительно разбираются: момент
+первого события по каждому chatId лежит в chat_events (time.time()) — по нему
+считается, сколько чат ждал в очереди до клика агента.
+
+    stream = CdpTokenStream.attach(driver)     # None, если DevTools недоступен
+    ...
+    ok = stream.wait_for("ABCDE", timeout=60)
+    stream.close()
+
+Ограничение: события только этой вкладки (cross-origin iframe — отдельный target).
+"""
+import base64
+import itertools
+import json
+import re
+import socket
+import threading
+import time
+from typing import Optional
+from urllib.request import urlopen
+
+import websocket
+
+# токен в тексте сообщения: "... [ABCDE]" (алфавит как в _rand_token)
+TOKEN_RE = re.compile(r"\[([A-HJ-NP-Z2-9]{5})\]")
+# у каких XHR смотреть тело ответа
+URL_KEYS = ("agent-events", "events", "hub", "chat")
+# websocket'ы, чьи события по чатам запоминаем в chat_events
+HUB_KEYS = ("agent-events-hub",)
+REC_SEP = "\x1e"  # SignalR record separator
+CHAT_ID_KEYS = ("chatId", "ChatId", "conversationId", "id", "Id")   # как в HARanalys.guess_chat_id
+CONNECT_TIMEOUT_S = 5
+SEEN_MAX = 10000    # токенов в seen; чужие (не наши) токены из кадров не забываются — старые выкидываем
+
+_FRAME_EVENTS = ('"Network.webSocketFrameReceived"', '"Network.eventSourceMessageReceived"')
+
+def hub_chat_ids(payload: str) -> list:
+    """chatId из кадра SignalR-хаба: по одному на вызов (SendEvent({...}) и похожие)."""
+    ids = []
+    for part in payload.split(REC_SEP):
+        try:
+            msg = json.loads(part) if part.strip() else None
+        except ValueError:
+            continue
+        if not isinstance(msg, dict) or msg.get("type") != 1:
+            continue
+        for arg in msg.get("arguments") or ():
+            chat_id = next((arg[k] for k in CHAT_ID_KEYS if isinstance(arg, dict)
+                            and isinstance(arg.get(k), (str, int))), None)
+            if chat_id is not None:
+                ids.append(str(chat_id))
+                break
+    return ids
+
+class CdpTokenStream:
+    def __init__(self, ws_url: str, token_re=TOKEN_RE, url_keys=URL_KEYS, hub_keys=HUB_KEYS):
+        self.token_re = token_re
+        self.url_keys = tuple(url_keys)
+        self.hub_keys = tuple(hub_keys)
+        self.seen = {}              # токен -> perf_counter() первого появления
+        self.chat_events = {}       # chatId -> time.time() первого события хаба по нему
+        self._hub_sockets = set()   # requestId websocket'ов хаба
+        self.closed = False
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._watched = set()       # requestId ответов, чьё тело надо прочитать
+        self._body_calls = {}       # id команды getResponseBody -> requestId
+        self._ws = websocket.create_connection(ws_url, timeout=CONNECT_TIMEOUT_S, suppress_origin=True)
+        self._ws.settimeout(None)
+        self._send("Network.enable", {})
+        self._thread = threading.Thread(target=self._run, name="cdp-stream", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def attach(cls, driver, **kwargs) -> Optional["CdpTokenStream"]:
+        """Поток для текущей вкладки драйвера или None (нет debuggerAddress, удалённый грид и т.п.)."""
+        address = (driver.capabilities.get("goog:chromeOptions") or {}).get("debuggerAddress")
+        if not address:
+            return None
+        try:
+            with urlopen(f"http://{address}/json", timeout=CONNECT_TIMEOUT_S) as resp:
+                targets = json.load(resp)
+            handle = driver.current_window_handle
+            pages = [t for t in targets if t.get("type") == "page" and t.get("webSocketDebuggerUrl")]
+            target = next((t for t in pages if t.get("id") == handle), pages[0] if pages else None)
+            if target is None:
+                return None
+            return cls(target["webSocketDebuggerUrl"], **kwargs)
+        except (OSError, ValueError, websocket.WebSocketException):
+            return None
+
+    # ---------- ожидание ----------
+
+    def wait_for(self, token: str, timeout: float) -> bool:
+        with self._cond:
+            self._cond.wait_for(lambda: token in self.seen or self.closed, timeout)
+            return token in self.seen
+
+    def wait_any(self, tokens, timeout: float) -> set:
+        """Ждать, пока придёт хотя бы один из tokens; вернуть пришедшие (пусто — таймаут)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.closed or any(t in self.seen for t in tokens), timeout)
+            return {t for t in tokens if t in self.seen}
+
+    def forget(self, token: str) -> None:
+        with self._cond:
+            self.seen.pop(token, None)
+
+    # ---------- фоновый поток ----------
+
+    def _send(self, method: str, params: dict) -> int:
+        call_id = next(self._ids)
+        with self._send_lock:
+            self._ws.send(json.dumps({"id": call_id, "method": method, "params": params}))
+        return call_id
+
+    def _index(self, text: str) -> None:
+        found = self.token_re.findall(text)
+        if not found:
+            return
+        now = time.perf_counter()
+        with self._cond:
+            for token in found:
+                self.seen.setdefault(token, now)
+            if len(self.seen) > SEEN_MAX:
+                for token in list(self.seen)[:len(self.seen) - SEEN_MAX // 2]:   # dict — в порядке вставки
+                    del self.seen[token]
+            self._cond.notify_all()
+
+    def _run(self) -> None:
+        try:
+            while True:
+                raw = self._ws.recv()
+                if not raw:
+                    break
+                # кадры — самый частый случай: токены ищем прямо в сыром JSON, без разбора
+                if any(e in raw for e in _FRAME_EVENTS):
+                    self._index(raw)
+                    if self._hub_sockets and any(rid in raw for rid in self._hub_sockets):
+                        self._on_hub_frame(json.loads(raw).get("params") or {})
+                    continue
+                if ('"Network.responseReceived"' not in raw and '"Network.loadingFinished"' not in raw
+                        and '"Network.webSocketCreated"' not in raw
+                        and not (self._body_calls and raw.startswith('{"id"'))):
+                    continue
+                msg = json.loads(raw)
+                if "id" in msg:
+                    self._on_reply(msg)
+                    continue
+                params = msg.get("params") or {}
+                if msg.get("method") == "Network.webSocketCreated":
+                    if any(k in (params.get("url") or "") for k in self.hub_keys):
+                        self._hub_sockets.add(params.get("requestId"))
+                elif msg.get("method") == "Network.responseReceived":
+                    url = (params.get("response") or {}).get("url") or ""
+                    if any(k in url for k in self.url_keys):
+                        self._watched.add(params.get("requestId"))
+                elif msg.get("method") == "Network.loadingFinished":
+                    request_id = params.get("requestId")
+                    if request_id in self._watched:
+                        self._watched.discard(request_id)
+                        call_id = self._send("Network.getResponseBody", {"requestId": request_id})
+                        self._body_calls[call_id] = request_id
+        except (OSError, websocket.WebSocketException, ValueError):
+            pass  # браузер закрыли или соединение оборвалось
+        finally:
+            with self._cond:
+                self.closed = True
+                self._cond.notify_all()
+
+    def _on_hub_frame(self, params: dict) -> None:
+        if params.get("requestId") not in self._hub_sockets:
+            return
+        now = time.time()
+        for chat_id in hub_chat_ids((params.get("response") or {}).get("payloadData") or ""):
+            self.chat_events.setdefault(chat_id, now)
+
+    def _on_reply(self, msg: dict) -> None:
+        if self._body_calls.pop(msg["id"], None) is None:
+            return
+        result = msg.get("result") or {}
+        body = result.get("body") or ""
+        if result.get("base64Encoded"):
+            body = base64.b64decode(body).decode("utf-8", "replace")
+        self._index(body)
+
+    def close(self) -> None:
+        try:
+            # без close-рукопожатия: SHUT_RDWR будит recv() в фоновом потоке
+            self._ws.sock.shutdown(socket.SHUT_RDWR)
+        except (OSError, AttributeError):
+            pass
+        self._ws.shutdown()
+        self._thread.join(timeout=2)
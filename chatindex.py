@@ -0,0 +1,155 @@
+"""
+Индекс карточек списка Ongoing по id чата (Selenium).
+
+Вместо find_elements + проверки каждой карточки отдельным запросом к
+chromedriver — один execute_script на проход: браузер сам вычисляет id
+и признак «закрыт» и возвращает только карточки, которых индекс ещё не
+знает как обработанные/закрытые. Следующий открытый чат — первый ключ
+упорядоченного dict, без повторного обхода списка.
+
+    index = ChatIndex(ONGOING_CHATS_XPATH)
+    index.refresh(driver)
+    chat_id, el = index.next_open()
+    ...
+    index.mark_processed(chat_id)
+    index.remove_closed(driver)      # все крестики закрытых — одним вызовом
+"""
+import time
+
+# id карточки: атрибуты, если они есть. Иначе — запасной ключ с префиксом "~"
+# из первой строки (имя клиента): превью меняется после каждого сообщения, и
+# тот же чат получил бы новый ключ. Чтобы другой клиент с тем же именем не
+# пропускался вечно, ChatIndex забывает обработанные ключи, карточек которых
+# в списке больше нет.
+FALLBACK_KEY_PREFIX = "~"
+
+CARD_KEY_FN = """
+function cardKey(el) {
+    const holder = el.closest('app-chat-item') || el;
+    for (const n of [el, holder]) {
+        const id = n.getAttribute('data-chat-id') || n.getAttribute('data-id') || n.id;
+        if (id) return id;
+    }
+    return '~' + ((el.innerText || '').split('\\n').map(s => s.trim()).filter(Boolean)[0] || '');
+}
+"""
+
+_warned_fallback = False
+
+def note_card_key(key: str) -> str:
+    """Один раз на процесс предупредить, что у карточек нет id-атрибута. Возвращает key."""
+    global _warned_fallback
+    if key.startswith(FALLBACK_KEY_PREFIX) and not _warned_fallback:
+        _warned_fallback = True
+        print(f"⚠️ у карточек нет data-chat-id/data-id/id — ключ по тексту карточки: {key[:60]!r}")
+    return key
+
+# закрытый чат — класс closed-item / closed-item-light на карточке
+_CLOSED_FN = """
+function isClosed(el) {
+    return (el.getAttribute('class') || '').includes('closed-item');
+}
+"""
+
+# [[[id, closed, el], ...], [id, ...]]: карточки, чьих id нет в arguments[1] (уже
+# обработаны/закрыты), и те id из arguments[1], что ещё есть в списке;
+# одинаковые id в одном списке (совпали имена) различаем суффиксом #2, #3, ...
+LIST_STATE_JS = CARD_KEY_FN + _CLOSED_FN + """
+const done = new Set(arguments[1] || []);
+const r = document.evaluate(arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+const counts = {};
+const out = [], present = [];
+for (let i = 0; i < r.snapshotLength; i++) {
+    const el = r.snapshotItem(i);
+    let id = cardKey(el);
+    counts[id] = (counts[id] || 0) + 1;
+    if (counts[id] > 1) id += '#' + counts[id];
+    if (!done.has(id)) out.push([id, isClosed(el), el]);
+    else present.push(id);
+}
+return [out, present];
+"""
+
+# клик по крестику у всех закрытых карточек; вернуть, сколько нажали
+REMOVE_CLOSED_JS = _CLOSED_FN + """
+const r = document.evaluate(arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+let n = 0;
+for (let i = 0; i < r.snapshotLength; i++) {
+    const el = r.snapshotItem(i);
+    if (!isClosed(el)) continue;
+    const x = el.querySelector(arguments[1]);
+    if (x) { x.click(); n++; }
+}
+return n;
+"""
+
+REMOVE_ICON_CSS = ".close-icon i.pi-times"
+
+class ChatIndex:
+    def __init__(self, xpath: str, remove_icon_css: str = REMOVE_ICON_CSS):
+        self.xpath = xpath
+        self.remove_icon_css = remove_icon_css
+        # только карточки, что ещё в списке: ушедшие из списка забываем, иначе
+        # новый чат с тем же ключом (запасной ключ — имя клиента) пропускался бы
+        self.seen = {}          # id -> time.time() первого появления
+        self.processed = set()  # обработаны нами
+        self.closed = set()     # замечены закрытыми
+        self.cards = 0          # за весь прогон — для summary()
+        self.processed_total = 0
+        self.closed_total = 0
+        self._open = {}         # id -> WebElement, в порядке списка
+        self.prefetched = False  # очередь уже перечитана заранее (prefetch) — refresh не нужен
+
+    def refresh(self, driver) -> int:
+        """Перечитать список одним вызовом; вернуть число новых id."""
+        self.prefetched = False
+        rows, present = driver.execute_script(
+            LIST_STATE_JS, self.xpath, list(self.processed | self.closed)) or ([], [])
+        present = set(present)
+        gone = (self.processed | self.closed) - present
+        self.processed -= gone
+        self.closed -= gone
+        for chat_id in gone:
+            self.seen.pop(chat_id, None)
+        now = time.time()
+        new = 0
+        self._open = {}
+        for chat_id, closed, el in rows:
+            note_card_key(chat_id)
+            if chat_id not in self.seen:
+                self.seen[chat_id] = now
+                self.cards += 1
+                new += 1
+            if closed:
+                if chat_id not in self.closed:
+                    self.closed_total += 1
+                self.closed.add(chat_id)
+            else:
+                self._open[chat_id] = el
+        return new
+
+    def prefetch(self, driver, current: str) -> None:
+        """Перечитать список заранее, пока обрабатывается current: он в очередь не попадёт."""
+        self.refresh(driver)
+        self._open.pop(current, None)
+        self.prefetched = True
+
+    def next_open(self):
+        """(id, WebElement) первого открытого необработанного чата или (None, None)."""
+        for chat_id, el in self._open.items():
+            return chat_id, el
+        return None, None
+
+    def mark_processed(self, chat_id: str) -> None:
+        if chat_id not in self.processed:
+            self.processed_total += 1
+        self.processed.add(chat_id)
+        self._open.pop(chat_id, None)
+
+    def remove_closed(self, driver) -> int:
+        """Крестик у всех закрытых карточек — одним execute_script."""
+        return driver.execute_script(REMOVE_CLOSED_JS, self.xpath, self.remove_icon_css) or 0
+
+    def summary(self) -> str:
+        return (f"карточек: {self.cards}, обработано: {self.processed_total}, "
+                f"закрытых: {self.closed_total}")
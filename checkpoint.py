@@ -0,0 +1,76 @@
+"""
+Чекпоинт длинного прогона: какие индексы уже пройдены, какие падали.
+
+Файл только дописывается — по строке на завершённую попытку:
+    12 ok
+    13 fail TimeoutException
+Запись — одна короткая строка + flush, так что падение скрипта (или kill)
+теряет максимум ту попытку, что шла в этот момент. Недописанная последняя
+строка при загрузке игнорируется.
+
+    cp = Checkpoint(Path("multchat.state"), resume=True)
+    todo = cp.fresh(range(0, 20000))       # ещё не тронутые
+    ...
+    cp.mark(index, ok, error)
+    retry = cp.retryable(range(0, 20000), retries=2)   # упавшие, у кого остался бюджет
+"""
+import threading
+from pathlib import Path
+from typing import Optional
+
+class Checkpoint:
+    def __init__(self, path: Path, resume: bool = False):
+        self.path = Path(path)
+        self.done = set()
+        self.failures = {}      # индекс -> сколько раз падал
+        self._lock = threading.Lock()
+        if resume:
+            self._load()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = self.path.open("a" if resume else "w", encoding="utf-8")
+        if resume and self._f.tell() and not self.path.read_bytes().endswith(b"\n"):
+            self._f.write("\n")     # не приклеивать новые строки к оборванной
+
+    def _load(self) -> None:
+        try:
+            lines = self.path.read_text(encoding="utf-8").splitlines()
+        except FileNotFoundError:
+            return
+        for line in lines:
+            parts = line.split()
+            if len(parts) < 2 or not parts[0].lstrip("-").isdigit():
+                continue
+            index = int(parts[0])
+            if parts[1] == "ok":
+                self.done.add(index)
+            elif parts[1] == "fail":
+                self.failures[index] = self.failures.get(index, 0) + 1
+
+    def mark(self, index: int, ok: bool, error: Optional[str] = None) -> None:
+        line = f"{index} ok\n" if ok else f"{index} fail {error or 'Error'}\n"
+        with self._lock:
+            if ok:
+                self.done.add(index)
+            else:
+                self.failures[index] = self.failures.get(index, 0) + 1
+            self._f.write(line)
+            self._f.flush()
+
+    def fresh(self, indices) -> list:
+        """Индексы, которых ещё не было ни в успехах, ни в падениях."""
+        return [i for i in indices if i not in self.done and i not in self.failures]
+
+    def retryable(self, indices, retries: int) -> list:
+        """Упавшие и так и не пройденные, у которых попыток было не больше retries."""
+        return [i for i in indices
+                if i not in self.done and 0 < self.failures.get(i, 0) <= retries]
+
+    def close(self) -> None:
+        with self._lock:
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
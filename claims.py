@@ -0,0 +1,57 @@
+"""
+Общий реестр «кто какой чат взял» для нескольких агентов на одной машине.
+
+SQLite-файл, одна таблица с chat_id PRIMARY KEY: застолбить чат —
+INSERT OR IGNORE, и только один процесс получит rowcount == 1.
+Никаких блокировок сверх этого не нужно — атомарность даёт сама вставка.
+
+    claims = ClaimRegistry(Path("claims.sqlite"), agent="agent1")
+    if claims.claim(chat_id):
+        ...
+        claims.finish(chat_id, "ok")
+"""
+import sqlite3
+import time
+from pathlib import Path
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS claims (
+    chat_id    TEXT PRIMARY KEY,
+    agent      TEXT NOT NULL,
+    claimed_at REAL NOT NULL,
+    status     TEXT NOT NULL DEFAULT 'claimed'
+)
+"""
+
+class ClaimRegistry:
+    def __init__(self, path: Path, agent: str, timeout: float = 30.0):
+        self.path = Path(path)
+        self.agent = agent
+        # autocommit: каждая вставка — своя короткая транзакция
+        self._db = sqlite3.connect(str(self.path), timeout=timeout, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(SCHEMA)
+
+    def claim(self, chat_id: str) -> bool:
+        """True, если чат теперь наш; пустой id застолбить нельзя."""
+        if not chat_id:
+            return False
+        cur = self._db.execute(
+            "INSERT OR IGNORE INTO claims (chat_id, agent, claimed_at) VALUES (?, ?, ?)",
+            (chat_id, self.agent, time.time()))
+        return cur.rowcount == 1
+
+    def finish(self, chat_id: str, status: str) -> None:
+        self._db.execute("UPDATE claims SET status = ? WHERE chat_id = ? AND agent = ?",
+                         (status, chat_id, self.agent))
+
+    def reset(self) -> None:
+        self._db.execute("DELETE FROM claims")
+
+    def counts(self) -> dict:
+        """{(agent, status): сколько}."""
+        rows = self._db.execute("SELECT agent, status, COUNT(*) FROM claims GROUP BY agent, status")
+        return {(agent, status): n for agent, status, n in rows}
+
+    def close(self) -> None:
+        self._db.close()
@@ -0,0 +1,159 @@
+"""
+Ожидания на MutationObserver для Selenium: вместо sleep и опроса раз в 0.2–0.5 с.
+
+Один execute_async_script на ожидание: условие проверяется сразу и потом на
+каждую мутацию DOM, скрипт возвращается в ту же миллисекунду, когда оно
+выполнилось (или по таймауту). Никаких промежуточных запросов к chromedriver.
+
+    card_turns_grey(driver, card, timeout=4)
+    send_enabled(driver, SEND_XPATHS, timeout=3)
+    list_changed(driver, LIST_XPATH, first_card, timeout=6)
+    toasts_gone(driver, ".p-toast-message", timeout=6)
+    dom_quiet(driver, LIST_XPATH, quiet_ms=150, timeout=2)   # «устаканилось»
+
+Условие — тело JS-функции от args (массив переданных аргументов), которое
+возвращает truthy, когда дождались. Исключение внутри условия = «ещё нет».
+"""
+from selenium.common.exceptions import (JavascriptException, NoSuchWindowException,
+                                        StaleElementReferenceException, TimeoutException)
+
+_WAIT_TEMPLATE = """
+const done = arguments[arguments.length - 1];
+const timeoutMs = arguments[0], args = arguments[1];
+const byXPath = (xp, root) => document.evaluate(xp, root || document, null,
+        XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+const allByXPath = (xp) => {
+    const r = document.evaluate(xp, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    const out = [];
+    for (let i = 0; i < r.snapshotLength; i++) out.push(r.snapshotItem(i));
+    return out;
+};
+const visible = (el) => !!el && el.isConnected && !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+const pred = (args) => { /*PREDICATE*/ };
+let finished = false, obs = null, timer = null;
+const finish = (v) => {
+    if (finished) return;
+    finished = true;
+    if (obs) obs.disconnect();
+    clearTimeout(timer);
+    done(!!v);
+};
+const test = () => { let v = false; try { v = pred(args); } catch (e) {} if (v) finish(true); };
+test();
+if (!finished) {
+    obs = new MutationObserver(test);
+    obs.observe(document.documentElement, {subtree: true, childList: true, attributes: true, characterData: true});
+    timer = setTimeout(() => finish(false), timeoutMs);
+}
+"""
+
+_QUIET_TEMPLATE = """
+const done = arguments[arguments.length - 1];
+const timeoutMs = arguments[0], quietMs = arguments[1], xpath = arguments[2];
+const root = (xpath && document.evaluate(xpath, document, null,
+        XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue) || document.documentElement;
+let quiet = null, hard = null;
+const obs = new MutationObserver(() => { clearTimeout(quiet); quiet = setTimeout(() => finish(true), quietMs); });
+const finish = (v) => { obs.disconnect(); clearTimeout(quiet); clearTimeout(hard); done(v); };
+obs.observe(root, {subtree: true, childList: true, attributes: true, characterData: true});
+quiet = setTimeout(() => finish(true), quietMs);
+hard = setTimeout(() => finish(false), timeoutMs);
+"""
+
+def _ensure_script_timeout(driver, timeout: float) -> None:
+    # таймаут async-скрипта chromedriver должен быть больше нашего — ставим один раз с запасом
+    need = timeout + 5
+    if getattr(driver, "_domwait_script_timeout", 0) < need:
+        driver.set_script_timeout(max(need, 30))
+        driver._domwait_script_timeout = max(need, 30)
+
+# ожидание прервано не по нашей вине: навигация, закрытое окно, элемент из args пересоздан
+_INTERRUPTED = (TimeoutException, NoSuchWindowException, StaleElementReferenceException)
+
+def _navigated(e: JavascriptException) -> bool:
+    # так chromedriver сообщает о переходе страницы посреди async-скрипта
+    return "document unloaded" in (e.msg or "")
+
+def wait_until(driver, predicate_js: str, *args, timeout: float = 10) -> bool:
+    """
+    True, как только predicate_js(args) стал truthy; False по таймауту или если
+    ожидание прервала навигация. Ошибка в самом JS (синтаксис) — исключение.
+    """
+    _ensure_script_timeout(driver, timeout)
+    script = _WAIT_TEMPLATE.replace("/*PREDICATE*/", predicate_js)
+    try:
+        return bool(driver.execute_async_script(script, int(timeout * 1000), list(args)))
+    except _INTERRUPTED:
+        return False
+    except JavascriptException as e:
+        if _navigated(e):
+            return False
+        raise
+
+def dom_quiet(driver, xpath: str = None, quiet_ms: int = 150, timeout: float = 2) -> bool:
+    """Дождаться, что под xpath (или во всём документе) quiet_ms не было мутаций."""
+    _ensure_script_timeout(driver, timeout)
+    try:
+        return bool(driver.execute_async_script(_QUIET_TEMPLATE, int(timeout * 1000), quiet_ms, xpath))
+    except _INTERRUPTED:
+        return False
+    except JavascriptException as e:
+        if _navigated(e):
+            return False
+        raise
+
+# ---------- готовые условия ----------
+
+def present(driver, xpath: str, timeout: float = 10) -> bool:
+    return wait_until(driver, "return !!byXPath(args[0]);", xpath, timeout=timeout)
+
+def card_turns_grey(driver, card, timeout: float = 4) -> bool:
+    """Карточка стала серой/закрытой (или её пересоздали — тоже считаем обновлением)."""
+    return wait_until(driver, """
+        const el = args[0];
+        if (!el.isConnected) return true;
+        const cls = (el.getAttribute('class') || '').toLowerCase();
+        if (cls.includes('closed')) return true;
+        const badge = Array.from(el.querySelectorAll("span[class*='badge']"))
+                           .some(b => (b.textContent || '').toLowerCase().includes('closed'));
+        return badge || (el.innerText || '').toLowerCase().includes('closed');
+    """, card, timeout=timeout)
+
+def send_enabled(driver, xpaths, timeout: float = 4) -> bool:
+    """Первая видимая кнопка из xpaths включена (без disabled/p-disabled/loading/aria-disabled)."""
+    return wait_until(driver, """
+        for (const xp of args[0]) {
+            const btn = byXPath(xp);
+            if (!visible(btn)) continue;
+            const cls = (btn.getAttribute('class') || '').toLowerCase();
+            return !btn.hasAttribute('disabled') && !cls.includes('p-disabled')
+                && !cls.includes('p-button-loading')
+                && (btn.getAttribute('aria-disabled') || '').toLowerCase() !== 'true';
+        }
+        return false;
+    """, list(xpaths), timeout=timeout)
+
+def list_changed(driver, xpath: str, first, timeout: float = 6) -> bool:
+    """Верхний элемент списка xpath уже не first (или список опустел)."""
+    return wait_until(driver, "const top = byXPath(args[0]); return !top || top !== args[1];",
+                      xpath, first, timeout=timeout)
+
+def list_mutated(driver, xpath: str, timeout: float = 1) -> bool:
+    """Любое изменение в наборе карточек xpath: число, порядок или их атрибуты/текст."""
+    return wait_until(driver, """
+        const sig = () => allByXPath(args[0]).map(e => (e.getAttribute('class') || '') + '|' + e.innerText).join('\\n');
+        if (args.sig === undefined) { args.sig = sig(); return false; }   // снимок на входе
+        return sig() !== args.sig;
+    """, xpath, timeout=timeout)
+
+def toasts_gone(driver, css: str, timeout: float = 6) -> bool:
+    return wait_until(driver, "return !Array.from(document.querySelectorAll(args[0])).some(visible);",
+                      css, timeout=timeout)
+
+def value_cleared(driver, field, timeout: float = 5) -> bool:
+    """Поле ввода опустело — приложение приняло и отправило сообщение."""
+    return wait_until(driver, """
+        const el = args[0];
+        if (!el.isConnected) return true;
+        return ((el.isContentEditable ? el.innerText : el.value) || '').trim() === '';
+    """, field, timeout=timeout)
@@ -0,0 +1,247 @@
+"""
+Общая фабрика Selenium-драйверов Chrome с быстрым стартом.
+
+- один chromedriver (Service) на процесс — все сессии ходят в него, а не
+  поднимают свой: запуск драйвера = только запуск браузера;
+- профиль запуска без лишнего: headless, без расширений, фоновой сети,
+  first-run, компонент-апдейтера и троттлинга фоновых вкладок;
+- картинки можно отключить (images=False);
+- user-data-dir копируется из заранее прогретого шаблона (профиль уже создан,
+  first-run пройден) — Chrome не инициализирует его с нуля; шаблон один на
+  машину, собирается во временной папке и ставится на место os.replace —
+  параллельные процессы (agentdrain) не видят его недописанным;
+- по умолчанию без --incognito: каждый драйвер и так получает свою свежую
+  копию профиля, а в incognito Chrome её почти не использует;
+- время холодного старта каждого драйвера пишется в гистограмму (report()).
+
+    factory = DriverFactory(images=False)
+    driver = factory.new_driver()
+    ...
+    driver.quit()          # браузер закрыт, chromedriver живёт дальше
+    factory.close()        # остановить chromedriver
+    print(factory.report())
+
+CHROME_HEADED=1 в окружении — показывать окна (для отладки).
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chromium.remote_connection import ChromiumRemoteConnection
+from selenium.webdriver.common.driver_finder import DriverFinder
+from selenium.webdriver.remote.webdriver import WebDriver as RemoteWebDriver
+
+from latency import StageStats
+
+WINDOW_SIZE = (1550, 838)
+HEADLESS = os.getenv("CHROME_HEADED", "") not in ("1", "true", "yes")
+TEMPLATE_DIR = Path(tempfile.gettempdir()) / "automation-chrome-template"
+
+FAST_START_ARGS = (
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--no-service-autorun",
+    "--password-store=basic",
+    "--disable-extensions",
+    "--disable-component-extensions-with-background-pages",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-background-networking",
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-renderer-backgrounding",
+    "--disable-ipc-flooding-protection",
+    "--disable-client-side-phishing-detection",
+    "--disable-hang-monitor",
+    "--disable-breakpad",
+    "--disable-domain-reliability",
+    "--metrics-recording-only",
+    "--mute-audio",
+    "--disable-features=Translate,OptimizationHints,MediaRouter,CalculateNativeWinOcclusion,"
+    "InterestFeedContentSuggestions,AutofillServerCommunication",
+)
+
+class SharedServiceChrome(webdriver.Chrome):
+    """
+    webdriver.Chrome поверх уже запущенного chromedriver: __init__ не стартует
+    Service, quit() закрывает только браузер (и удаляет копию профиля).
+    """
+
+    def __init__(self, service: Service, options: webdriver.ChromeOptions,
+                 profile_dir: Optional[Path] = None):
+        self.service = service
+        self.profile_dir = profile_dir
+        executor = ChromiumRemoteConnection(
+            remote_server_addr=service.service_url,
+            browser_name="chrome",
+            vendor_prefix="goog",
+            keep_alive=True,
+            ignore_proxy=options._ignore_local_proxy,
+        )
+        try:
+            RemoteWebDriver.__init__(self, command_executor=executor, options=options)
+        except Exception:
+            self._remove_profile()
+            raise
+        self._is_remote = False
+
+    def quit(self) -> None:
+        try:
+            RemoteWebDriver.quit(self)
+        except Exception:
+            pass  # браузер уже мог упасть
+        finally:
+            self._remove_profile()
+
+    def _remove_profile(self) -> None:
+        if self.profile_dir is not None:
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+            self.profile_dir = None
+
+class DriverFactory:
+    def __init__(self, headless: bool = HEADLESS, images: bool = True, incognito: bool = False,
+                 perf_logs: bool = False, window_size: tuple = WINDOW_SIZE,
+                 template_dir: Optional[Path] = TEMPLATE_DIR, extra_args: tuple = ()):
+        self.headless = headless
+        self.images = images
+        self.incognito = incognito
+        self.perf_logs = perf_logs
+        self.window_size = window_size
+        self.template_dir = Path(template_dir) if template_dir else None
+        self.extra_args = tuple(extra_args)
+        self.stats = StageStats()
+        self.launched = 0
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._service: Optional[Service] = None
+        self._browser_path = None
+
+    # ---------- chromedriver ----------
+
+    def _ensure_service(self) -> Service:
+        with self._lock:
+            if self._service is None:
+                t = time.perf_counter()
+                service = Service()
+                finder = DriverFinder(service, self.options())
+                self._browser_path = finder.get_browser_path() or None
+                service.path = service.env_path() or finder.get_driver_path()
+                service.start()
+                self._service = service
+                self._record("service_start", time.perf_counter() - t)
+            return self._service
+
+    def close(self) -> None:
+        with self._lock:
+            if self._service is not None:
+                self._service.stop()
+                self._service = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---------- профиль ----------
+
+    def options(self, profile_dir: Optional[Path] = None,
+                incognito: Optional[bool] = None) -> webdriver.ChromeOptions:
+        options = webdriver.ChromeOptions()
+        if self.headless:
+            options.add_argument("--headless=new")
+        if self.incognito if incognito is None else incognito:
+            options.add_argument("--incognito")
+        options.add_argument(f"--window-size={self.window_size[0]},{self.window_size[1]}")
+        for arg in FAST_START_ARGS + self.extra_args:
+            options.add_argument(arg)
+        if not self.images:
+            options.add_argument("--blink-settings=imagesEnabled=false")
+            options.add_experimental_option(
+                "prefs", {"profile.managed_default_content_settings.images": 2})
+        options.add_experimental_option("excludeSwitches", ["enable-automation", "enable-logging"])
+        if self.perf_logs:
+            options.set_capability("goog:loggingPrefs", {"performance": "ALL", "browser": "ALL"})
+        if profile_dir is not None:
+            options.add_argument(f"--user-data-dir={profile_dir}")
+        if self._browser_path:
+            options.binary_location = self._browser_path
+        return options
+
+    def _prepare_template(self) -> None:
+        """
+        Один раз запустить Chrome на шаблонном профиле, чтобы он его создал.
+        Профиль собирается в своей временной папке рядом с шаблоном и ставится
+        на место одним os.replace: другой процесс видит либо готовый шаблон
+        (с .ready), либо никакого. Если два процесса собрали его одновременно,
+        побеждает первый, второй свою копию удаляет.
+        """
+        ready = self.template_dir / ".ready"
+        with self._lock:
+            if ready.exists():
+                return
+            self.template_dir.parent.mkdir(parents=True, exist_ok=True)
+            build = Path(tempfile.mkdtemp(prefix=self.template_dir.name + ".build-",
+                                          dir=self.template_dir.parent))
+            t = time.perf_counter()
+            try:
+                # без incognito — иначе Chrome не запишет профиль на диск
+                driver = SharedServiceChrome(self._service, self.options(build, incognito=False))
+                try:
+                    driver.get("about:blank")
+                finally:
+                    RemoteWebDriver.quit(driver)
+                (build / ".ready").touch()
+                self._install_template(build)
+            finally:
+                shutil.rmtree(build, ignore_errors=True)   # если поставить не удалось
+            self._record("template", time.perf_counter() - t)
+
+    def _install_template(self, build: Path) -> None:
+        ready = self.template_dir / ".ready"
+        for _ in range(2):
+            try:
+                os.replace(build, self.template_dir)
+                return
+            except OSError:
+                if ready.exists():
+                    return          # другой процесс успел раньше — берём его шаблон
+                # недособранный шаблон старой версии (без .ready) — убрать и повторить
+                shutil.rmtree(self.template_dir, ignore_errors=True)
+
+    def _copy_profile(self) -> Path:
+        target = Path(tempfile.mkdtemp(prefix="chrome-profile-"))
+        shutil.copytree(self.template_dir, target, dirs_exist_ok=True,
+                        ignore=shutil.ignore_patterns("Singleton*", "*.lock", "lockfile", ".ready"))
+        return target
+
+    # ---------- драйверы ----------
+
+    def new_driver(self) -> SharedServiceChrome:
+        service = self._ensure_service()
+        profile_dir = None
+        t = time.perf_counter()
+        if self.template_dir is not None:
+            self._prepare_template()
+            profile_dir = self._copy_profile()
+            self._record("profile_copy", time.perf_counter() - t)
+        driver = SharedServiceChrome(service, self.options(profile_dir), profile_dir)
+        self._record("cold_start", time.perf_counter() - t)
+        with self._lock:
+            self.launched += 1
+        return driver
+
+    def _record(self, stage: str, seconds: float) -> None:
+        with self._stats_lock:
+            self.stats.record(stage, seconds)
+
+    def report(self) -> str:
+        return f"Chrome cold start ({self.launched} запусков, один chromedriver):\n" \
+               + self.stats.format_table()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# fastagent.py
+# Агентская сторона на asyncio + Playwright: много агентов в одном процессе и одном браузере.
+# Usage:
+#   python fastagent.py agents.csv --agents 10
+#   python fastagent.py agents.csv --agents 10 --headed --phases-csv phases_pw.csv
+"""
+Те же шаги, что у Selenium-движка (OpenAgentSide.open_workspace/drain, agentdrain.py):
+логин → Chats → Direct, статус «Accepting chats», выбор следующей не серой
+карточки, отправка с подтверждением токена и модалка закрытия
+(Close → Yes → Submit → OK → карточка посерела).
+
+Отличия:
+- каждый агент — свой BrowserContext (свои cookies/вход) в одном общем Chromium,
+  все агенты — корутины одного event loop;
+- подтверждение отправки — fastchat.TokenTracker на page.on("websocket"),
+  без второго подключения к DevTools;
+- общий для процесса набор взятых карточек заменяет claims.py.
+
+Локаторы, JS снимка списка и фазы (PHASES) берутся из OpenAgentSide.py, а отчёт
+печатается в формате agentdrain.py — цифры двух движков сравниваются напрямую
+(chats/min, CPU на чат, агентов на ядро).
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from pathlib import Path
+from typing import Optional
+
+from playwright.async_api import Error as PWError, Page, TimeoutError as PWTimeout
+
+import OpenAgentSide as ui
+from agentdrain import capacity_line, cpu_seconds, load_credentials, merge_phases, print_report
+from cdpstream import HUB_KEYS, hub_chat_ids
+from chatindex import CARD_KEY_FN, note_card_key
+from fastchat import TokenTracker, launch_browser
+from latency import StageStats
+from resultsink import ResultSink, StepLog
+
+# ====================== НАСТРОЙКИ ======================
+AGENTS = 10                 # агентов (контекстов) в одном браузере
+STAGGER_S = 0.5             # пауза между логинами агентов
+TIMEOUT_MS = 10000          # ожидания на действия (как WebDriverWait(driver, 10))
+OPEN_TIMEOUT_MS = 8000      # открыть чат — дождаться поля ввода
+ECHO_TIMEOUT_MS = ui.CONFIRM_TIMEOUT * 1000
+MESSAGES_MIN, MESSAGES_MAX = 3, 7
+VIEWPORT = {"width": 1550, "height": 838}
+TOAST_CSS = "[class*='toast']"
+
+# JS снимка из OpenAgentSide (он для execute_script): здесь та же функция,
+# но без DOM-элементов в ответе — кликаем потом по id карточки
+SNAPSHOT_FN = ("function () { const cards = (function () {" + ui.CARD_SNAPSHOT_JS + "}).apply(null, arguments);"
+               " return cards.map(({el, ...card}) => card); }")
+
+# клик по карточке с этим id (как execute_script click в OpenAgentSide); индекс из снимка
+# мог устареть, если список успел перестроиться
+CLICK_CARD_FN = "([xpath, id]) => {" + CARD_KEY_FN + """
+    const r = document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    for (let i = 0; i < r.snapshotLength; i++) {
+        const el = r.snapshotItem(i);
+        if (cardKey(el) !== id) continue;
+        el.scrollIntoView({block: 'center'});
+        el.click();
+        return true;
+    }
+    return false;
+}"""
+
+# карточка id посерела или исчезла из списка
+GREY_FN = "([xpath, id]) => { const c = (" + SNAPSHOT_FN + ")(xpath).find(c => c.id === id); return !c || c.grey; }"
+
+LIST_SIG_FN = """([xpath, sig]) => {
+    const r = document.evaluate(xpath, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    const out = [];
+    for (let i = 0; i < r.snapshotLength; i++) {
+        const e = r.snapshotItem(i);
+        out.push((e.getAttribute('class') || '') + '|' + e.innerText);
+    }
+    return sig === null ? out.join('\\n') : out.join('\\n') !== sig;
+}"""
+
+TOASTS_GONE_FN = """(css) => !Array.from(document.querySelectorAll(css))
+    .some(e => e.isConnected && (e.offsetWidth || e.offsetHeight || e.getClientRects().length))"""
+
+# как OpenAgentSide._is_checked
+IS_CHECKED_FN = """(el) => {
+    const cls = (el.getAttribute('class') || '').toLowerCase();
+    if (cls.includes('p-highlight') || cls.includes('checked')) return true;
+    const box = el.closest('p-checkbox');
+    return !!box && (box.getAttribute('aria-checked') || '').toLowerCase() === 'true';
+}"""
+
+def xp(loc) -> str:
+    """Локатор Selenium (By.XPATH, ...) → селектор Playwright."""
+    return "xpath=" + loc[1]
+
+INPUT = xp(ui.INPUT_LOC)
+
+# ==================== ШАГИ ====================
+
+async def toasts_gone(page: Page, timeout_ms: int = 6000) -> None:
+    try:
+        await page.wait_for_function(TOASTS_GONE_FN, arg=TOAST_CSS, timeout=timeout_ms)
+    except PWTimeout:
+        pass
+
+async def login(page: Page, url: str, username: str, password: str) -> None:
+    """Логин через форму → Chats → Direct."""
+    if not username or not password:
+        raise RuntimeError("нет логина/пароля")
+    await page.goto(url)
+    await page.fill("[name='username']", username)
+    await page.fill("[name='password']", password)
+    await page.click("#kt_sign_in_submit")
+    await page.click("span[title='Chats']")
+    await page.click("span[title='Direct']")
+
+async def set_accepting(page: Page) -> None:
+    """Меню аватара: Do not accept chats → Accepting chats (как OpenAgentSide.set_accepting)."""
+    await toasts_gone(page)
+    await page.click(xp(ui.AVATAR_LOC))
+    try:
+        await page.wait_for_selector(xp(ui.STATUS_ITEM_LOC), timeout=6000)
+    except PWTimeout:
+        pass
+    for text in ("Do not accept chats", "Accepting chats"):
+        item = page.locator(f"xpath=//div[contains(text(),'{text}')]").first
+        if await item.is_visible():
+            await item.click()
+    await page.keyboard.press("Escape")
+
+async def snapshot(page: Page) -> list:
+    cards = await page.evaluate(SNAPSHOT_FN, ui.ONGOING_CHATS_XPATH) or []
+    if cards:
+        note_card_key(cards[0]["id"])
+    return cards
+
+def pick(cards: list, taken: set) -> Optional[dict]:
+    """Первая не выбранная и не серая карточка, которую ещё не взял другой агент процесса."""
+    for card in cards:
+        if card["selected"] or card["grey"] or card["id"] in taken:
+            continue
+        taken.add(card["id"])
+        return card
+    return None
+
+async def wait_list_changed(page: Page, timeout_ms: int) -> None:
+    sig = await page.evaluate(LIST_SIG_FN, [ui.ONGOING_CHATS_XPATH, None])
+    try:
+        await page.wait_for_function(LIST_SIG_FN, arg=[ui.ONGOING_CHATS_XPATH, sig],
+                                     timeout=timeout_ms, polling=100)
+    except PWTimeout:
+        pass
+
+async def click_send(page: Page) -> None:
+    """Первая видимая включённая кнопка из SEND_BUTTON_CANDIDATES, иначе Enter в поле."""
+    for loc in ui.SEND_BUTTON_CANDIDATES:
+        btn = page.locator(xp(loc)).first
+        try:
+            if await btn.is_visible() and await btn.is_enabled():
+                await btn.click(timeout=2000)
+                return
+        except PWTimeout:
+            continue
+    await page.locator(INPUT).first.press("Enter")
+
+async def send_messages(page: Page, tracker: TokenTracker, count: int) -> int:
+    """Отправить count сообщений подряд; подтверждения — кадры websocket с токеном."""
+    lost_before = tracker.lost
+    field = page.locator(INPUT).first
+    for i in range(count):
+        token = ui._rand_token()
+        await field.fill(f"Automated message #{i + 1} [{token}]")
+        tracker.sent(token)
+        await click_send(page)
+        # поле очистилось — приложение приняло сообщение, можно печатать следующее
+        try:
+            await page.wait_for_function(
+                "(el) => !((el.isContentEditable ? el.innerText : el.value) || '').trim()",
+                arg=await field.element_handle(), timeout=5000, polling=50)
+        except PWTimeout:
+            pass
+    await tracker.wait_all(ECHO_TIMEOUT_MS)
+    return count - (tracker.lost - lost_before)
+
+async def ensure_checkbox(page: Page, loc, checked: bool) -> None:
+    box = await page.wait_for_selector(xp(loc), state="attached")
+    if await box.evaluate(IS_CHECKED_FN) != checked:
+        await box.click()
+        await page.wait_for_function(f"(el) => ({IS_CHECKED_FN})(el) === {str(checked).lower()}",
+                                     arg=box, timeout=5000)
+
+async def close_chat(page: Page, chat_id: str, marks: dict) -> None:
+    """Close → Yes → Submit → OK → ждём серую карточку."""
+    await page.locator(xp(ui.CLOSE_SPAN_LOC)).first.click()
+    marks["close_clicked"] = time.time()
+    await ensure_checkbox(page, ui.YES_BOX_LOC, True)
+    await ensure_checkbox(page, ui.NO_BOX_LOC, False)
+    await page.locator(xp(ui.SUBMIT_BTN_LOC)).first.click()
+    ok = page.locator(xp(ui.OK_BTN_LOC)).first
+    try:
+        await ok.click(timeout=5000)
+        await ok.wait_for(state="hidden", timeout=5000)
+    except PWTimeout:
+        pass
+    marks["submitted"] = time.time()
+    try:
+        await page.locator(INPUT).first.wait_for(state="hidden", timeout=5000)
+    except PWTimeout:
+        pass
+    try:
+        await page.wait_for_function(GREY_FN, arg=[ui.ONGOING_CHATS_XPATH, chat_id],
+                                     timeout=ui.GREY_WAIT_TIMEOUT * 1000, polling=100)
+        marks["grey"] = time.time()
+    except PWTimeout:
+        pass
+    await toasts_gone(page)
+
+# ==================== АГЕНТ ====================
+
+def watch_hub(ws, hub_events: dict) -> None:
+    """События agent-events-hub: момент первого события по chatId (для queue_wait)."""
+    if not any(k in ws.url for k in HUB_KEYS):
+        return
+
+    def on_frame(payload) -> None:
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8", errors="ignore")
+        now = time.time()
+        for chat_id in hub_chat_ids(payload):
+            hub_events.setdefault(chat_id, now)
+
+    ws.on("framereceived", on_frame)
+
+async def drain(page: Page, stats: dict, tracker: TokenTracker, hub_events: dict, taken: set,
+                sink: Optional[ResultSink]) -> None:
+    while True:
+        cards = await snapshot(page)
+        card = pick(cards, taken)
+        if card is None:
+            # дайте списку обновиться и перепроверьте «первую» карточку
+            await wait_list_changed(page, int(ui.TOP_CARD_RECHECK_PAUSE * 1000))
+            card = pick((await snapshot(page))[:1], taken)
+        if card is None:
+            return
+
+        marks = {"appeared": card["seen"] / 1000 if card.get("seen") else None,
+                 "hub_event": hub_events.get(card["id"])}
+        steps = StepLog(stats["phases"])
+        chat_started = time.time()
+        outcome, error, sent, n = "ok", None, 0, 0
+        try:
+            if not await page.evaluate(CLICK_CARD_FN, [ui.ONGOING_CHATS_XPATH, card["id"]]):
+                continue    # карточка пропала из списка между снимком и кликом
+            marks["clicked"] = time.time()
+            await page.locator(INPUT).first.wait_for(state="visible", timeout=OPEN_TIMEOUT_MS)
+            marks["input_ready"] = time.time()
+
+            n = random.randint(MESSAGES_MIN, MESSAGES_MAX)
+            sent = await send_messages(page, tracker, n)
+            marks["confirmed"] = time.time()
+            if sent == n:
+                await close_chat(page, card["id"], marks)
+                marks["done"] = time.time()
+                stats["processed"] += 1
+            else:
+                outcome, error = "error", "NotConfirmed"     # как в drain: не закрываем
+        except PWTimeout as e:
+            outcome, error = "timeout", type(e).__name__
+        except PWError as e:
+            # элемент отцепился, страница перешла и т.п. — как Selenium-движок: к следующему чату
+            print(f"[{stats['agent']}] чат {card['id']}: {e.message.splitlines()[0] if e.message else e}")
+            outcome, error = "error", type(e).__name__
+        if outcome != "ok":
+            stats["failed"] += 1
+        ui.record_phases(marks, steps)
+        if sink:
+            sink.session(stats["processed"] + stats["failed"], chat_started, time.time(), steps=steps.steps,
+                         messages=sent, outcome=outcome, error=error, agent=stats["agent"], chat_id=card["id"])
+
+async def run_agent(browser, cred: dict, opts, delay: float, taken: set, sink: Optional[ResultSink]) -> dict:
+    """Один агент — свой контекст в общем браузере. Итог в формате agentdrain.run_agent."""
+    await asyncio.sleep(delay)
+    name = cred["username"]
+    stats = {"agent": name, "processed": 0, "failed": 0, "login_s": 0.0, "drain_s": 0.0, "error": None,
+             "phases": StageStats()}
+    context = await browser.new_context(ignore_https_errors=True, viewport=VIEWPORT)
+    try:
+        page = await context.new_page()
+        page.set_default_timeout(TIMEOUT_MS)
+        tracker = TokenTracker(stats["phases"])     # стадия "echo" — каждое сообщение
+        tracker.attach(page)
+        hub_events = {}
+        page.on("websocket", lambda ws: watch_hub(ws, hub_events))
+
+        t = time.perf_counter()
+        await login(page, cred.get("url") or opts.url, name, cred["password"])
+        await set_accepting(page)
+        stats["login_s"] = time.perf_counter() - t
+        t = time.perf_counter()
+        await drain(page, stats, tracker, hub_events, taken, sink)
+        stats["drain_s"] = time.perf_counter() - t
+    except Exception as e:
+        stats["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        await context.close()
+    return stats
+
+async def run(creds: list, opts) -> list:
+    taken = set()
+    sink = ResultSink(opts.results, engine="playwright-agent") if opts.results else None
+    try:
+        async with launch_browser(headless=not opts.headed) as browser:
+            return await asyncio.gather(*(run_agent(browser, cred, opts, n * opts.stagger, taken, sink)
+                                          for n, cred in enumerate(creds)))
+    finally:
+        if sink:
+            sink.close()
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Агенты на Playwright: много контекстов в одном браузере")
+    ap.add_argument("credentials", type=Path, help="CSV: username,password[,url] (как у agentdrain.py)")
+    ap.add_argument("--agents", type=int, default=AGENTS, help="сколько агентов (0 — все из CSV)")
+    ap.add_argument("--url", default=os.getenv("VIVAI_URL", ""), help="URL логина, если не задан в CSV")
+    ap.add_argument("--stagger", type=float, default=STAGGER_S)
+    ap.add_argument("--headed", action="store_true")
+    ap.add_argument("--results", type=Path, default=None,
+                    help="писать по JSON-записи на чат в этот JSONL (см. resultsink.py)")
+    ap.add_argument("--phases-json", type=Path, default=None)
+    ap.add_argument("--phases-csv", type=Path, default=None)
+    return ap.parse_args(argv)
+
+def main():
+    opts = parse_args()
+    creds = load_credentials(opts.credentials)
+    if opts.agents:
+        creds = creds[:opts.agents]
+
+    started = time.perf_counter()
+    cpu_started = cpu_seconds()
+    results = asyncio.run(run(creds, opts))
+    elapsed = time.perf_counter() - started
+
+    phases = merge_phases(results)
+    print_report(results, elapsed, phases)
+    # браузер уже закрыт — его CPU учтён в children, как у agentdrain
+    print(capacity_line(len(results), sum(r["processed"] for r in results), elapsed,
+                        cpu_seconds() - cpu_started))
+    if opts.phases_json:
+        phases.to_json(opts.phases_json)
+    if opts.phases_csv:
+        phases.to_csv(opts.phases_csv)
+
+if __name__ == "__main__":
+    main()
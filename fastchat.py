@@ -1,8 +1,15 @@
 import os
+import time
 import asyncio
+import argparse
+import itertools
+import copy
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import random
 import string
 from contextlib import asynccontextmanager
+from pathlib import Path
 from typing import Optional
 
 from playwright.async_api import (
@@ -12,6 +19,13 @@ from playwright.async_api import (
     Frame,
 )
 
+from routecache import AssetRouter, BLOCK_RESOURCE_TYPES, BLOCK_HOSTS
+from loadprofile import load_schedule, arrival_times
+from latency import Histogram, StageStats
+from thinktime import ThinkTime
+from hostmon import GeneratorMonitor
+from resultsink import ResultSink, StepLog
+
 # ====================== НАСТРОЙКИ ======================
 WIDGET_URL = "https://redirect.test.vivai.ai/30a8e3fa-8ed6-4b6a-a547-5445037e5414"
 
@@ -28,7 +42,34 @@ CONCURRENCY = 20       # одновременных сессий
 MESSAGE_TEXT = "Test message"
 TIMEOUT_MS = 15000       # мс ожиданий на действия
 RETRIES = 2              # доп. попытки на один чат (в сумме 1 + RETRIES)
-POST_SEND_PAUSE_MS = 300 # пауза после отправки
+# Пауза «пользователя» после каждого сообщения — распределение (см. thinktime.py).
+# Раньше здесь была фиксированная пауза 300 мс; повторить её: "fixed:0.3"
+THINK_TIME = "0"
+WAIT_TRANSCRIPT = True   # после отправки ждать появления сообщения в переписке
+ECHO_TIMEOUT_MS = 10000  # сколько ждать входящий WS-кадр с токеном сообщения
+
+# Пул «тёплых» контекстов: контекст переиспользуется между чатами,
+# между сессиями чистятся cookies/storage, после N использований — пересоздаётся
+USE_CONTEXT_POOL = True
+CONTEXT_MAX_USES = 50    # сколько чатов обслуживает один контекст до пересоздания
+
+# Перехват запросов (routecache.py): блокировка лишнего и кэш статики виджета
+USE_ASSET_ROUTES = True
+
+# Open-loop (--schedule): сессии стартуют по расписанию, а не по освобождению слота
+MAX_IN_FLIGHT = 200      # защитный предел одновременных сессий генератора
+LATE_START_MS = 100      # старт позже расписания на столько — считаем опоздавшим
+
+# Поиск точки насыщения (--auto-tune): шагаем по concurrency, пока держится SLO
+TUNE_START = 5           # стартовая concurrency
+TUNE_STEP = 5            # шаг роста (после нарушения SLO делится пополам)
+TUNE_MIN_STEP = 1
+TUNE_MAX = 500
+TUNE_WINDOW_S = 60       # длина окна наблюдения на каждом шаге
+SLO_SUCCESS = 0.99       # доля успешных сессий в окне
+SLO_P90_MS = 30000       # p90 длительности сессии в окне
+GEN_CPU_MAX = 85         # % CPU хоста у генератора — выше считаем, что упёрлись в себя
+GEN_MEM_MIN = 0.10       # доля свободной памяти хоста
 
 # Необязательный прокси: задайте в окружении PLAYWRIGHT_PROXY
 PLAYWRIGHT_PROXY = os.getenv("PLAYWRIGHT_PROXY")
@@ -39,47 +80,124 @@ def rnd_suffix(n: int = 6) -> str:
     alphabet = string.ascii_letters + string.digits
     return "".join(random.choice(alphabet) for _ in range(n))
 
+def _rand_token(k: int = 6) -> str:
+    alphabet = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+    return "".join(random.choice(alphabet) for _ in range(k))
+
+class TokenTracker:
+    """
+    Подтверждение доставки по WebSocket, как в OpenAgentSide.send_messages:
+    в сообщение кладём случайный токен и ловим первый входящий кадр с ним.
+    Время от клика «отправить» до кадра пишем в стадию "echo".
+    """
+
+    def __init__(self, stages: StageStats):
+        self.stages = stages
+        self.pending = {}          # токен -> момент клика
+        self.delivered = 0
+        self.lost = 0
+        self._drained = asyncio.Event()
+        self._drained.set()
+
+    def attach(self, page: Page) -> None:
+        page.on("websocket", self._on_websocket)
+
+    def detach(self, page: Page) -> None:
+        page.remove_listener("websocket", self._on_websocket)
+
+    def _on_websocket(self, ws) -> None:
+        ws.on("framereceived", self._on_frame)
+
+    def _on_frame(self, payload) -> None:
+        if not self.pending:
+            return
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8", errors="ignore")
+        now = time.perf_counter()
+        for token in [t for t in self.pending if t in payload]:
+            self.stages.record("echo", now - self.pending.pop(token))
+            self.delivered += 1
+        if not self.pending:
+            self._drained.set()
+
+    def sent(self, token: str) -> None:
+        self.pending[token] = time.perf_counter()
+        self._drained.clear()
+
+    async def wait_all(self, timeout_ms: float = ECHO_TIMEOUT_MS) -> None:
+        """Дождаться эха по всем отправленным; что не пришло — потеряно."""
+        if self.pending:
+            try:
+                await asyncio.wait_for(self._drained.wait(), timeout_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+        self.lost += len(self.pending)
+        self.pending.clear()
+        self._drained.set()
+
 async def get_widget_frame(page: Page) -> Frame:
     """
     Дожидаемся появления iframe и получаем его Frame.
-    Иногда element виден, но frame ещё не прикреплён — добавлен мини-луп.
+    Если element уже виден, а frame ещё не прикреплён — ждём событие frameattached
+    (подписка до проверки, чтобы не пропустить), затем загрузку документа фрейма.
     """
     iframe_el = await page.wait_for_selector(SEL_IFRAME, state="visible", timeout=TIMEOUT_MS)
-    frame = await iframe_el.content_frame()
-    if frame is None:
-        for _ in range(20):
-            await asyncio.sleep(0.05)
+    attached = asyncio.ensure_future(page.wait_for_event("frameattached", timeout=TIMEOUT_MS))
+    try:
+        frame = await iframe_el.content_frame()
+        while frame is None:
+            await asyncio.wait_for(asyncio.shield(attached), TIMEOUT_MS / 1000)
             frame = await iframe_el.content_frame()
-            if frame is not None:
-                break
-    if frame is None:
-        raise RuntimeError("Не удалось получить content_frame из iframe")
+            if frame is None:
+                attached = asyncio.ensure_future(page.wait_for_event("frameattached", timeout=TIMEOUT_MS))
+    finally:
+        attached.cancel()
+    await frame.wait_for_load_state("domcontentloaded", timeout=TIMEOUT_MS)
     return frame
 
-async def run_chat_flow(frame: Frame, index: int) -> None:
+async def run_chat_flow(frame: Frame, index: int, stages: StageStats, tracker: TokenTracker,
+                        think: ThinkTime, wait_transcript: bool = WAIT_TRANSCRIPT) -> int:
+    clock = time.perf_counter
+
     # открыть виджет
+    t = clock()
     await frame.click(SEL_WIDGET_BUTTON, timeout=TIMEOUT_MS)
+    stages.record("widget_open", clock() - t)
 
-    # userId
+    # userId + старт
+    t = clock()
     await frame.fill(SEL_INPUT_USERID, f"Test {index}-{rnd_suffix()}", timeout=TIMEOUT_MS)
-
-    # старт
     await frame.click(SEL_BTN_START, timeout=TIMEOUT_MS)
+    stages.record("start", clock() - t)
 
     # === несколько сообщений подряд (3–7) ===
     count = random.randint(2, 7)
     for j in range(count):
-        msg = f"{MESSAGE_TEXT} #{index}.{j+1}"
+        token = _rand_token()
+        msg = f"{MESSAGE_TEXT} #{index}.{j+1} [{token}]"
 
+        t = clock()
         await frame.click(SEL_INPUT_MESSAGE, timeout=TIMEOUT_MS)
         await frame.fill(SEL_INPUT_MESSAGE, msg, timeout=TIMEOUT_MS)
 
+        # click() сам ждёт, пока иконка отправки станет видимой, стабильной и активной
         await frame.wait_for_selector(SEL_SEND_ICONS, timeout=TIMEOUT_MS)
         icons = await frame.query_selector_all(SEL_SEND_ICONS)
         target = icons[1] if len(icons) > 1 else icons[0]
+        tracker.sent(token)      # до клика: эхо может прийти, пока click() ещё ждёт
         await target.click()
+        stages.record("send", clock() - t)
+
+        # сообщение появилось в переписке — можно печатать следующее
+        if wait_transcript:
+            t = clock()
+            await frame.get_by_text(token).first.wait_for(state="visible", timeout=TIMEOUT_MS)
+            stages.record("rendered", clock() - t)
 
-        await frame.wait_for_timeout(POST_SEND_PAUSE_MS)
+        if not think.is_zero:
+            t = clock()
+            await asyncio.sleep(think.sample())
+            stages.record("think", clock() - t)
 
     # === закрытие пока закомментировано ===
     # try:
@@ -88,31 +206,163 @@ async def run_chat_flow(frame: Frame, index: int) -> None:
     # except Exception:
     #     print(f"[WARN] Chat #{index}: кнопка закрытия не найдена")
 
-    print(f"[OK] Chat #{index}: отправлено {count} сообщений")
+    return count
 
-async def one_chat(context, index: int) -> bool:
-    page = await context.new_page()
-    page.set_default_timeout(TIMEOUT_MS)
+# Исходы одной попытки чата; DROPPED — open-loop сессия не стартовала (упёрлись в MAX_IN_FLIGHT)
+OK, TIMEOUT, ERROR, DROPPED = "ok", "timeout", "error", "dropped"
+
+async def chat_on_page(page: Page, index: int, result: "RunResult", opts,
+                       steps: Optional[StepLog] = None) -> str:
+    """steps — шаги сессии для --results (пробрасывает в result.stages)."""
+    clock = time.perf_counter
+    stages = steps if steps is not None else result.stages
+    tracker = TokenTracker(stages)
+    tracker.attach(page)
     try:
+        t = clock()
         await page.goto(WIDGET_URL, wait_until="domcontentloaded", timeout=TIMEOUT_MS)
+        stages.record("goto", clock() - t)
+
+        t = clock()
         frame = await get_widget_frame(page)
-        await run_chat_flow(frame, index)
-        await page.wait_for_timeout(POST_SEND_PAUSE_MS)
-        return True
-    except PWTimeout:
-        print(f"[TIMEOUT] Chat #{index}")
-        return False
+        stages.record("frame_attach", clock() - t)
+
+        count = await run_chat_flow(frame, index, stages, tracker, opts.think, not opts.no_transcript_wait)
+        if steps is not None:
+            steps.messages = count
+
+        # вместо финальной паузы — ждём эхо по всем сообщениям (или ECHO_TIMEOUT_MS)
+        t = clock()
+        await tracker.wait_all()
+        stages.record("drain", clock() - t)
+        if not opts.quiet:
+            print(f"[OK] Chat #{index}: отправлено {count} сообщений")
+        return OK
+    except PWTimeout as e:
+        if steps is not None:
+            steps.error = type(e).__name__
+        if not opts.quiet:
+            print(f"[TIMEOUT] Chat #{index}")
+        return TIMEOUT
     except Exception as e:
-        print(f"[ERR] Chat #{index}: {e}")
-        return False
+        if steps is not None:
+            steps.error = type(e).__name__
+        if not opts.quiet:
+            print(f"[ERR] Chat #{index}: {e}")
+        return ERROR
+    finally:
+        tracker.detach(page)
+        # незавершённые (сессия упала) тоже считаем потерянными
+        result.delivered += tracker.delivered
+        result.lost += tracker.lost + len(tracker.pending)
+
+async def one_chat(context, index: int, result: "RunResult", opts,
+                   steps: Optional[StepLog] = None) -> str:
+    page = await context.new_page()
+    page.set_default_timeout(TIMEOUT_MS)
+    try:
+        return await chat_on_page(page, index, result, opts, steps)
     finally:
         await page.close()
 
+async def new_chat_context(browser, router: Optional[AssetRouter] = None):
+    context = await browser.new_context(
+        ignore_https_errors=True,
+        viewport={"width": 1366, "height": 900},
+        # service worker'ы обходят routing — при перехвате их выключаем
+        service_workers="block" if router else "allow",
+    )
+    if router:
+        await router.install(context)
+    return context
+
+# ==================== ПУЛ КОНТЕКСТОВ ====================
+
+CLEAR_STORAGE_JS = """() => {
+    try { localStorage.clear(); } catch (e) {}
+    try { sessionStorage.clear(); } catch (e) {}
+}"""
+
+class PooledContext:
+    __slots__ = ("context", "page", "uses")
+
+    def __init__(self, context, page):
+        self.context = context
+        self.page = page
+        self.uses = 0
+
+class ContextPool:
+    """
+    Ограниченный пул тёплых BrowserContext + Page.
+    После каждой сессии чистим cookies и local/sessionStorage во всех фреймах
+    (включая iframe виджета) и уводим страницу на about:blank — следующий чат
+    выглядит для бэкенда как новый посетитель. Контекст пересоздаётся после
+    max_uses сессий или после ошибки.
+    """
+
+    def __init__(self, browser, size: int, max_uses: int = CONTEXT_MAX_USES,
+                 router: Optional[AssetRouter] = None):
+        self.browser = browser
+        self.router = router
+        self.max_uses = max_uses
+        self._idle: asyncio.LifoQueue = asyncio.LifoQueue()
+        self._slots = asyncio.Semaphore(size)
+        self.created = 0
+        self.retired = 0
+
+    async def acquire(self) -> PooledContext:
+        await self._slots.acquire()
+        try:
+            if not self._idle.empty():
+                return self._idle.get_nowait()
+            context = await new_chat_context(self.browser, self.router)
+            page = await context.new_page()
+            page.set_default_timeout(TIMEOUT_MS)
+            self.created += 1
+            return PooledContext(context, page)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def release(self, item: PooledContext, broken: bool = False) -> None:
+        try:
+            item.uses += 1
+            if broken or item.uses >= self.max_uses or not await self._reset(item):
+                await self._retire(item)
+            else:
+                self._idle.put_nowait(item)
+        finally:
+            self._slots.release()
+
+    async def _reset(self, item: PooledContext) -> bool:
+        try:
+            for frame in item.page.frames:
+                try:
+                    await frame.evaluate(CLEAR_STORAGE_JS)
+                except Exception:
+                    pass  # фрейм мог уже отсоединиться
+            await item.context.clear_cookies()
+            await item.page.goto("about:blank")
+            return True
+        except Exception:
+            return False
+
+    async def _retire(self, item: PooledContext) -> None:
+        self.retired += 1
+        try:
+            await item.context.close()
+        except Exception:
+            pass
+
+    async def close(self) -> None:
+        while not self._idle.empty():
+            await self._retire(self._idle.get_nowait())
+
 @asynccontextmanager
-async def launch_browser():
+async def launch_browser(headless: bool = True):
     pw = await async_playwright().start()
 
-    launch_kwargs = {"headless": True}
+    launch_kwargs = {"headless": headless}
     if PLAYWRIGHT_PROXY:
         launch_kwargs["proxy"] = {"server": PLAYWRIGHT_PROXY}
 
@@ -123,32 +373,419 @@ async def launch_browser():
         await browser.close()
         await pw.stop()
 
-async def run():
-    sem = asyncio.Semaphore(CONCURRENCY)
-    success = 0
+def _cpu_seconds() -> tuple:
+    """(CPU процесса Python, CPU завершённых дочерних процессов — Chromium/драйвер)."""
+    t = os.times()
+    return t.user + t.system, t.children_user + t.children_system
+
+class RunResult:
+    """Итоги прогона (или одного шарда); шарды складываются через merge()."""
+
+    def __init__(self):
+        self.total = 0
+        self.success = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.dropped = 0
+        self.late = 0            # open-loop: стартовали позже LATE_START_MS
+        self.max_lag_ms = 0.0    # open-loop: максимальное опоздание старта
+        self.delivered = 0       # сообщений с эхом по WebSocket (TokenTracker)
+        self.lost = 0            # сообщений без эха за ECHO_TIMEOUT_MS
+        # гистограммы по шагам; "session" — успешный чат целиком (вместе с ретраями)
+        self.stages = StageStats()
+        self.cpu_python = 0.0
+        self.cpu_browser = 0.0
+        self.contexts_created = 0
+        self.contexts_retired = 0
+        # перехват запросов (routecache.AssetRouter.stats)
+        self.route_requests = 0
+        self.route_blocked = 0
+        self.cache_hits = 0
+        self.bytes_saved = 0
+
+    def add(self, outcome: str, seconds: float) -> None:
+        self.total += 1
+        if outcome == OK:
+            self.success += 1
+            self.stages.record("session", seconds)
+        elif outcome == TIMEOUT:
+            self.timeouts += 1
+        elif outcome == DROPPED:
+            self.dropped += 1
+        else:
+            self.errors += 1
+
+    def merge(self, other: "RunResult") -> "RunResult":
+        for name in ("total", "success", "timeouts", "errors", "dropped", "late",
+                     "delivered", "lost", "cpu_python",
+                     "cpu_browser", "contexts_created", "contexts_retired",
+                     "route_requests", "route_blocked", "cache_hits", "bytes_saved"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.max_lag_ms = max(self.max_lag_ms, other.max_lag_ms)
+        self.stages.merge(other.stages)
+        return self
+
+def print_report(result: RunResult, elapsed: float, opts) -> None:
+    print(f"\nDone. Success: {result.success}/{result.total}")
+    print(f"Timeouts: {result.timeouts}, errors: {result.errors}")
+    print(f"Messages: delivered {result.delivered}, lost {result.lost}")
+    if opts.schedule:
+        print(
+            f"Open-loop: started {result.total - result.dropped}/{result.total}, "
+            f"late >{opts.late_ms} ms: {result.late}, max lag {result.max_lag_ms:.0f} ms, "
+            f"dropped at cap {opts.max_in_flight}: {result.dropped}"
+        )
+    if result.stages.stages:
+        print(result.stages.format_table())
+    pool_info = (f"pool=on, contexts created={result.contexts_created}, "
+                 f"retired={result.contexts_retired}") if not opts.no_pool else "pool=off"
+    print(
+        f"Rate: {result.total / elapsed:.2f} sessions/s за {elapsed:.1f} с; "
+        f"CPU: python {result.cpu_python:.1f} с, browser {result.cpu_browser:.1f} с "
+        f"({pool_info}, processes={opts.processes})"
+    )
+    if result.route_requests and result.total:
+        per = result.total
+        print(
+            f"Routing: {result.route_requests / per:.1f} req/session, "
+            f"saved {(result.route_blocked + result.cache_hits) / per:.1f} req/session "
+            f"(blocked {result.route_blocked}, cache hits {result.cache_hits}), "
+            f"{result.bytes_saved / per / 1024:.1f} KiB/session"
+        )
+
+async def _chat_with_retries(run_once, i: int) -> str:
+    outcome = ERROR
+    for attempt in range(1, RETRIES + 2):
+        outcome = await run_once(i)
+        if outcome == OK:
+            break
+        await asyncio.sleep(0.25 * attempt)
+    return outcome
+
+def make_router(opts) -> Optional[AssetRouter]:
+    """Один AssetRouter на процесс: кэш статики наполняется один раз и общий для всех контекстов."""
+    if opts.no_routes:
+        return None
+    router = AssetRouter(
+        block_types=opts.block_types,
+        block_hosts=opts.block_hosts,
+        use_cache=opts.asset_cache != "off",
+        cache_dir=opts.cache_dir if opts.asset_cache == "disk" else None,
+    )
+    if opts.seed_har:
+        router.seed_from_har(opts.seed_har)
+    return router
+
+async def _dispatch_open_loop(arrivals, run_session, opts, result: RunResult, on_drop=None) -> None:
+    """
+    Open-loop: стартуем сессии по расписанию, не дожидаясь завершения предыдущих.
+    Если одновременно уже max_in_flight сессий — сессия не стартует (DROPPED);
+    опоздания старта относительно расписания считаем отдельно: так видно,
+    что узким местом стал сам генератор. on_drop(i) — чтобы записать
+    несостоявшуюся сессию (например, в JSONL).
+    """
+    loop = asyncio.get_running_loop()
+    in_flight = set()
+    t0 = loop.time()
+    for i, offset in arrivals:
+        due = t0 + offset
+        delay = due - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(in_flight) >= opts.max_in_flight:
+            result.add(DROPPED, 0.0)
+            if on_drop:
+                on_drop(i)
+            continue
+        lag_ms = (loop.time() - due) * 1000
+        result.max_lag_ms = max(result.max_lag_ms, lag_ms)
+        if lag_ms > opts.late_ms:
+            result.late += 1
+        task = asyncio.create_task(run_session(i))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+    if in_flight:
+        await asyncio.gather(*in_flight)
+
+class _TuneWindow:
+    def __init__(self):
+        self.ok = 0
+        self.failed = 0
+        self.session = Histogram()
+
+    def add(self, outcome: str, seconds: float) -> None:
+        if outcome == OK:
+            self.ok += 1
+            self.session.record(seconds)
+        else:
+            self.failed += 1
+
+async def _autotune(run_session, opts) -> None:
+    """
+    Закрытый цикл с переменной concurrency: окно за окном поднимаем число
+    воркеров, пока в окне держится SLO (доля успехов и p90 сессии). При нарушении
+    откатываемся к последнему хорошему уровню и уточняем с половинным шагом.
+    Если генератор сам упёрся в CPU/память — останавливаемся и говорим об этом.
+    """
+    counter = itertools.count(1)
+    slots = {}                       # номер слота -> задача воркера
+    target = opts.tune_start
+    window = _TuneWindow()
+
+    async def worker(slot: int):
+        while slot <= target:
+            outcome, seconds = await run_session(next(counter))
+            window.add(outcome, seconds)
+
+    def resize():
+        for slot in range(1, target + 1):
+            task = slots.get(slot)
+            if task is None or task.done():
+                slots[slot] = asyncio.create_task(worker(slot))
+
+    monitor = GeneratorMonitor()
+    step = opts.tune_step
+    best = None                      # (concurrency, sessions/s)
+    verdict = "достигнут --tune-max"
+    try:
+        while True:
+            resize()
+            window = _TuneWindow()
+            monitor.sample()
+            await asyncio.sleep(opts.tune_window)
+            cpu_pct, mem_free = monitor.sample()
+
+            done = window.ok + window.failed
+            ratio = window.ok / done if done else 0.0
+            p90 = window.session.percentile_ms(90)
+            rate = window.ok / opts.tune_window
+            gen_bound = cpu_pct > opts.gen_cpu_max or (mem_free is not None and mem_free < opts.gen_mem_min)
+            slo_ok = done > 0 and ratio >= opts.slo_success and p90 <= opts.slo_p90_ms
+            mem_info = f"{mem_free:.0%}" if mem_free is not None else "n/a"
+            print(
+                f"[tune] c={target}: {rate:.2f} sess/s, ok {ratio:.1%} ({done}), p90 {p90:.0f} ms, "
+                f"gen CPU {cpu_pct:.0f}%, mem free {mem_info} -> "
+                + ("GENERATOR" if gen_bound else "OK" if slo_ok else "SLO broken")
+            )
+
+            if gen_bound:
+                verdict = f"упёрлись в генератор на c={target} — результат ограничен генератором, не бэкендом"
+                break
+            if slo_ok:
+                if best is None or rate >= best[1] or target > best[0]:
+                    best = (target, rate)
+                if target >= opts.tune_max:
+                    break
+                target = min(opts.tune_max, target + step)
+                continue
+            if step <= opts.tune_min_step or best is None:
+                verdict = f"SLO нарушен на c={target}"
+                break
+            step = max(opts.tune_min_step, step // 2)
+            target = best[0] + step
+    finally:
+        target = 0                   # воркеры выходят после текущей сессии
+        if slots:
+            await asyncio.gather(*slots.values(), return_exceptions=True)
+
+    if best:
+        print(f"\nMax sustainable concurrency: {best[0]} ({best[1]:.2f} sessions/s); стоп: {verdict}")
+    else:
+        print(f"\nSLO не выполняется даже на c={opts.tune_start}; стоп: {verdict}")
+
+async def run(indices, opts, arrivals=None) -> RunResult:
+    """
+    Closed-loop (по умолчанию): CONCURRENCY воркеров разбирают indices из очереди.
+    Open-loop (arrivals = [(index, offset_s), ...]): старты по расписанию.
+    """
+    result = RunResult()
+    cpu_before = _cpu_seconds()
+    router = make_router(opts)
+    sink = ResultSink(opts.results, engine="playwright") if opts.results else None
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in indices:
+        queue.put_nowait(i)
 
     async with launch_browser() as browser:
-        async def worker(i: int):
-            nonlocal success
-            async with sem:
-                context = await browser.new_context(
-                    ignore_https_errors=True,
-                    viewport={"width": 1366, "height": 900},
-                )
+        if opts.auto_tune:
+            pool_size = opts.tune_max
+        elif arrivals is not None:
+            pool_size = opts.max_in_flight
+        else:
+            pool_size = CONCURRENCY
+        pool = None if opts.no_pool else ContextPool(browser, pool_size, router=router)
+
+        async def run_pooled(i: int, steps: Optional[StepLog]) -> str:
+            item = await pool.acquire()
+            outcome = ERROR
+            try:
+                outcome = await chat_on_page(item.page, i, result, opts, steps)
+                return outcome
+            finally:
+                await pool.release(item, broken=outcome != OK)
+
+        async def run_fresh(i: int, steps: Optional[StepLog]) -> str:
+            context = await new_chat_context(browser, router)
+            try:
+                return await _chat_with_retries(lambda n: one_chat(context, n, result, opts, steps), i)
+            finally:
+                await context.close()
+
+        async def run_session(i: int) -> tuple:
+            steps = StepLog(result.stages) if sink else None
+            started = time.time()
+            t0 = time.perf_counter()
+            if pool:
+                outcome = await _chat_with_retries(lambda n: run_pooled(n, steps), i)
+            else:
+                outcome = await run_fresh(i, steps)
+            seconds = time.perf_counter() - t0
+            result.add(outcome, seconds)
+            if sink:
+                sink.session(i, started, started + seconds, steps=steps.steps, messages=steps.messages,
+                             outcome=outcome, error=None if outcome == OK else steps.error)
+            return outcome, seconds
+
+        def drop_session(i: int) -> None:
+            if sink:
+                now = time.time()
+                sink.session(i, now, now, outcome=DROPPED, error="MaxInFlight")
+
+        async def worker():
+            while True:
                 try:
-                    for attempt in range(1, RETRIES + 2):
-                        ok = await one_chat(context, i)
-                        if ok:
-                            success += 1
-                            break
-                        await asyncio.sleep(0.25 * attempt)
-                finally:
-                    await context.close()
+                    i = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await run_session(i)
+
+        try:
+            if opts.auto_tune:
+                await _autotune(run_session, opts)
+            elif arrivals is not None:
+                await _dispatch_open_loop(arrivals, run_session, opts, result, on_drop=drop_session)
+            else:
+                await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+        finally:
+            if pool:
+                await pool.close()
+                result.contexts_created = pool.created
+                result.contexts_retired = pool.retired
+            if sink:
+                sink.close()
+
+    if router:
+        for name, value in router.stats().items():
+            setattr(result, name, value)
+    cpu_after = _cpu_seconds()
+    result.cpu_python = cpu_after[0] - cpu_before[0]
+    result.cpu_browser = cpu_after[1] - cpu_before[1]
+    return result
+
+# ==================== ШАРДИРОВАНИЕ ПО ПРОЦЕССАМ ====================
+
+def run_shard(indices: list, opts, arrivals=None) -> RunResult:
+    """Точка входа процесса-шарда: свой event loop и свой Chromium."""
+    return asyncio.run(run(indices, opts, arrivals))
+
+def run_sharded(processes: int, opts, arrivals=None) -> RunResult:
+    indices = list(range(1, TOTAL_CHATS + 1))
+    # чередуем индексы (и моменты старта), чтобы номера чатов оставались глобально
+    # уникальными, а суммарный поток по шардам повторял расписание
+    if arrivals is not None:
+        shards = [([], arrivals[k::processes]) for k in range(processes)]
+    else:
+        shards = [(indices[k::processes], None) for k in range(processes)]
+    shards = [s for s in shards if s[0] or s[1]]
+    result = RunResult()
+    # spawn: fork процесса с живым asyncio/Playwright небезопасен
+    shard_opts = []
+    for k in range(len(shards)):
+        o = copy.copy(opts)
+        if opts.results:
+            # у каждого шарда свой файл: results.jsonl -> results.shard1.jsonl
+            o.results = opts.results.with_name(f"{opts.results.stem}.shard{k + 1}{opts.results.suffix}")
+        shard_opts.append(o)
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(shards), mp_context=ctx) as ex:
+        parts = ex.map(run_shard, [s[0] for s in shards], shard_opts, [s[1] for s in shards])
+        for part in parts:
+            result.merge(part)
+    return result
+
+def _csv_set(value: str) -> set:
+    return {v.strip() for v in value.split(",") if v.strip()}
 
-        tasks = [asyncio.create_task(worker(i)) for i in range(1, TOTAL_CHATS + 1)]
-        await asyncio.gather(*tasks)
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Нагрузочный прогон чат-виджета (Playwright)")
+    ap.add_argument("--no-pool", action="store_true", default=not USE_CONTEXT_POOL,
+                    help="новый BrowserContext на каждый чат (как раньше) — для сравнения")
+    ap.add_argument("--processes", type=int, default=1,
+                    help="число процессов-шардов; в каждом свой Chromium и CONCURRENCY сессий")
+    ap.add_argument("--no-routes", action="store_true", default=not USE_ASSET_ROUTES,
+                    help="не перехватывать запросы (без блокировки и кэша статики)")
+    ap.add_argument("--block-types", type=_csv_set, default=set(BLOCK_RESOURCE_TYPES),
+                    help="типы ресурсов Playwright для блокировки, через запятую ('' — ничего)")
+    ap.add_argument("--block-hosts", type=_csv_set, default=set(BLOCK_HOSTS),
+                    help="сторонние хосты для блокировки, через запятую")
+    ap.add_argument("--asset-cache", choices=("memory", "disk", "off"), default="memory",
+                    help="где хранить кэш статики виджета")
+    ap.add_argument("--cache-dir", type=Path, default=Path(".asset_cache"),
+                    help="каталог для --asset-cache disk")
+    ap.add_argument("--seed-har", type=Path, default=None,
+                    help="предзаполнить кэш статики из HAR-файла")
+    ap.add_argument("--schedule", type=Path, default=None,
+                    help="open-loop: JSON-файл профиля прихода сессий (см. loadprofile.py)")
+    ap.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT,
+                    help="open-loop: предел одновременных сессий (на процесс)")
+    ap.add_argument("--late-ms", type=float, default=LATE_START_MS,
+                    help="open-loop: порог опоздания старта, мс")
+    ap.add_argument("--think", type=ThinkTime.parse, default=ThinkTime.parse(THINK_TIME),
+                    help="пауза после каждого сообщения: 0 | fixed:S | uniform:A:B | lognormal:MEDIAN:SIGMA")
+    ap.add_argument("--no-transcript-wait", action="store_true", default=not WAIT_TRANSCRIPT,
+                    help="не ждать появления сообщения в переписке после отправки")
+    ap.add_argument("--auto-tune", action="store_true",
+                    help="искать максимальную concurrency, при которой держится SLO")
+    ap.add_argument("--tune-start", type=int, default=TUNE_START)
+    ap.add_argument("--tune-step", type=int, default=TUNE_STEP)
+    ap.add_argument("--tune-min-step", type=int, default=TUNE_MIN_STEP)
+    ap.add_argument("--tune-max", type=int, default=TUNE_MAX)
+    ap.add_argument("--tune-window", type=float, default=TUNE_WINDOW_S, help="секунд на каждый шаг")
+    ap.add_argument("--slo-success", type=float, default=SLO_SUCCESS, help="мин. доля успешных сессий")
+    ap.add_argument("--slo-p90-ms", type=float, default=SLO_P90_MS, help="макс. p90 длительности сессии, мс")
+    ap.add_argument("--gen-cpu-max", type=float, default=GEN_CPU_MAX, help="%% CPU хоста у генератора")
+    ap.add_argument("--gen-mem-min", type=float, default=GEN_MEM_MIN, help="мин. доля свободной памяти")
+    ap.add_argument("--results", type=Path, default=None,
+                    help="писать по JSON-записи на сессию в этот JSONL (см. resultsink.py)")
+    ap.add_argument("--quiet", action="store_true", help="не печатать строку на каждый чат")
+    ap.add_argument("--hist-json", type=Path, default=None,
+                    help="сохранить гистограммы шагов в JSON (сливаемые между прогонами)")
+    ap.add_argument("--hist-csv", type=Path, default=None,
+                    help="сохранить сводку p50/p90/p99/max по шагам в CSV")
+    return ap.parse_args(argv)
 
-    print(f"\nDone. Success: {success}/{TOTAL_CHATS}")
+def main():
+    opts = parse_args()
+    opts.processes = max(1, opts.processes)
+    if opts.auto_tune and (opts.processes > 1 or opts.schedule):
+        raise SystemExit("--auto-tune работает в одном процессе и без --schedule")
+    arrivals = None
+    if opts.schedule:
+        times = arrival_times(load_schedule(opts.schedule))
+        arrivals = list(enumerate(times, start=1))
+    started = time.perf_counter()
+    if opts.processes > 1:
+        result = run_sharded(opts.processes, opts, arrivals)
+    elif arrivals is not None:
+        result = asyncio.run(run([], opts, arrivals))
+    else:
+        result = asyncio.run(run(range(1, TOTAL_CHATS + 1), opts))
+    print_report(result, time.perf_counter() - started, opts)
+    if opts.hist_json:
+        result.stages.to_json(opts.hist_json)
+    if opts.hist_csv:
+        result.stages.to_csv(opts.hist_csv)
 
 if __name__ == "__main__":
-    asyncio.run(run())
+    main()
@@ -0,0 +1,80 @@
+"""
+Наблюдение за самим генератором нагрузки: CPU всего дерева процессов
+(Python + драйвер Playwright + Chromium) и свободная память хоста.
+Нужно, чтобы насыщение генератора не приняли за насыщение бэкенда.
+
+Linux: читаем /proc. На других ОС — только CPU текущего процесса, память неизвестна.
+
+    mon = GeneratorMonitor()
+    ...
+    cpu_pct, mem_free = mon.sample()   # за время с прошлого sample()
+"""
+import os
+import time
+from typing import Optional
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+def _read_stat(pid: str):
+    """(ppid, utime+stime в тиках) из /proc/<pid>/stat или None."""
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    # имя процесса в скобках может содержать пробелы — режем по последней ')'
+    fields = data[data.rfind(b")") + 2:].split()
+    return int(fields[1]), int(fields[11]) + int(fields[12])
+
+def tree_cpu_seconds(root_pid: int = None) -> float:
+    """Суммарное CPU-время процесса и всех его потомков, с."""
+    root_pid = root_pid or os.getpid()
+    if not os.path.isdir("/proc"):
+        t = os.times()
+        return t.user + t.system
+    parents, ticks = {}, {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        st = _read_stat(name)
+        if st is None:
+            continue
+        pid = int(name)
+        parents[pid], ticks[pid] = st
+    children = {}
+    for pid, ppid in parents.items():
+        children.setdefault(ppid, []).append(pid)
+    total, stack = 0, [root_pid]
+    while stack:
+        pid = stack.pop()
+        total += ticks.get(pid, 0)
+        stack.extend(children.get(pid, ()))
+    return total / _CLK_TCK
+
+def mem_available_fraction() -> Optional[float]:
+    """Доля доступной памяти хоста (MemAvailable / MemTotal) или None."""
+    try:
+        info = {}
+        with open("/proc/meminfo", "r", encoding="ascii") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                info[key] = int(rest.split()[0])
+        return info["MemAvailable"] / info["MemTotal"]
+    except (OSError, KeyError, ValueError, ZeroDivisionError):
+        return None
+
+class GeneratorMonitor:
+    def __init__(self, root_pid: int = None):
+        self.root_pid = root_pid or os.getpid()
+        self.ncpu = os.cpu_count() or 1
+        self._last_cpu = tree_cpu_seconds(self.root_pid)
+        self._last_t = time.monotonic()
+
+    def sample(self) -> tuple:
+        """(CPU генератора в % от всех ядер хоста, доля свободной памяти или None)."""
+        cpu = tree_cpu_seconds(self.root_pid)
+        now = time.monotonic()
+        wall = max(now - self._last_t, 1e-6)
+        pct = 100.0 * (cpu - self._last_cpu) / wall / self.ncpu
+        self._last_cpu, self._last_t = cpu, now
+        return pct, mem_available_fraction()
@@ -0,0 +1,171 @@
+"""
+Лёгкие сливаемые гистограммы задержек по шагам сценария.
+
+Значения храним в микросекундах в лог-линейных бакетах (как HdrHistogram):
+до 2**SUB_BITS мкс — точно, дальше относительная погрешность не хуже ~1.6%.
+Запись — пара целочисленных операций и инкремент в dict, т.е. единицы мкс.
+Гистограммы складываются (merge) — шарды/процессы можно объединять.
+
+    stages = StageStats()
+    t = time.perf_counter()
+    ...
+    stages.record("goto", time.perf_counter() - t)
+    print(stages.format_table())
+    stages.to_json(Path("run.json")); stages.to_csv(Path("run.csv"))
+"""
+import csv
+import json
+from pathlib import Path
+
+SUB_BITS = 7
+_SUB = 1 << SUB_BITS
+_HALF = _SUB >> 1
+
+PERCENTILES = (50, 90, 99)
+
+def _bucket(us: int) -> int:
+    if us < _SUB:
+        return us
+    shift = us.bit_length() - SUB_BITS
+    return _SUB + (shift - 1) * _HALF + ((us >> shift) - _HALF)
+
+def _bucket_high(idx: int) -> int:
+    """Верхняя граница бакета, мкс (по ней считаем перцентили — оценка сверху)."""
+    if idx < _SUB:
+        return idx
+    k = idx - _SUB
+    shift = k // _HALF + 1
+    mantissa = k % _HALF + _HALF
+    return ((mantissa + 1) << shift) - 1
+
+class Histogram:
+    __slots__ = ("counts", "count", "total_us", "min_us", "max_us")
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total_us = 0
+        self.min_us = None
+        self.max_us = 0
+
+    def record(self, seconds: float) -> None:
+        us = int(seconds * 1_000_000)
+        if us < 0:
+            us = 0
+        idx = _bucket(us)
+        self.counts[idx] = self.counts.get(idx, 0) + 1
+        self.count += 1
+        self.total_us += us
+        if self.min_us is None or us < self.min_us:
+            self.min_us = us
+        if us > self.max_us:
+            self.max_us = us
+
+    def merge(self, other: "Histogram") -> "Histogram":
+        for idx, n in other.counts.items():
+            self.counts[idx] = self.counts.get(idx, 0) + n
+        self.count += other.count
+        self.total_us += other.total_us
+        if other.min_us is not None and (self.min_us is None or other.min_us < self.min_us):
+            self.min_us = other.min_us
+        self.max_us = max(self.max_us, other.max_us)
+        return self
+
+    def percentile_ms(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, round(q / 100 * self.count))
+        seen = 0
+        for idx in sorted(self.counts):
+            seen += self.counts[idx]
+            if seen >= rank:
+                return min(_bucket_high(idx), self.max_us) / 1000
+        return self.max_us / 1000
+
+    def summary(self) -> dict:
+        row = {"count": self.count}
+        for q in PERCENTILES:
+            row[f"p{q}_ms"] = round(self.percentile_ms(q), 3)
+        row["max_ms"] = round(self.max_us / 1000, 3)
+        row["min_ms"] = round((self.min_us or 0) / 1000, 3)
+        row["mean_ms"] = round(self.total_us / self.count / 1000, 3) if self.count else 0.0
+        return row
+
+    def to_dict(self) -> dict:
+        return {
+            "sub_bits": SUB_BITS,
+            "count": self.count,
+            "total_us": self.total_us,
+            "min_us": self.min_us,
+            "max_us": self.max_us,
+            "counts": {str(k): v for k, v in sorted(self.counts.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Histogram":
+        if data.get("sub_bits", SUB_BITS) != SUB_BITS:
+            raise ValueError("Гистограмма записана с другим SUB_BITS — слить нельзя")
+        h = cls()
+        h.counts = {int(k): v for k, v in data["counts"].items()}
+        h.count = data["count"]
+        h.total_us = data["total_us"]
+        h.min_us = data["min_us"]
+        h.max_us = data["max_us"]
+        return h
+
+class StageStats:
+    """Набор гистограмм по именам шагов; порядок шагов — порядок первой записи."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def record(self, stage: str, seconds: float) -> None:
+        h = self.stages.get(stage)
+        if h is None:
+            h = self.stages[stage] = Histogram()
+        h.record(seconds)
+
+    def merge(self, other: "StageStats") -> "StageStats":
+        for stage, h in other.stages.items():
+            mine = self.stages.get(stage)
+            if mine is None:
+                self.stages[stage] = Histogram().merge(h)
+            else:
+                mine.merge(h)
+        return self
+
+    def rows(self) -> list:
+        return [dict(stage=stage, **h.summary()) for stage, h in self.stages.items()]
+
+    def format_table(self) -> str:
+        lines = [f"{'stage':<18}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        for r in self.rows():
+            lines.append(
+                f"{r['stage']:<18}{r['count']:>8}{r['p50_ms']:>10.1f}{r['p90_ms']:>10.1f}"
+                f"{r['p99_ms']:>10.1f}{r['max_ms']:>10.1f}"
+            )
+        return "\n".join(lines)
+
+    def to_json(self, path: Path) -> None:
+        """Полные гистограммы (можно слить с другими прогонами через from_json) + сводка."""
+        data = {
+            "summary": self.rows(),
+            "histograms": {stage: h.to_dict() for stage, h in self.stages.items()},
+        }
+        path.write_text(json.dumps(data, ensure_ascii=False, indent=1), encoding="utf-8")
+
+    @classmethod
+    def from_json(cls, path: Path) -> "StageStats":
+        data = json.loads(path.read_text(encoding="utf-8"))
+        stats = cls()
+        for stage, h in data["histograms"].items():
+            stats.stages[stage] = Histogram.from_dict(h)
+        return stats
+
+    def to_csv(self, path: Path) -> None:
+        rows = self.rows()
+        fields = ["stage", "count"] + [f"p{q}_ms" for q in PERCENTILES] + ["max_ms", "min_ms", "mean_ms"]
+        with path.open("w", encoding="utf-8", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=fields)
+            w.writeheader()
+            w.writerows(rows)
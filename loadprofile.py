@@ -0,0 +1,66 @@
+"""
+Профили нагрузки для open-loop режима: расписание прихода сессий.
+
+Файл расписания — JSON, например:
+    {"profile": "constant", "rate": 5, "duration": 120}
+    {"profile": "poisson",  "rate": 5, "duration": 120, "seed": 1}
+    {"profile": "step", "steps": [{"rate": 2, "duration": 60}, {"rate": 5, "duration": 60}]}
+    {"profile": "spike", "rate": 2, "duration": 120,
+     "spike_at": 60, "spike_rate": 20, "spike_duration": 10}
+
+rate — сессий в секунду, duration/spike_at/spike_duration — секунды.
+Для step/spike можно добавить "arrivals": "poisson" (по умолчанию — равномерно).
+Необязательный "max_sessions" обрезает расписание.
+"""
+import json
+import random
+from pathlib import Path
+
+PROFILES = ("constant", "poisson", "step", "spike")
+
+def load_schedule(path: Path) -> dict:
+    with path.open("r", encoding="utf-8") as f:
+        schedule = json.load(f)
+    profile = schedule.get("profile")
+    if profile not in PROFILES:
+        raise ValueError(f"Неизвестный профиль {profile!r}, ожидается один из {PROFILES}")
+    return schedule
+
+def segments(schedule: dict) -> list:
+    """Развернуть профиль в кусочно-постоянные отрезки [(rate, duration), ...]."""
+    profile = schedule["profile"]
+    if profile in ("constant", "poisson"):
+        return [(float(schedule["rate"]), float(schedule["duration"]))]
+    if profile == "step":
+        return [(float(s["rate"]), float(s["duration"])) for s in schedule["steps"]]
+    # spike: базовая нагрузка, всплеск, снова базовая
+    rate = float(schedule["rate"])
+    duration = float(schedule["duration"])
+    spike_at = float(schedule["spike_at"])
+    spike_len = float(schedule["spike_duration"])
+    tail = max(0.0, duration - spike_at - spike_len)
+    return [(rate, spike_at), (float(schedule["spike_rate"]), spike_len), (rate, tail)]
+
+def arrival_times(schedule: dict) -> list:
+    """Моменты старта сессий (секунды от начала прогона), по возрастанию."""
+    poisson = schedule["profile"] == "poisson" or schedule.get("arrivals") == "poisson"
+    rng = random.Random(schedule.get("seed"))
+    limit = schedule.get("max_sessions")
+
+    times = []
+    start = 0.0
+    for rate, duration in segments(schedule):
+        end = start + duration
+        if rate > 0:
+            k, t = 0, start
+            while True:
+                # равномерно — ровно rate*duration стартов; Пуассон — экспоненциальные интервалы
+                t = t + rng.expovariate(rate) if poisson else start + k / rate
+                k += 1
+                if t >= end:
+                    break
+                times.append(t)
+                if limit is not None and len(times) >= limit:
+                    return times
+        start = end
+    return times
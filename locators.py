@@ -0,0 +1,138 @@
+"""
+Набор альтернативных локаторов одного элемента, который запоминает, какой сработал.
+
+Раньше каждый поиск шёл по кандидатам всегда в одном порядке: на каждый
+промах — лишний find_element к chromedriver. LocatorSet пробует первым тот
+кандидат, что сработал последним, и сдвигает его назад, только когда он
+промахнулся, а сработал другой. По каждому кандидату копятся попадания и промахи.
+
+Кандидаты делятся на уровни (tiers) по специфичности: 0 — самые точные.
+Переставляются они только внутри своего уровня — общий локатор вроде
+"//button[@type='submit']" не обгонит точный, даже если однажды сработал
+только он: точный кандидат всё равно пробуется раньше.
+
+    SEND = LocatorSet("send", [(By.XPATH, xp1), (By.XPATH, xp2)], tiers=[0, 1],
+                      fallback=lambda d: _button_from_span(d, SEND_SPAN_LOC))
+    btn = SEND.find(driver)                                 # видимый элемент или None
+    box = SEND.until(wait, EC.element_to_be_clickable)      # через WebDriverWait
+    domwait.send_enabled(driver, SEND.xpaths())             # XPath в выученном порядке
+    print(SEND.report())
+"""
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.by import By
+
+FALLBACK = "fallback"
+
+class LocatorSet:
+    def __init__(self, name: str, candidates: list, fallback=None, tiers=None):
+        self.name = name
+        self.candidates = list(candidates)          # (By, value), в исходном порядке
+        self.tiers = list(tiers) if tiers is not None else [0] * len(self.candidates)
+        if len(self.tiers) != len(self.candidates):
+            raise ValueError(f"{name}: tiers и candidates разной длины")
+        # индексы; order[0] — пробуем первым; уровни всегда по возрастанию
+        self.order = sorted(range(len(self.candidates)), key=lambda i: (self.tiers[i], i))
+        self.fallback = fallback                    # fallback(driver) -> элемент (или исключение)
+        self.hits = [0] * len(self.candidates)
+        self.misses = [0] * len(self.candidates)
+        self.fallback_hits = 0
+        self.fallback_misses = 0
+
+    # ---------- порядок ----------
+
+    @property
+    def locator(self) -> tuple:
+        """Текущий лучший кандидат (By, value)."""
+        return self.candidates[self.order[0]]
+
+    def ordered(self) -> list:
+        return [self.candidates[i] for i in self.order]
+
+    def xpaths(self) -> list:
+        """XPath-кандидаты в выученном порядке (для domwait)."""
+        return [value for by, value in self.ordered() if by == By.XPATH]
+
+    def union(self) -> tuple:
+        """Все XPath одним локатором ("a | b") — для условий «ни одного нет» и Playwright."""
+        return (By.XPATH, " | ".join(self.xpaths()))
+
+    def _resolved(self, tried: list, hit) -> None:
+        """Учесть итог одного поиска: tried промахнулись, hit сработал (None — никто)."""
+        for i in tried:
+            self.misses[i] += 1
+        if hit is not None:
+            self.hits[hit] += 1
+            # в начало своего уровня, но не выше более точных кандидатов
+            self.order.remove(hit)
+            tier = self.tiers[hit]
+            pos = next((n for n, i in enumerate(self.order) if self.tiers[i] >= tier), len(self.order))
+            self.order.insert(pos, hit)
+
+    # ---------- поиск ----------
+
+    def find(self, driver, displayed: bool = True):
+        """Первый найденный (и видимый, если displayed) элемент; иначе fallback; иначе None."""
+        tried = []
+        for i in list(self.order):
+            try:
+                el = driver.find_element(*self.candidates[i])
+                if not displayed or el.is_displayed():
+                    self._resolved(tried, i)
+                    return el
+            except Exception:
+                pass
+            tried.append(i)
+        self._resolved(tried, None)
+        if self.fallback is None:
+            return None
+        try:
+            el = self.fallback(driver)
+            self.fallback_hits += 1
+            return el
+        except Exception:
+            self.fallback_misses += 1
+            return None
+
+    def until(self, wait, condition):
+        """
+        wait.until по кандидатам: condition — фабрика из expected_conditions
+        (EC.presence_of_element_located, EC.element_to_be_clickable, ...).
+        На каждом опросе кандидаты в выученном порядке; TimeoutException — как у wait.
+        """
+        last = []
+
+        def poll(driver):
+            last[:] = []
+            for i in self.order:
+                try:
+                    found = condition(self.candidates[i])(driver)
+                except Exception:
+                    found = False
+                if found:
+                    self._resolved(last, i)
+                    return found
+                last.append(i)
+            return False
+
+        try:
+            return wait.until(poll)
+        except TimeoutException:
+            self._resolved(last, None)
+            raise
+
+    # ---------- счётчики ----------
+
+    def counters(self) -> dict:
+        """{value локатора: (попаданий, промахов)} + fallback, если он есть."""
+        out = {value: (self.hits[i], self.misses[i]) for i, (_, value) in enumerate(self.candidates)}
+        if self.fallback is not None:
+            out[FALLBACK] = (self.fallback_hits, self.fallback_misses)
+        return out
+
+    def report(self) -> str:
+        lines = [f"{self.name}: первым пробуем #{self.order[0] + 1}"]
+        for n, (value, (hits, misses)) in enumerate(self.counters().items(), 1):
+            label = value if value == FALLBACK else f"#{n} {value}"
+            lines.append(f"    {hits:>6} попаданий {misses:>6} промахов  {label[:90]}")
+        return "\n".join(lines)
+
@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+# protochat.py
+# Безбраузерная нагрузка на чат-бэкенд: HTTP + SignalR напрямую из asyncio.
+# Usage:
+#   python protochat.py widget.har --total 5000 --concurrency 1000
+#   python protochat.py widget.har --target http://127.0.0.1:8765     # против stubserver.py
+#   python protochat.py --with-stub                                   # самопроверка на заглушке
+"""
+Третий движок рядом с Selenium (MultChatV2.start_chat) и Playwright (fastchat.one_chat).
+
+Последовательность запросов выводится из записанного HAR (того же, что разбирает
+HARanalys.py): XHR/fetch-вызовы виджета и websocket-кадры, упорядоченные по времени.
+- значения из JSON-ответов (chatId, connectionToken, ...), которые потом встречаются
+  в URL/телах/кадрах, становятся переменными и подставляются из живых ответов;
+- userId и текст сообщения (по шаблонам USER_PATTERN / MESSAGE_PATTERN) подставляются
+  заново для каждой сессии; шаги с сообщением повторяются 2–7 раз;
+- invocationId SignalR нумеруется заново; ping-кадры шлёт keepalive.
+Доставка сообщения подтверждается входящим кадром с токеном сообщения.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import string
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+from urllib.parse import quote, urlsplit, urlunsplit
+
+from asyncnet import HttpClient, WebSocket
+from latency import StageStats
+from resultsink import ResultSink, StepLog
+
+REC_SEP = "\x1e"  # SignalR record separator
+
+# ====================== НАСТРОЙКИ ======================
+TOTAL_CHATS = 1000
+CONCURRENCY = 500          # одновременных сессий в одном процессе
+MESSAGES_MIN, MESSAGES_MAX = 2, 7
+MESSAGE_TEXT = "Test message"
+TIMEOUT_S = 15.0           # на один HTTP-запрос / подключение
+ECHO_TIMEOUT_S = 10.0      # ждать эхо-кадра с токеном сообщения
+KEEPALIVE_S = 15.0         # SignalR ping {"type":6}
+
+# как в записи выглядят userId и текст сообщения (форматы fastchat.py)
+USER_PATTERN = r"Test \d+-[A-Za-z0-9]{6}"
+MESSAGE_PATTERN = r"Test message #\d+\.\d+"
+MIN_VAR_LEN = 8            # короче — не считаем динамическим значением (id/токен)
+
+# заголовки из HAR, которые не переносим (их ставит клиент или они привязаны к браузеру)
+SKIP_HEADERS = {"host", "content-length", "connection", "cookie", "accept-encoding",
+                "sec-websocket-key", "sec-websocket-version", "sec-websocket-extensions",
+                "upgrade", "origin"}
+
+_PLACEHOLDER = re.compile(r"\{\{(\w+)\}\}")
+_INVOCATION = re.compile(r'"invocationId"\s*:\s*"\d+"')
+_PING = re.compile(r'^\s*\{\s*"type"\s*:\s*6\s*\}\s*$')
+
+# ==================== ВСПОМОГАТЕЛЬНО ====================
+
+def rnd_suffix(n: int = 6) -> str:
+    alphabet = string.ascii_letters + string.digits
+    return "".join(random.choice(alphabet) for _ in range(n))
+
+def _rand_token(k: int = 6) -> str:
+    alphabet = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+    return "".join(random.choice(alphabet) for _ in range(k))
+
+def _epoch(ts) -> float:
+    if isinstance(ts, (int, float)):
+        return float(ts)
+    try:
+        return datetime.fromisoformat(re.sub("Z$", "+00:00", ts)).timestamp()
+    except Exception:
+        return 0.0
+
+def _flatten(obj, path=()):
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            yield from _flatten(v, path + (k,))
+    elif isinstance(obj, list):
+        for i, v in enumerate(obj):
+            yield from _flatten(v, path + (i,))
+    else:
+        yield path, obj
+
+def _dig(obj, path):
+    for p in path:
+        obj = obj[p]
+    return obj
+
+def render(template: str, values: dict, escape=None) -> str:
+    def sub(m):
+        v = str(values[m.group(1)])
+        return escape(v) if escape else v
+    return _PLACEHOLDER.sub(sub, template)
+
+def _json_escape(v: str) -> str:
+    return json.dumps(v, ensure_ascii=False)[1:-1]
+
+def _url_escape(v: str) -> str:
+    return quote(v, safe="")
+
+def retarget(url: str, target: str) -> str:
+    """Заменить схему/хост записанного URL на --target (ws/wss — по схеме target)."""
+    if not target:
+        return url
+    src, dst = urlsplit(url), urlsplit(target)
+    scheme = dst.scheme
+    if src.scheme in ("ws", "wss"):
+        scheme = "wss" if dst.scheme == "https" else "ws"
+    return urlunsplit((scheme, dst.netloc, src.path, src.query, src.fragment))
+
+# ==================== СЦЕНАРИЙ ИЗ HAR ====================
+
+class Step:
+    __slots__ = ("kind", "label", "method", "url", "headers", "body", "extract", "repeat")
+
+    def __init__(self, kind, label, method="", url="", headers=None, body=""):
+        self.kind = kind            # "http" | "ws_open" | "ws_send"
+        self.label = label
+        self.method = method
+        self.url = url
+        self.headers = headers or {}
+        self.body = body            # тело запроса или текст кадра
+        self.extract = {}           # var -> путь в JSON-ответе
+        self.repeat = False         # шаг отправки сообщения (повторяется N раз)
+
+    def describe(self) -> str:
+        extra = f" extract={sorted(self.extract)}" if self.extract else ""
+        rep = " [per message]" if self.repeat else ""
+        return f"{self.kind:<8}{self.label:<28}{self.url or ''} {self.body[:80]!r}{extra}{rep}"
+
+def _label(method: str, url: str) -> str:
+    path = [p for p in urlsplit(url).path.split("/") if p]
+    return f"{method} {path[-1] if path else '/'}"
+
+def _har_events(entries, include):
+    events = []
+    for e in entries:
+        req = e.get("request", {}) or {}
+        url = req.get("url") or ""
+        if include and not include.search(url):
+            continue
+        rtype = e.get("_resourceType")
+        started = _epoch(e.get("startedDateTime"))
+        msgs = e.get("_webSocketMessages") or e.get("webSocketMessages")
+        if msgs is not None or rtype == "websocket":
+            events.append((started, "ws_open", e, None))
+            for m in msgs or []:
+                if m.get("type") == "send" and m.get("opcode", 1) == 1:
+                    events.append((_epoch(m.get("time")) or started, "ws_send", e, m.get("data") or ""))
+        elif rtype in ("xhr", "fetch"):
+            events.append((started, "http", e, None))
+    events.sort(key=lambda ev: ev[0])
+    return events
+
+def build_script(har: dict, include=None, user_pattern=USER_PATTERN,
+                 message_pattern=MESSAGE_PATTERN) -> list:
+    entries = (har.get("log") or {}).get("entries") or []
+    user_re = re.compile(user_pattern)
+    msg_re = re.compile(message_pattern)
+    known = {}          # записанное значение -> имя переменной
+    steps = []
+    seen_repeat = False
+    repeat_signatures = set()
+    in_repeat_group = False
+
+    def templ(text: str) -> str:
+        for value in sorted(known, key=len, reverse=True):
+            if value in text:
+                text = text.replace(value, "{{%s}}" % known[value])
+        text = user_re.sub("{{user}}", text)
+        return msg_re.sub("{{message}}", text)
+
+    for _, kind, e, frame in _har_events(entries, include):
+        req = e.get("request", {}) or {}
+        url = templ(req.get("url") or "")
+        headers = {h["name"]: templ(h.get("value") or "") for h in req.get("headers") or []
+                   if h.get("name") and not h["name"].startswith(":")
+                   and h["name"].lower() not in SKIP_HEADERS}
+
+        if kind == "ws_send":
+            if _PING.match(frame.rstrip(REC_SEP)):
+                continue    # keepalive шлём сами
+            step = Step("ws_send", "ws_send", body=_INVOCATION.sub('"invocationId":"{{inv}}"', templ(frame)))
+        elif kind == "ws_open":
+            step = Step("ws_open", "ws_connect", "GET", url, headers)
+        else:
+            body = templ(((req.get("postData") or {}).get("text")) or "")
+            step = Step("http", _label(req.get("method") or "GET", req.get("url") or ""),
+                        req.get("method") or "GET", url, headers, body)
+
+        is_message = "{{message}}" in step.body or "{{message}}" in step.url
+        if is_message:
+            signature = (step.kind, step.url, step.body)
+            if signature in repeat_signatures:
+                in_repeat_group = False     # началось следующее сообщение — шаблон собран
+            if seen_repeat and not in_repeat_group:
+                continue    # остальные записанные сообщения — повторы шаблона
+            repeat_signatures.add(signature)
+            seen_repeat = in_repeat_group = True
+            step.repeat = True
+            if step.kind == "ws_send":
+                step.label = "send"
+        else:
+            in_repeat_group = False
+
+        if kind == "http":
+            text = (((e.get("response") or {}).get("content") or {}).get("text")) or ""
+            try:
+                data = json.loads(text) if text else None
+            except ValueError:
+                data = None
+            for path, value in _flatten(data) if data is not None else ():
+                if isinstance(value, str) and len(value) >= MIN_VAR_LEN and value not in known:
+                    var = f"v{len(known) + 1}"
+                    known[value] = var
+                    step.extract[var] = path
+        steps.append(step)
+    return steps
+
+# ==================== СЕССИЯ ====================
+
+OK, TIMEOUT, ERROR = "ok", "timeout", "error"
+
+class HttpStatusError(Exception):
+    pass
+
+class SessionStats:
+    """Итоги процесса: исходы сессий, доставка сообщений и гистограммы шагов."""
+
+    def __init__(self):
+        self.total = 0
+        self.success = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.delivered = 0
+        self.lost = 0
+        self.error_kinds = {}
+        self.stages = StageStats()
+
+    def add(self, outcome: str, seconds: float, error: Exception = None) -> None:
+        self.total += 1
+        if outcome == OK:
+            self.success += 1
+            self.stages.record("session", seconds)
+        elif outcome == TIMEOUT:
+            self.timeouts += 1
+        else:
+            self.errors += 1
+            name = type(error).__name__ if error else "Error"
+            self.error_kinds[name] = self.error_kinds.get(name, 0) + 1
+
+async def run_session(steps: list, index: int, opts, stats: SessionStats,
+                      sink: Optional[ResultSink] = None) -> str:
+    clock = time.perf_counter
+    log = StepLog(stats.stages) if sink else None
+    stages = log if log is not None else stats.stages
+    http = HttpClient(verify=not opts.insecure)
+    ws = None
+    tasks = []
+    pending = {}        # токен сообщения -> момент отправки
+    echoed = asyncio.Event()
+    values = {"user": f"Test {index}-{rnd_suffix()}", "inv": 0}
+
+    async def reader():
+        while True:
+            text = await ws.recv_text()
+            if not pending:
+                continue
+            now = clock()
+            for token in [t for t in pending if t in text]:
+                stages.record("echo", now - pending.pop(token))
+                stats.delivered += 1
+            if not pending:
+                echoed.set()
+
+    async def keepalive():
+        while True:
+            await asyncio.sleep(KEEPALIVE_S)
+            await ws.send_text('{"type":6}' + REC_SEP)
+
+    async def execute(step: Step) -> None:
+        nonlocal ws
+        t = clock()
+        if step.kind == "http":
+            body = render(step.body, values, _json_escape).encode("utf-8")
+            resp = await asyncio.wait_for(http.request(
+                step.method, retarget(render(step.url, values, _url_escape), opts.target),
+                {k: render(v, values) for k, v in step.headers.items()}, body), TIMEOUT_S)
+            stages.record(step.label, clock() - t)
+            if resp.status >= 400:
+                raise HttpStatusError(f"{step.label}: HTTP {resp.status}")
+            if step.extract:
+                data = json.loads(resp.body)
+                for var, path in step.extract.items():
+                    values[var] = _dig(data, path)
+        elif step.kind == "ws_open":
+            if ws is not None:
+                await ws.close()
+            ws = await asyncio.wait_for(WebSocket.connect(
+                retarget(render(step.url, values, _url_escape), opts.target),
+                {k: render(v, values) for k, v in step.headers.items()},
+                verify=not opts.insecure), TIMEOUT_S)
+            stages.record("ws_connect", clock() - t)
+            tasks.extend([asyncio.create_task(reader()), asyncio.create_task(keepalive())])
+        else:
+            if "{{inv}}" in step.body:
+                values["inv"] += 1
+            await ws.send_text(render(step.body, values, _json_escape))
+            stages.record(step.label, clock() - t)
+
+    started = clock()
+    started_wall = time.time()
+    outcome, error = ERROR, None
+    try:
+        i = 0
+        while i < len(steps):
+            if not steps[i].repeat:
+                await execute(steps[i])
+                i += 1
+                continue
+            j = i
+            while j < len(steps) and steps[j].repeat:
+                j += 1
+            for n in range(random.randint(opts.messages_min, opts.messages_max)):
+                token = _rand_token()
+                if log is not None:
+                    log.messages += 1
+                values["message"] = f"{MESSAGE_TEXT} #{index}.{n + 1} [{token}]"
+                if ws is not None:
+                    echoed.clear()
+                    pending[token] = clock()
+                for step in steps[i:j]:
+                    await execute(step)
+            i = j
+
+        if pending:
+            try:
+                await asyncio.wait_for(echoed.wait(), opts.echo_timeout)
+            except asyncio.TimeoutError:
+                pass
+        stats.lost += len(pending)
+        stats.add(OK, clock() - started)
+        outcome = OK
+        return OK
+    except asyncio.TimeoutError as e:
+        stats.add(TIMEOUT, 0.0)
+        outcome, error = TIMEOUT, type(e).__name__
+        return TIMEOUT
+    except Exception as e:
+        if not opts.quiet:
+            print(f"[ERR] Chat #{index}: {type(e).__name__}: {e}")
+        stats.add(ERROR, 0.0, e)
+        error = type(e).__name__
+        return ERROR
+    finally:
+        if log is not None:
+            sink.session(index, started_wall, started_wall + clock() - started, steps=log.steps,
+                         messages=log.messages, outcome=outcome, error=error, lost=len(pending))
+        for task in tasks:
+            task.cancel()
+        if ws is not None:
+            await ws.close()
+        await http.close()
+
+async def run(steps: list, opts) -> SessionStats:
+    stats = SessionStats()
+    sink = ResultSink(opts.results, engine="protochat") if opts.results else None
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(1, opts.total + 1):
+        queue.put_nowait(i)
+
+    async def worker():
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await run_session(steps, i, opts, stats, sink)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(min(opts.concurrency, opts.total))))
+    finally:
+        if sink:
+            sink.close()
+    return stats
+
+def print_report(stats: SessionStats, elapsed: float) -> None:
+    print(f"\nDone. Success: {stats.success}/{stats.total}")
+    print(f"Timeouts: {stats.timeouts}, errors: {stats.errors}"
+          + (f" {stats.error_kinds}" if stats.error_kinds else ""))
+    print(f"Messages: delivered {stats.delivered}, lost {stats.lost}")
+    if stats.stages.stages:
+        print(stats.stages.format_table())
+    cpu = time.process_time()
+    print(f"Rate: {stats.total / elapsed:.1f} sessions/s за {elapsed:.1f} с; CPU: python {cpu:.1f} с")
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="Безбраузерная нагрузка на чат: HTTP + SignalR из HAR")
+    ap.add_argument("har", type=Path, nargs="?", help="HAR с записью одной сессии виджета")
+    ap.add_argument("--target", default="", help="заменить схему/хост из HAR, напр. http://127.0.0.1:8765")
+    ap.add_argument("--include", default="", help="regex: брать из HAR только такие URL")
+    ap.add_argument("--user-pattern", default=USER_PATTERN)
+    ap.add_argument("--message-pattern", default=MESSAGE_PATTERN)
+    ap.add_argument("--total", type=int, default=TOTAL_CHATS)
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    ap.add_argument("--messages-min", type=int, default=MESSAGES_MIN)
+    ap.add_argument("--messages-max", type=int, default=MESSAGES_MAX)
+    ap.add_argument("--echo-timeout", type=float, default=ECHO_TIMEOUT_S)
+    ap.add_argument("--insecure", action="store_true", help="не проверять TLS-сертификаты")
+    ap.add_argument("--quiet", action="store_true", help="не печатать ошибки по каждому чату")
+    ap.add_argument("--dump-script", action="store_true", help="показать выведенный из HAR сценарий и выйти")
+    ap.add_argument("--with-stub", action="store_true",
+                    help="поднять stubserver.py в этом процессе и гонять сессии против него")
+    ap.add_argument("--results", type=Path, default=None,
+                    help="писать по JSON-записи на сессию в этот JSONL (см. resultsink.py)")
+    ap.add_argument("--hist-json", type=Path, default=None)
+    ap.add_argument("--hist-csv", type=Path, default=None)
+    args = ap.parse_args(argv)
+    if not args.har and not args.with_stub:
+        ap.error("нужен HAR или --with-stub")
+    return args
+
+async def amain(opts) -> SessionStats:
+    server = None
+    if opts.with_stub:
+        import stubserver
+        server, _ = await stubserver.start_server("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        opts.target = f"http://127.0.0.1:{port}"
+        har = stubserver.sample_har(opts.target)
+    else:
+        from HARanalys import load_har
+        har = load_har(opts.har)
+
+    steps = build_script(har, re.compile(opts.include) if opts.include else None,
+                         opts.user_pattern, opts.message_pattern)
+    if opts.dump_script or not steps:
+        for s in steps:
+            print(s.describe())
+        if not steps:
+            print("В HAR не нашлось XHR/fetch/websocket-шагов")
+        return SessionStats()
+
+    try:
+        return await run(steps, opts)
+    finally:
+        if server is not None:
+            server.close()
+
+def main():
+    opts = parse_args()
+    started = time.perf_counter()
+    stats = asyncio.run(amain(opts))
+    if opts.dump_script or not stats.total:
+        return
+    print_report(stats, time.perf_counter() - started)
+    if opts.hist_json:
+        stats.stages.to_json(opts.hist_json)
+    if opts.hist_csv:
+        stats.stages.to_csv(opts.hist_csv)
+
+if __name__ == "__main__":
+    main()
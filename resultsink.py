@@ -0,0 +1,142 @@
+"""
+Потоковая запись результатов сессий в JSONL — общий для всех движков.
+
+write() только кладёт dict в очередь (доли микросекунды); сериализация и
+запись на диск идут в фоновом потоке пачками, файл ротируется по размеру.
+Подходит и для asyncio (fastchat/protochat), и для потоков Selenium.
+
+    with ResultSink(Path("results.jsonl"), engine="playwright") as sink:
+        steps = StepLog(stages)            # шаги одной сессии (и в общие гистограммы)
+        ...
+        sink.session(index, started, time.time(), steps=steps.steps,
+                     messages=3, outcome="ok")
+
+Запись: {"index", "engine", "start", "end", "duration_ms", "steps": {stage: [ms, ...]},
+         "messages", "outcome", "error", ...доп. поля}
+Переданный в write() dict после вызова менять нельзя — его сериализует другой поток.
+"""
+import json
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+BATCH_SIZE = 500
+FLUSH_INTERVAL_S = 1.0
+MAX_BYTES = 100 * 1024 * 1024   # после этого размера файл ротируется
+
+_STOP = object()
+
+class StepLog:
+    """
+    Шаги одной сессии в миллисекундах (+ число сообщений и класс ошибки).
+    Метод record() совместим с latency.StageStats.record и при желании
+    пробрасывает значение туда же.
+    """
+    __slots__ = ("steps", "forward", "messages", "error")
+
+    def __init__(self, forward=None):
+        self.steps = {}
+        self.forward = forward
+        self.messages = 0
+        self.error = None       # имя класса исключения последней неудачной попытки
+
+    def record(self, stage: str, seconds: float) -> None:
+        if self.forward is not None:
+            self.forward.record(stage, seconds)
+        self.steps.setdefault(stage, []).append(round(seconds * 1000, 1))
+
+class ResultSink:
+    def __init__(self, path: Path, engine: str, batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL_S, max_bytes: int = MAX_BYTES):
+        self.path = Path(path)
+        self.engine = engine
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.written = 0
+        self._rotation = 0
+        self._q = queue.SimpleQueue()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="result-sink", daemon=True)
+        self._thread.start()
+
+    # ---------- горячий путь ----------
+
+    def write(self, record: dict) -> None:
+        self._q.put(record)
+
+    def session(self, index, started: float, ended: float, steps: Optional[dict] = None,
+                messages: int = 0, outcome: str = "ok", error: Optional[str] = None, **extra) -> None:
+        record = {
+            "index": index,
+            "engine": self.engine,
+            "start": round(started, 3),
+            "end": round(ended, 3),
+            "duration_ms": round((ended - started) * 1000, 1),
+            "steps": steps or {},
+            "messages": messages,
+            "outcome": outcome,
+            "error": error,
+        }
+        if extra:
+            record.update(extra)
+        self._q.put(record)
+
+    # ---------- фоновый поток ----------
+
+    def _rotate(self, f):
+        f.close()
+        self._rotation += 1
+        rotated = self.path.with_name(f"{self.path.stem}.{self._rotation:05d}{self.path.suffix}")
+        while rotated.exists():
+            self._rotation += 1
+            rotated = self.path.with_name(f"{self.path.stem}.{self._rotation:05d}{self.path.suffix}")
+        self.path.rename(rotated)
+        return self.path.open("a", encoding="utf-8")
+
+    def _run(self) -> None:
+        f = self.path.open("a", encoding="utf-8")
+        size = f.tell()
+        stop = False
+        try:
+            while not stop:
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = self._q.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stop = True
+                        break
+                    batch.append(item)
+                if not batch:
+                    continue
+                chunk = "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in batch)
+                f.write(chunk)
+                f.flush()
+                self.written += len(batch)
+                size += len(chunk.encode("utf-8"))
+                if size >= self.max_bytes:
+                    f = self._rotate(f)
+                    size = 0
+        finally:
+            f.close()
+
+    def close(self) -> None:
+        """Дописать всё из очереди и остановить поток."""
+        if self._thread.is_alive():
+            self._q.put(_STOP)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,212 @@
+"""
+Перехват запросов виджета через Playwright routing:
+- блокировка выбранных типов ресурсов и сторонних хостов (аналитика и т.п.);
+- раздача статики виджета (JS/CSS/шрифты/картинки) из общего кэша процесса —
+  в памяти или на диске, с опциональным предзаполнением из HAR.
+
+Использование:
+    router = AssetRouter(cache_dir=None)
+    router.seed_from_har(Path("widget.har"))   # по желанию
+    await router.install(context)
+"""
+import asyncio
+import base64
+import hashlib
+import json
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit
+
+# что блокируем по умолчанию: для нагрузки на чат-бэкенд это лишний трафик
+BLOCK_RESOURCE_TYPES = {"image", "media", "font"}
+BLOCK_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "connect.facebook.net",
+    "mc.yandex.ru",
+    "hotjar.com",
+    "sentry.io",
+)
+# что кэшируем (если не заблокировано)
+CACHE_RESOURCE_TYPES = {"script", "stylesheet", "font", "image"}
+
+# при раздаче из кэша тело уже распаковано — эти заголовки отдавать нельзя
+_DROP_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+_MIME_TO_TYPE = (
+    ("javascript", "script"),
+    ("ecmascript", "script"),
+    ("text/css", "stylesheet"),
+    ("font", "font"),
+    ("image/", "image"),
+)
+
+def _host_blocked(url: str, hosts) -> bool:
+    host = (urlsplit(url).hostname or "").lower()
+    return any(host == h or host.endswith("." + h) for h in hosts)
+
+def _type_from_mime(mime: str) -> Optional[str]:
+    mime = (mime or "").lower()
+    for frag, rtype in _MIME_TO_TYPE:
+        if frag in mime:
+            return rtype
+    return None
+
+def _clean_headers(headers: dict) -> dict:
+    return {k: v for k, v in headers.items() if k.lower() not in _DROP_HEADERS}
+
+class AssetRouter:
+    def __init__(self,
+                 block_types=BLOCK_RESOURCE_TYPES,
+                 block_hosts=BLOCK_HOSTS,
+                 cache_types=CACHE_RESOURCE_TYPES,
+                 use_cache: bool = True,
+                 cache_dir: Optional[Path] = None):
+        self.block_types = set(block_types)
+        self.block_hosts = tuple(h.lower() for h in block_hosts)
+        self.cache_types = set(cache_types) - self.block_types
+        self.use_cache = use_cache
+        self.cache_dir = cache_dir
+        if cache_dir:
+            cache_dir.mkdir(parents=True, exist_ok=True)
+        self._mem = {}        # url -> (status, headers, body)
+        self._inflight = {}   # url -> Future: один сетевой запрос на URL на процесс
+
+        # статистика
+        self.requests = 0
+        self.blocked = 0
+        self.cache_hits = 0
+        self.bytes_saved = 0
+        self.fetched_bytes = 0
+
+    async def install(self, context) -> None:
+        await context.route("**/*", self._handle)
+
+    # ---------- обработчик ----------
+
+    async def _handle(self, route, request) -> None:
+        self.requests += 1
+        url = request.url
+        rtype = request.resource_type
+
+        if rtype in self.block_types or _host_blocked(url, self.block_hosts):
+            self.blocked += 1
+            await route.abort("blockedbyclient")
+            return
+
+        if not (self.use_cache and request.method == "GET" and rtype in self.cache_types):
+            await route.continue_()
+            return
+
+        entry = self._lookup(url)
+        if entry is not None:
+            status, headers, body = entry
+            self.cache_hits += 1
+            self.bytes_saved += len(body)
+            await route.fulfill(status=status, headers=headers, body=body)
+            return
+
+        fut = self._inflight.get(url)
+        if fut is not None:
+            # этот URL уже качает другая сессия — дождёмся её
+            try:
+                status, headers, body = await asyncio.shield(fut)
+            except Exception:
+                await route.continue_()
+                return
+            self.cache_hits += 1
+            self.bytes_saved += len(body)
+            await route.fulfill(status=status, headers=headers, body=body)
+            return
+
+        fut = asyncio.get_running_loop().create_future()
+        self._inflight[url] = fut
+        try:
+            response = await route.fetch()
+            body = await response.body()
+            entry = (response.status, _clean_headers(response.headers), body)
+            self.fetched_bytes += len(body)
+            if response.status == 200:
+                self._store(url, entry)
+            fut.set_result(entry)
+            await route.fulfill(status=entry[0], headers=entry[1], body=body)
+        except Exception as e:
+            if not fut.done():
+                fut.set_exception(e)
+                fut.exception()  # помечаем как прочитанное — без warning'а в логе
+            try:
+                await route.abort()
+            except Exception:
+                pass  # страницу могли уже закрыть
+        finally:
+            self._inflight.pop(url, None)
+
+    # ---------- кэш ----------
+
+    def _disk_path(self, url: str) -> Path:
+        return self.cache_dir / hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def _lookup(self, url: str):
+        entry = self._mem.get(url)
+        if entry is not None or not self.cache_dir:
+            return entry
+        base = self._disk_path(url)
+        try:
+            meta = json.loads(base.with_suffix(".json").read_text(encoding="utf-8"))
+            body = base.with_suffix(".bin").read_bytes()
+        except (OSError, ValueError):
+            return None
+        entry = (meta["status"], meta["headers"], body)
+        self._mem[url] = entry
+        return entry
+
+    def _store(self, url: str, entry) -> None:
+        self._mem[url] = entry
+        if not self.cache_dir:
+            return
+        status, headers, body = entry
+        base = self._disk_path(url)
+        try:
+            base.with_suffix(".bin").write_bytes(body)
+            base.with_suffix(".json").write_text(
+                json.dumps({"url": url, "status": status, "headers": headers}), encoding="utf-8"
+            )
+        except OSError:
+            pass  # диск — только ускорение, без него работаем из памяти
+
+    def seed_from_har(self, path: Path) -> int:
+        """Заполнить кэш статикой из HAR (как в HARanalys.py). Возвращает число записей."""
+        from HARanalys import load_har
+
+        har = load_har(path)
+        added = 0
+        for e in (har.get("log") or {}).get("entries") or []:
+            req = e.get("request", {}) or {}
+            res = e.get("response", {}) or {}
+            if req.get("method") != "GET" or res.get("status") != 200:
+                continue
+            content = res.get("content") or {}
+            text = content.get("text")
+            if text is None:
+                continue
+            rtype = e.get("_resourceType") or _type_from_mime(content.get("mimeType"))
+            if rtype not in self.cache_types:
+                continue
+            if content.get("encoding") == "base64":
+                body = base64.b64decode(text)
+            else:
+                body = text.encode("utf-8")
+            headers = _clean_headers({h["name"]: h["value"] for h in res.get("headers") or []
+                                      if "name" in h and not h["name"].startswith(":")})
+            self._store(req.get("url") or "", (200, headers, body))
+            added += 1
+        return added
+
+    def stats(self) -> dict:
+        return {
+            "route_requests": self.requests,
+            "route_blocked": self.blocked,
+            "cache_hits": self.cache_hits,
+            "bytes_saved": self.bytes_saved,
+        }
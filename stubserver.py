@@ -0,0 +1,433 @@
+#!/usr/bin/env python3
+# stubserver.py
+# Локальная заглушка чат-бэкенда для проверки браузерных и безбраузерных движков.
+# Usage:
+#   python stubserver.py --port 8765
+#   python stubserver.py --port 8765 --write-har sample_widget.har   # HAR одной сессии для protochat.py
+"""
+Повторяет форму API виджета: HTTP start-chat / negotiate / send-message и
+SignalR-хаб с JSON-кадрами, разделёнными \\x1e. Состояние — в памяти процесса.
+
+Клиентская сторона (виджет):
+    POST /api/widget/{widgetId}/chats            {"userId"}          -> {"chatId", "visitorToken"}
+    POST /hubs/widget/negotiate?negotiateVersion=1                   -> {"connectionToken", ...}
+    POST /api/widget/chats/{chatId}/messages     {"text"}            -> {"messageId"}
+    WS   /hubs/widget?id={connectionToken}
+         -> JoinChat(chatId), SendMessage(chatId, text); в ответ Completion
+            и ReceiveMessage({chatId, text}) всем подписчикам чата.
+
+Сторона агента (имена списков и хаба — как в HAR, который разбирает HARanalys.py):
+    POST /api/auth/login                          {"username","password"} -> {"accessToken"}
+    GET  /api/agent/chats/unassigned                                  -> {"items": [{"id","status",...}]}
+    GET  /api/agent/chats/ongoing                                     -> {"items": [...]} (мои открытые)
+    POST /api/agent/chats/{chatId}/assign                             -> 200 | 409 уже взят
+    POST /api/agent/chats/{chatId}/messages       {"text"}            -> {"messageId"}
+    POST /api/agent/chats/{chatId}/close          {"resolved","reason"} -> 200
+    POST /hubs/agent-events-hub/negotiate?negotiateVersion=1          -> {"connectionToken", ...}
+    WS   /hubs/agent-events-hub?id={connectionToken}
+         <- SendEvent({type: ChatCreated|ChatAssigned|MessageCreated|ChatClosed, chatId, ...})
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs
+
+import h11
+from wsproto import ConnectionType, WSConnection
+from wsproto.events import CloseConnection, Ping, Request, TextMessage, AcceptConnection, RejectConnection
+
+REC_SEP = "\x1e"  # SignalR record separator
+WIDGET_ID = "30a8e3fa-8ed6-4b6a-a547-5445037e5414"
+
+class StubState:
+    def __init__(self):
+        self.chats = {}          # chatId -> {"userId", "messages": [...]}
+        self.connections = {}    # connectionToken -> set(chatId) (подписки)
+        self.subscribers = {}    # chatId -> set(_HubPeer)
+        self.agent_tokens = {}      # connectionToken агентского хаба -> агент
+        self.agent_peers = set()    # подключённые к agent-events-hub
+        self.sessions = {}          # accessToken -> username
+        self.requests = 0
+
+    def new_chat(self, user_id: str) -> str:
+        chat_id = str(uuid.uuid4())
+        self.chats[chat_id] = {"userId": user_id, "messages": [], "status": "unassigned",
+                               "assignee": None, "createdAt": time.time()}
+        self.agent_event("ChatCreated", chat_id, userId=user_id)
+        return chat_id
+
+    def add_message(self, chat_id: str, text: str, author: str = "customer") -> dict:
+        msg = {"id": str(uuid.uuid4()), "chatId": chat_id, "text": text, "author": author}
+        self.chats[chat_id]["messages"].append(msg)
+        for peer in list(self.subscribers.get(chat_id, ())):
+            peer.push({"type": 1, "target": "ReceiveMessage", "arguments": [msg]})
+        assignee = self.chats[chat_id]["assignee"]
+        if assignee:
+            self.agent_event("MessageCreated", chat_id, to=assignee,
+                             messageId=msg["id"], text=text, author=author)
+        return msg
+
+    def agent_event(self, kind: str, chat_id: str, to: str = None, **payload) -> None:
+        """Событие агентам (to — только этому) в обёртке SendEvent, как в записанных HAR."""
+        if not self.agent_peers:
+            return
+        event = {"type": 1, "target": "SendEvent",
+                 "arguments": [{"type": kind, "chatId": chat_id, **payload}]}
+        for peer in list(self.agent_peers):
+            if to is None or peer.agent == to:
+                peer.push(event)
+
+    def chat_item(self, chat_id: str) -> dict:
+        chat = self.chats[chat_id]
+        return {"id": chat_id, "status": chat["status"], "userId": chat["userId"],
+                "assignee": chat["assignee"], "createdAt": chat["createdAt"],
+                "messages": len(chat["messages"])}
+
+# ==================== HTTP ====================
+
+def _json_response(status: int, payload) -> tuple:
+    return status, json.dumps(payload).encode("utf-8")
+
+def route_http(state: StubState, method: str, path: str, query: dict, body: bytes,
+               headers: dict = None) -> tuple:
+    state.requests += 1
+    try:
+        data = json.loads(body) if body else {}
+    except ValueError:
+        return _json_response(400, {"error": "bad json"})
+    parts = [p for p in path.split("/") if p]
+    headers = headers or {}
+
+    if method == "POST" and parts[:2] == ["hubs", "agent-events-hub"] and parts[-1] == "negotiate":
+        auth = headers.get("authorization", "")
+        token = str(uuid.uuid4())
+        state.agent_tokens[token] = state.sessions.get(auth[7:] if auth.lower().startswith("bearer ") else "")
+        return _json_response(200, {
+            "negotiateVersion": 1,
+            "connectionId": str(uuid.uuid4()),
+            "connectionToken": token,
+            "availableTransports": [{"transport": "WebSockets", "transferFormats": ["Text", "Binary"]}],
+        })
+
+    if method == "POST" and parts[:2] == ["hubs", "widget"] and parts[-1] == "negotiate":
+        token = str(uuid.uuid4())
+        state.connections[token] = set()
+        return _json_response(200, {
+            "negotiateVersion": 1,
+            "connectionId": str(uuid.uuid4()),
+            "connectionToken": token,
+            "availableTransports": [{"transport": "WebSockets", "transferFormats": ["Text", "Binary"]}],
+        })
+
+    if method == "POST" and len(parts) == 4 and parts[:2] == ["api", "widget"] and parts[3] == "chats":
+        user_id = str(data.get("userId") or "")
+        if not user_id:
+            return _json_response(400, {"error": "userId required"})
+        chat_id = state.new_chat(user_id)
+        return _json_response(200, {"chatId": chat_id, "visitorToken": str(uuid.uuid4())})
+
+    if method == "POST" and len(parts) == 5 and parts[:3] == ["api", "widget", "chats"] and parts[4] == "messages":
+        chat_id = parts[3]
+        if chat_id not in state.chats:
+            return _json_response(404, {"error": "chat not found"})
+        msg = state.add_message(chat_id, str(data.get("text") or ""))
+        return _json_response(200, {"messageId": msg["id"]})
+
+    if parts[:1] == ["api"] and parts[1:2] in (["auth"], ["agent"]):
+        return route_agent(state, method, parts, headers, data)
+
+    return _json_response(404, {"error": "not found"})
+
+def route_agent(state: StubState, method: str, parts: list, headers: dict, data: dict) -> tuple:
+    if method == "POST" and parts == ["api", "auth", "login"]:
+        user = str(data.get("username") or "")
+        if not user or not data.get("password"):
+            return _json_response(401, {"error": "bad credentials"})
+        token = str(uuid.uuid4())
+        state.sessions[token] = user
+        return _json_response(200, {"accessToken": token})
+
+    auth = headers.get("authorization", "")
+    agent = state.sessions.get(auth[7:] if auth.lower().startswith("bearer ") else "")
+    if agent is None:
+        return _json_response(401, {"error": "unauthorized"})
+
+    if method == "GET" and parts[2:] in (["chats", "unassigned"], ["chats", "ongoing"]):
+        if parts[3] == "unassigned":
+            ids = [cid for cid, c in state.chats.items() if c["status"] == "unassigned"]
+        else:
+            ids = [cid for cid, c in state.chats.items()
+                   if c["status"] == "assigned" and c["assignee"] == agent]
+        return _json_response(200, {"items": [state.chat_item(cid) for cid in ids]})
+
+    if method == "POST" and len(parts) == 5 and parts[2] == "chats":
+        chat_id, action = parts[3], parts[4]
+        chat = state.chats.get(chat_id)
+        if chat is None:
+            return _json_response(404, {"error": "chat not found"})
+        if action == "assign":
+            if chat["status"] != "unassigned":
+                return _json_response(409, {"error": "already assigned", "assignee": chat["assignee"]})
+            chat["status"], chat["assignee"] = "assigned", agent
+            state.agent_event("ChatAssigned", chat_id, agent=agent)
+            return _json_response(200, state.chat_item(chat_id))
+        if chat["assignee"] != agent or chat["status"] != "assigned":
+            return _json_response(409, {"error": "not your chat"})
+        if action == "messages":
+            msg = state.add_message(chat_id, str(data.get("text") or ""), author=agent)
+            return _json_response(200, {"messageId": msg["id"]})
+        if action == "close":
+            chat["status"] = "closed"
+            chat["resolved"] = bool(data.get("resolved", True))
+            state.agent_event("ChatClosed", chat_id, agent=agent)
+            return _json_response(200, state.chat_item(chat_id))
+
+    return _json_response(404, {"error": "not found"})
+
+async def serve_http(state: StubState, head: bytes, reader, writer) -> None:
+    conn = h11.Connection(our_role=h11.SERVER)
+    conn.receive_data(head)
+    request, chunks = None, []
+    while True:
+        event = conn.next_event()
+        if event is h11.NEED_DATA:
+            data = await reader.read(65536)
+            conn.receive_data(data)
+            continue
+        if isinstance(event, h11.ConnectionClosed) or event is h11.PAUSED:
+            break
+        if isinstance(event, h11.Request):
+            request, chunks = event, []
+        elif isinstance(event, h11.Data):
+            chunks.append(bytes(event.data))
+        elif isinstance(event, h11.EndOfMessage):
+            url = urlsplit(request.target.decode("latin-1"))
+            status, payload = route_http(state, request.method.decode(), url.path,
+                                         parse_qs(url.query), b"".join(chunks),
+                                         {k.decode("latin-1").lower(): v.decode("latin-1")
+                                          for k, v in request.headers})
+            writer.write(conn.send(h11.Response(status_code=status, headers=[
+                ("Content-Type", "application/json"),
+                ("Content-Length", str(len(payload))),
+            ])))
+            writer.write(conn.send(h11.Data(data=payload)))
+            writer.write(conn.send(h11.EndOfMessage()))
+            await writer.drain()
+            if conn.our_state is h11.MUST_CLOSE:
+                break
+            conn.start_next_cycle()
+    writer.close()
+
+# ==================== SignalR hub ====================
+
+class _HubPeer:
+    def __init__(self, ws: WSConnection, writer):
+        self.ws = ws
+        self.writer = writer
+        self.chats = set()
+        self.agent = None       # для agent-events-hub: чей это хаб
+
+    def push(self, message: dict) -> None:
+        if self.writer.is_closing():
+            return
+        try:
+            self.writer.write(self.ws.send(TextMessage(data=json.dumps(message) + REC_SEP)))
+        except Exception:
+            pass  # клиент уже отключился
+
+def handle_hub_message(state: StubState, peer: _HubPeer, msg: dict) -> None:
+    mtype = msg.get("type")
+    if mtype == 6:            # ping
+        return
+    if mtype != 1:
+        return
+    target = msg.get("target")
+    args = msg.get("arguments") or []
+    inv = msg.get("invocationId")
+    error = None
+    if target == "JoinChat" and args and args[0] in state.chats:
+        peer.chats.add(args[0])
+        state.subscribers.setdefault(args[0], set()).add(peer)
+    elif target == "SendMessage" and len(args) >= 2 and args[0] in state.chats:
+        state.add_message(args[0], str(args[1]))
+    else:
+        error = f"bad invocation {target}"
+    if inv is not None:
+        reply = {"type": 3, "invocationId": inv}
+        if error:
+            reply["error"] = error
+        peer.push(reply)
+
+async def serve_ws(state: StubState, head: bytes, reader, writer) -> None:
+    ws = WSConnection(ConnectionType.SERVER)
+    ws.receive_data(head)
+    peer = None
+    handshaken = agent_hub = False
+    try:
+        while True:
+            for event in ws.events():
+                if isinstance(event, Request):
+                    query = parse_qs(urlsplit(event.target).query)
+                    token = (query.get("id") or [""])[0]
+                    agent_hub = token in state.agent_tokens
+                    if token not in state.connections and not agent_hub:
+                        writer.write(ws.send(RejectConnection(status_code=404)))
+                        await writer.drain()
+                        return
+                    writer.write(ws.send(AcceptConnection()))
+                    peer = _HubPeer(ws, writer)
+                    peer.agent = state.agent_tokens.get(token)
+                elif isinstance(event, TextMessage) and peer is not None:
+                    for part in event.data.split(REC_SEP):
+                        if not part.strip():
+                            continue
+                        try:
+                            msg = json.loads(part)
+                        except ValueError:
+                            continue
+                        if not handshaken:
+                            # {"protocol":"json","version":1} -> {}
+                            handshaken = True
+                            peer.push({})
+                            if agent_hub:
+                                state.agent_peers.add(peer)   # события — только после handshake
+                            continue
+                        handle_hub_message(state, peer, msg)
+                elif isinstance(event, Ping):
+                    writer.write(ws.send(event.response()))
+                elif isinstance(event, CloseConnection):
+                    writer.write(ws.send(event.response()))
+                    await writer.drain()
+                    return
+            await writer.drain()
+            data = await reader.read(65536)
+            if not data:
+                return
+            ws.receive_data(data)
+    finally:
+        if peer is not None:
+            state.agent_peers.discard(peer)
+            for chat_id in peer.chats:
+                state.subscribers.get(chat_id, set()).discard(peer)
+        writer.close()
+
+# ==================== сервер ====================
+
+async def handle_connection(state: StubState, reader, writer) -> None:
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        writer.close()
+        return
+    try:
+        if b"upgrade: websocket" in head.lower():
+            await serve_ws(state, head, reader, writer)
+        else:
+            await serve_http(state, head, reader, writer)
+    except (ConnectionError, h11.RemoteProtocolError):
+        writer.close()
+
+async def start_server(host: str = "127.0.0.1", port: int = 8765, state: StubState = None):
+    """Запустить заглушку в текущем event loop (удобно для проверок из кода)."""
+    state = state or StubState()
+    server = await asyncio.start_server(
+        lambda r, w: handle_connection(state, r, w), host, port, backlog=4096
+    )
+    return server, state
+
+# ==================== пример HAR ====================
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat().replace("+00:00", "Z")
+
+def sample_har(base_url: str) -> dict:
+    """
+    Синтетический HAR одной клиентской сессии к этой заглушке — в том же
+    формате, что сохраняет DevTools (_resourceType, _webSocketMessages).
+    """
+    ws_base = base_url.replace("http", "ws", 1)
+    chat_id = str(uuid.uuid4())
+    token = str(uuid.uuid4())
+    user = "Test 1-aB3dE9"
+    t = time.time()
+
+    def http_entry(at, method, url, req_body, resp_body):
+        return {
+            "startedDateTime": _iso(at),
+            "_resourceType": "fetch",
+            "request": {
+                "method": method, "url": url,
+                "headers": [{"name": "Content-Type", "value": "application/json"},
+                            {"name": "Accept", "value": "application/json"}],
+                "postData": {"mimeType": "application/json", "text": json.dumps(req_body)},
+            },
+            "response": {
+                "status": 200,
+                "headers": [{"name": "Content-Type", "value": "application/json"}],
+                "content": {"mimeType": "application/json", "text": json.dumps(resp_body)},
+            },
+        }
+
+    frames = [
+        ("send", t + 0.30, json.dumps({"protocol": "json", "version": 1}) + REC_SEP),
+        ("receive", t + 0.31, "{}" + REC_SEP),
+        ("send", t + 0.32, json.dumps({"type": 1, "invocationId": "0", "target": "JoinChat",
+                                       "arguments": [chat_id]}) + REC_SEP),
+        ("receive", t + 0.33, json.dumps({"type": 3, "invocationId": "0"}) + REC_SEP),
+        ("send", t + 0.50, json.dumps({"type": 1, "invocationId": "1", "target": "SendMessage",
+                                       "arguments": [chat_id, "Test message #1.1"]}) + REC_SEP),
+        ("receive", t + 0.52, json.dumps({"type": 1, "target": "ReceiveMessage", "arguments": [
+            {"chatId": chat_id, "text": "Test message #1.1", "author": "customer"}]}) + REC_SEP),
+        ("send", t + 0.80, json.dumps({"type": 6}) + REC_SEP),
+        ("send", t + 0.90, json.dumps({"type": 1, "invocationId": "2", "target": "SendMessage",
+                                       "arguments": [chat_id, "Test message #1.2"]}) + REC_SEP),
+    ]
+    entries = [
+        http_entry(t, "POST", f"{base_url}/api/widget/{WIDGET_ID}/chats",
+                   {"userId": user}, {"chatId": chat_id, "visitorToken": str(uuid.uuid4())}),
+        http_entry(t + 0.1, "POST", f"{base_url}/hubs/widget/negotiate?negotiateVersion=1", {},
+                   {"negotiateVersion": 1, "connectionId": str(uuid.uuid4()), "connectionToken": token,
+                    "availableTransports": [{"transport": "WebSockets", "transferFormats": ["Text"]}]}),
+        {
+            "startedDateTime": _iso(t + 0.2),
+            "_resourceType": "websocket",
+            "request": {"method": "GET", "url": f"{ws_base}/hubs/widget?id={token}", "headers": []},
+            "response": {"status": 101, "headers": [], "content": {}},
+            "_webSocketMessages": [
+                {"type": kind, "time": at, "opcode": 1, "data": data} for kind, at, data in frames
+            ],
+        },
+    ]
+    return {"log": {"version": "1.2", "creator": {"name": "stubserver.py"}, "entries": entries}}
+
+def main():
+    ap = argparse.ArgumentParser(description="Локальная заглушка чат-бэкенда (HTTP + SignalR)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--write-har", type=Path, default=None,
+                    help="записать пример HAR одной сессии и выйти")
+    args = ap.parse_args()
+
+    base_url = f"http://{args.host}:{args.port}"
+    if args.write_har:
+        args.write_har.write_text(json.dumps(sample_har(base_url), indent=1), encoding="utf-8")
+        print(f"Saved: {args.write_har}")
+        return
+
+    async def serve():
+        server, _ = await start_server(args.host, args.port)
+        print(f"Stub backend on {base_url}")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Think time — пауза «пользователя» как явное распределение, а не зашитый sleep.
+
+Спецификация строкой (секунды):
+    "0" / "zero"                 — без пауз (режим пропускной способности)
+    "fixed:0.3"                  — всегда 0.3 с
+    "uniform:0.1:0.5"            — равномерно от 0.1 до 0.5 с
+    "lognormal:2:0.5"            — логнормально: медиана 2 с, sigma 0.5
+
+    think = ThinkTime.parse("uniform:1:3")
+    time.sleep(think.sample())
+"""
+import math
+import random
+
+KINDS = ("zero", "fixed", "uniform", "lognormal")
+
+class ThinkTime:
+    __slots__ = ("kind", "a", "b", "spec")
+
+    def __init__(self, kind: str = "zero", a: float = 0.0, b: float = 0.0, spec: str = "0"):
+        self.kind = kind
+        self.a = a
+        self.b = b
+        self.spec = spec
+
+    @classmethod
+    def parse(cls, spec: str) -> "ThinkTime":
+        spec = (spec or "0").strip()
+        parts = spec.split(":")
+        kind = parts[0].lower()
+        try:
+            nums = [float(p) for p in parts[1:]]
+        except ValueError:
+            raise ValueError(f"Think time {spec!r}: ожидаются числа после ':'")
+        if kind in ("0", "zero", "none") and not nums:
+            return cls("zero", spec=spec)
+        if kind == "fixed" and len(nums) == 1 and nums[0] >= 0:
+            return cls("fixed", nums[0], spec=spec)
+        if kind == "uniform" and len(nums) == 2 and 0 <= nums[0] <= nums[1]:
+            return cls("uniform", nums[0], nums[1], spec=spec)
+        if kind == "lognormal" and len(nums) == 2 and nums[0] > 0 and nums[1] >= 0:
+            return cls("lognormal", math.log(nums[0]), nums[1], spec=spec)
+        raise ValueError(f"Think time {spec!r}: ожидается один из {KINDS}, напр. 'uniform:0.1:0.5'")
+
+    @property
+    def is_zero(self) -> bool:
+        return self.kind == "zero" or (self.kind == "fixed" and self.a == 0)
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.a
+        if self.kind == "uniform":
+            return random.uniform(self.a, self.b)
+        if self.kind == "lognormal":
+            return random.lognormvariate(self.a, self.b)
+        return 0.0
+
+    def __repr__(self) -> str:
+        return f"ThinkTime({self.spec!r})"